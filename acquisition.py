@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+from power_supply import Commands, EthernetProtocol, PowerSupply
+from scpi_simulator import ScpiSimulator
+
+log = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    voltage: float
+    current: float
+    power: float
+    mode: str
+
+
+class SampleRing:
+    """Fixed-size ring buffer of samples with a single writer and lock-free readers.
+
+    The writer stores a sample into its slot before publishing it by
+    incrementing the count, so a reader that sees the new count always sees
+    a complete sample. Each slot holds an immutable Sample, and replacing a
+    list item is atomic under the GIL.
+    """
+
+    _samples: list
+    _count: int
+
+    def __init__(self, size: int = 1024) -> None:
+        self.size = size
+        self._samples = [None] * size
+        self._count = 0
+
+    def __len__(self) -> int:
+        return min(self._count, self.size)
+
+    @property
+    def count(self) -> int:
+        """Total number of samples ever appended"""
+        return self._count
+
+    def append(self, sample: Sample) -> None:
+        self._samples[self._count % self.size] = sample
+        self._count += 1
+
+    def latest(self) -> Sample:
+        """Returns the newest sample, or None if nothing was acquired yet"""
+        count = self._count
+        if count == 0:
+            return None
+        return self._samples[(count - 1) % self.size]
+
+    def since(self, count: int, end: int = None) -> list:
+        """Returns the samples appended after the given total count, oldest first.
+
+        end stops at an earlier read of count instead of the current one, so
+        a reader that keeps its own position can read count once and use it
+        for both. Samples that were already overwritten are skipped.
+        """
+        current = self._count
+        if end is None:
+            end = current
+        start = max(count, current - self.size + 1)
+        return [self._samples[index % self.size] for index in range(start, end)]
+
+
+class AcquisitionWorker(threading.Thread):
+    """Measures voltage, current and output mode on its own thread.
+
+    Samples go into a SampleRing at the acquisition interval, independently
+    of how often (or whether) the GUI reads them, so a stalled link only
+    delays new samples instead of freezing the caller. The power supply can
+    be swapped at any time by assigning power_supply. If recorder is set
+    (e.g. a TelemetryRecorder), every sample is also appended to it.
+
+    A failed measurement does not stop the worker. It is counted in errors,
+    kept in last_error and logged once per run of identical failures. The
+    end of the run is logged as well.
+    """
+
+    def __init__(self, power_supply: PowerSupply, interval: float = 0.05, ring_size: int = 1024,
+                 recorder=None) -> None:
+        super().__init__(name="psu-acquisition", daemon=True)
+        self.power_supply = power_supply
+        self.recorder = recorder
+        self.interval = interval
+        self.samples = SampleRing(ring_size)
+        self.errors = 0
+        self.last_error = None
+        # errors at the start of the current run of failures, or None
+        self._failing_since = None
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        next_deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                sample = self._measure(self.power_supply)
+                self.samples.append(sample)
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.append(sample)
+            except Exception as error:
+                self._report_error(error)
+            else:
+                self._report_recovery()
+            next_deadline += self.interval
+            delay = next_deadline - time.monotonic()
+            if delay < 0:
+                # Fell behind (e.g. a slow reply), so start counting from now
+                # instead of firing a burst of late measurements.
+                next_deadline = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def _report_error(self, error: Exception) -> None:
+        self.errors += 1
+        if self._failing_since is None or repr(error) != repr(self.last_error):
+            log.warning("acquisition failed: %r", error, exc_info=error)
+        if self._failing_since is None:
+            self._failing_since = self.errors
+        self.last_error = error
+
+    def _report_recovery(self) -> None:
+        if self._failing_since is not None:
+            log.info("acquisition recovered after %d failed measurements",
+                     self.errors - self._failing_since + 1)
+            self._failing_since = None
+
+    @staticmethod
+    def _measure(power_supply: PowerSupply) -> Sample:
+        """Queries one sample, raising ValueError when a reading did not decode.
+
+        The run loop counts and logs that like any other failed measurement,
+        so a bad reply leaves a gap in the samples rather than a made-up value.
+        """
+        voltage, current, mode = power_supply.query_all(
+            [Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]
+        )
+        if voltage is None or current is None:
+            raise ValueError(f"no reading in the reply: voltage {voltage}, current {current}")
+        if mode is None:
+            mode = "Unknown"
+        return Sample(time.time(), voltage, current, voltage * current, mode)
+
+
+def example_acquisition():
+    """Acquires from the simulator for half a second and prints the newest sample"""
+    simulator = ScpiSimulator()
+    port = simulator.start_in_thread()
+    protocol = EthernetProtocol("127.0.0.1", port)
+    try:
+        worker = AcquisitionWorker(PowerSupply(protocol=protocol), interval=0.1)
+        worker.start()
+        time.sleep(0.5)
+        worker.stop()
+        print(f"{worker.samples.count} samples, {worker.errors} failed, latest: {worker.samples.latest()}")
+    finally:
+        protocol.close()
+        simulator.stop_thread()
+
+
+def main():
+    example_acquisition()
+
+
+if __name__ == "__main__":
+    main()
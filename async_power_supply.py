@@ -0,0 +1,256 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from power_supply import (CmdType, CommandEncoder, Commands, ScpiCommand,
+                          _split_compound_reply)
+
+
+class AsyncProtocol(object):
+
+    def __init__(self) -> None:
+        pass
+
+    async def connect(self) -> None:
+        pass
+
+    async def write(self, msg: bytes = b"") -> None:
+        pass
+
+    async def read(self) -> str:
+        return ""
+
+    async def discard_input(self) -> None:
+        """Drops replies still on their way, e.g. the late reply to a query that timed out"""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class AsyncEthernetProtocol(AsyncProtocol):
+
+    _reader: asyncio.StreamReader
+    _writer: asyncio.StreamWriter
+
+    # According to the reference manual, the standard port is 5025
+    def __init__(self, ip: str = "192.168.0.2", port: int = 5025, timeout: float = 2.0) -> None:
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ip, self.port), self.timeout
+        )
+
+    async def write(self, msg: bytes = b"") -> None:
+        if self._writer is None:
+            await self.connect()
+        self._writer.write(msg)
+        await self._writer.drain()
+
+    async def read(self) -> str:
+        if self._reader is None:
+            await self.connect()
+        response = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        return response.decode(errors="replace")
+
+    async def discard_input(self) -> None:
+        # A late reply can only arrive on the old connection, so start a new one
+        await self.close()
+
+    async def close(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._reader = None
+        self._writer = None
+
+
+class AsyncUsbProtocol(AsyncProtocol):
+    """Runs the blocking pyserial calls on a single worker thread.
+
+    A single thread keeps writes and reads in the order they were
+    submitted, which the pipelining in AsyncPowerSupply relies on.
+    """
+
+    # TODO - Verify that ports and baudrate are accurate
+    def __init__(self, port: str = "COM8", baudrate: int = 115200, timeout: float = 2.0) -> None:
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def connect(self) -> None:
+        self.conn = await self._run(
+            lambda: serial.Serial(port=self.port, baudrate=self.baudrate, timeout=self.timeout)
+        )
+
+    async def write(self, msg: bytes = b"") -> None:
+        if self.conn is None:
+            await self.connect()
+        await self._run(self.conn.write, msg)
+
+    async def read(self) -> str:
+        if self.conn is None:
+            await self.connect()
+        response = await self._run(self.conn.readline)
+        if not response.endswith(b"\n"):
+            # readline gives up at the serial timeout with whatever it has
+            raise TimeoutError(f"no reply from {self.port} within {self.timeout} s")
+        return response.decode(errors="replace")
+
+    async def discard_input(self) -> None:
+        if self.conn is not None:
+            await self._run(self._drain)
+
+    def _drain(self, quiet_time: float = 0.1) -> None:
+        """Reads and drops input until the line has been quiet for quiet_time"""
+        self.conn.timeout = quiet_time
+        try:
+            deadline = time.monotonic() + max(self.timeout, quiet_time) * 2
+            while self.conn.read(4096) and time.monotonic() < deadline:
+                pass
+        finally:
+            self.conn.timeout = self.timeout
+        self.conn.reset_input_buffer()
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+        self._executor.shutdown(wait=False)
+
+
+class AsyncDebugProtocol(AsyncProtocol):
+
+    def __init__(self) -> None:
+        pass
+
+    async def write(self, msg: bytes = b"") -> None:
+        print(msg.decode(errors="replace"))
+
+    async def read(self) -> str:
+        return "READ DEBUG\n"
+
+
+class AsyncPowerSupply:
+    """Asyncio counterpart of PowerSupply that pipelines queries.
+
+    Queries are written as soon as they are made, without waiting for the
+    replies of earlier queries. Replies are matched to queries in the order
+    the queries were sent, which is the order SCPI instruments answer in.
+    A failed read (e.g. a timeout) fails every pending query, and the
+    protocol's input is discarded before the next message so that a late
+    reply is never matched to a later query.
+    """
+
+    _pending: deque
+
+    def __init__(self, protocol: AsyncProtocol, max_in_flight: int = 16) -> None:
+        self.protocol = protocol
+        self._pending = deque()
+        self._encoder = CommandEncoder()
+        self._reader = None
+        self._resync = False
+        self._send_lock = asyncio.Lock()
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def make_command(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "") -> str:
+        # Copied out of the encoder's buffer since the write is awaited
+        message = bytes(self._encoder.encode(scpi_command, arg_0, arg_1))
+        return await self._send(message, scpi_command.type == CmdType.GET)
+
+    async def make_commands(self, commands: list) -> list:
+        """Sends several commands as one compound message, see PowerSupply.make_commands"""
+        if not commands:
+            return []
+        entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+        message = bytes(self._encoder.encode_compound(entries))
+        queries = [entry[0].type == CmdType.GET for entry in entries]
+        reply = await self._send(message, any(queries))
+        if not any(queries):
+            return ["" for _ in entries]
+        replies = _split_compound_reply(reply, queries.count(True))
+        return [replies.pop(0) if is_query else "" for is_query in queries]
+
+    async def close(self) -> None:
+        await self.protocol.close()
+
+    async def _send(self, message: bytes, expects_reply: bool) -> str:
+        if not expects_reply:
+            async with self._send_lock:
+                await self._resynchronize()
+                await self.protocol.write(message)
+            return ""
+        async with self._in_flight:
+            future = asyncio.get_running_loop().create_future()
+            async with self._send_lock:
+                # Queue the future before writing so that a reply can never
+                # arrive ahead of the future it belongs to.
+                await self._resynchronize()
+                self._pending.append(future)
+                try:
+                    await self.protocol.write(message)
+                except Exception:
+                    self._pending.remove(future)
+                    raise
+                if self._reader is None:
+                    self._reader = asyncio.ensure_future(self._read_replies())
+            return await future
+
+    async def _read_replies(self) -> None:
+        while self._pending:
+            try:
+                reply = await self.protocol.read()
+            except Exception as error:
+                # Replies to the failed queries may still arrive
+                self._resync = True
+                while self._pending:
+                    future = self._pending.popleft()
+                    if not future.done():
+                        future.set_exception(error)
+                break
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_result(reply)
+        self._reader = None
+
+    async def _resynchronize(self) -> None:
+        # Only called with _send_lock held, and once the reader has failed
+        # every query that was in flight
+        if self._resync and not self._pending:
+            await self.protocol.discard_input()
+            self._resync = False
+
+
+async def example_pipelined_usage():
+    """Reads the voltage of several supplies concurrently from one event loop"""
+    power_supplies = [AsyncPowerSupply(protocol=AsyncDebugProtocol()) for _ in range(3)]
+    readings = await asyncio.gather(
+        *[power_supply.make_command(Commands.GET_VOLTS) for power_supply in power_supplies]
+    )
+    print(readings)
+    await asyncio.gather(*[power_supply.close() for power_supply in power_supplies])
+
+
+def main():
+    asyncio.run(example_pipelined_usage())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Benchmarks the PowerSupply command path over each transport.
+
+Run
+`python3 benchmark.py --output results.json`
+to measure commands per second and latency percentiles for
+PowerSupply.make_command over DebugProtocol, EthernetProtocol against the
+loopback simulator, and UsbProtocol against a pty-backed fake serial port,
+plus the cost of one GUI _update_actual tick. Compare two runs with
+`python3 benchmark.py --compare old.json --output new.json`.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+from acquisition import Sample
+from metrics import LatencyHistogram
+from power_supply import Commands, DebugProtocol, EthernetProtocol, PowerSupply, UsbProtocol
+from scpi_simulator import ScpiSimulator, SimulatedInstrument, split_message
+
+WARMUP_ITERATIONS = 200
+
+CASES = {
+    "get_volts": lambda power_supply: power_supply.make_command(Commands.GET_VOLTS),
+    "set_volts": lambda power_supply: power_supply.make_command(Commands.SET_VOLTS, 12.5),
+    "telemetry_batch": lambda power_supply: power_supply.make_commands(
+        [Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]
+    ),
+}
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def measure(func, iterations: int) -> dict:
+    """Calls func iterations times after a warmup and returns throughput and latency percentiles"""
+    for _ in range(min(WARMUP_ITERATIONS, iterations)):
+        func()
+    histogram = LatencyHistogram()
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(iterations):
+        before = clock()
+        func()
+        histogram.record(clock() - before)
+    elapsed = clock() - start
+    return {
+        "iterations": iterations,
+        "seconds": elapsed,
+        "ops_per_sec": iterations / elapsed if elapsed else 0.0,
+        "mean": histogram.mean,
+        "p50": histogram.percentile(0.50),
+        "p95": histogram.percentile(0.95),
+        "p99": histogram.percentile(0.99),
+        "max": histogram.max,
+    }
+
+
+def bench_debug(iterations: int) -> dict:
+    # DebugProtocol prints every command, which would measure the terminal
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            power_supply = PowerSupply(protocol=DebugProtocol())
+            return {name: measure(lambda: case(power_supply), iterations) for name, case in CASES.items()}
+        finally:
+            sys.stdout = stdout
+
+
+def bench_ethernet(iterations: int) -> dict:
+    simulator = ScpiSimulator()
+    port = simulator.start_in_thread()
+    try:
+        power_supply = PowerSupply(protocol=EthernetProtocol("127.0.0.1", port))
+        return {name: measure(lambda: case(power_supply), iterations) for name, case in CASES.items()}
+    finally:
+        simulator.stop_thread()
+
+
+def bench_usb(iterations: int) -> dict:
+    if not hasattr(os, "openpty"):
+        raise SkipBenchmark("needs a pty (POSIX only)")
+    import termios
+    import tty
+    controller, device = os.openpty()
+    tty.setraw(device, termios.TCSANOW)
+    stop_event = threading.Event()
+    responder = threading.Thread(target=_serve_pty, args=(controller, stop_event), daemon=True)
+    responder.start()
+    try:
+        power_supply = PowerSupply(protocol=UsbProtocol(port=os.ttyname(device)))
+        return {name: measure(lambda: case(power_supply), iterations) for name, case in CASES.items()}
+    finally:
+        stop_event.set()
+        os.close(device)
+        responder.join(1.0)
+        os.close(controller)
+
+
+def _serve_pty(controller: int, stop_event: threading.Event) -> None:
+    """Answers SCPI lines written to the fake serial port like the instrument would"""
+    instrument = SimulatedInstrument()
+    pending = b""
+    while not stop_event.is_set():
+        try:
+            pending += os.read(controller, 4096)
+        except OSError:
+            return
+        while b"\n" in pending:
+            line, pending = pending.split(b"\n", 1)
+            replies = [
+                reply for reply in (
+                    instrument.execute(header, args) for header, args in split_message(line.decode())
+                ) if reply is not None
+            ]
+            if replies:
+                os.write(controller, (";".join(replies) + "\n").encode("latin-1"))
+
+
+def bench_gui_tick(iterations: int) -> dict:
+    try:
+        import tkinter
+        from graphic_display import Application
+        app = Application()
+    except (ImportError, tkinter.TclError) as error:
+        raise SkipBenchmark(f"GUI unavailable: {error}")
+    try:
+        # The ring has a single writer, so the ticks below take over from
+        # the acquisition thread
+        app._acquisition.stop()
+        # Every tick gets a new sample, so the labels and the chart have
+        # something to redraw, and the renderer is flushed inside the
+        # timed call instead of on the next frame
+        samples = [Sample(float(index), 12.0 + index % 7, 2.0, 24.0 + index % 7 * 2, "CV") for index in range(16)]
+        ticks = itertools.cycle(samples)
+
+        def tick() -> None:
+            app._acquisition.samples.append(next(ticks))
+            app._update_actual()
+            app._renderer.flush()
+
+        with open(os.devnull, "w") as devnull:
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                return {"update_actual": measure(tick, iterations)}
+            finally:
+                sys.stdout = stdout
+    finally:
+        # Also stops the acquisition thread and the command queue's worker
+        app._close()
+
+
+BENCHMARKS = {
+    "debug": bench_debug,
+    "ethernet_loopback": bench_ethernet,
+    "usb_pty": bench_usb,
+    "gui": bench_gui_tick,
+}
+
+
+def run(iterations: int, selected: list) -> dict:
+    results = {
+        "metadata": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "timestamp": time.time(),
+        },
+        "benchmarks": {},
+        "skipped": {},
+    }
+    for name in selected:
+        try:
+            results["benchmarks"][name] = BENCHMARKS[name](iterations)
+        except SkipBenchmark as reason:
+            results["skipped"][name] = str(reason)
+    return results
+
+
+def compare(baseline: dict, current: dict) -> list:
+    """Returns (benchmark, case, baseline ops/s, current ops/s, ratio) rows present in both runs"""
+    rows = []
+    for name, cases in current["benchmarks"].items():
+        for case, result in cases.items():
+            old = baseline.get("benchmarks", {}).get(name, {}).get(case)
+            if old and old["ops_per_sec"]:
+                rows.append((name, case, old["ops_per_sec"], result["ops_per_sec"],
+                             result["ops_per_sec"] / old["ops_per_sec"]))
+    return rows
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PowerSupply command path")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS),
+                        help="run only this benchmark (repeatable)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.only or list(BENCHMARKS))
+    for name, cases in results["benchmarks"].items():
+        for case, result in cases.items():
+            print(
+                f"{name:18} {case:16} {result['ops_per_sec']:10.0f} ops/s  "
+                f"p50 {result['p50'] * 1e6:8.1f} us  p99 {result['p99'] * 1e6:8.1f} us"
+            )
+    for name, reason in results["skipped"].items():
+        print(f"{name:18} skipped: {reason}")
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        for name, case, old, new, ratio in compare(baseline, results):
+            print(f"{name:18} {case:16} {old:10.0f} -> {new:10.0f} ops/s ({ratio:.2f}x)")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
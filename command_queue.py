@@ -0,0 +1,390 @@
+"""Serializes a PowerSupply's traffic through one I/O thread with prioritized commands.
+
+CommandQueue owns the connection of one PowerSupply. Callers on any
+thread submit commands and get a concurrent.futures.Future back; a single
+worker thread runs them one at a time, highest priority first and in
+submission order within a priority. Safety commands (output off, RESET,
+ABORT and enabling OCP) therefore go out right after the exchange in
+progress, however much telemetry is queued.
+
+Since a safety command overtakes control writes queued before it, it
+cancels the ones that would undo it once they ran: RESET cancels every
+queued control write, output off the queued output changes, ABORT the
+queued INITIATE and TRIGGER, and enabling OCP the queued OCP changes.
+Their futures end up cancelled.
+
+The queue holds at most max_depth non-safety commands. Submitting more
+blocks the caller until there is room (or raises QueueFullError), which
+keeps a fast poller from piling up work the link cannot keep up with.
+How long each command waited is recorded in wait_metrics, per command
+and priority, which prometheus_text exports as psu_queue_wait.
+
+CommandQueue also offers the blocking make_command, make_commands, query
+and query_all calls of PowerSupply, so it can stand in for one, e.g.
+behind a CoalescingPowerSupply or in an AcquisitionWorker.
+WriteBehindPowerSupply offers the same calls but returns from writes as
+soon as they are queued, for callers such as a GUI thread that must not
+wait on the link.
+"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from metrics import MetricsRegistry
+from power_supply import CmdType, Commands, DebugProtocol, GetCmd, PowerSupply, ScpiCommand
+
+log = logging.getLogger(__name__)
+
+# Lower runs first
+SAFETY = 0
+CONTROL = 1
+TELEMETRY = 2
+PRIORITY_NAMES = ("safety", "control", "telemetry")
+QUEUE_WAIT_METRIC = "psu_queue_wait"
+
+SAFETY_COMMANDS = frozenset((
+    Commands.RESET,
+    Commands.ABORT,
+))
+# The queued control writes each safety command cancels. RESET cancels
+# all of them.
+SUPERSEDES = {
+    Commands.SET_CHANNEL_STATE: frozenset((Commands.SET_CHANNEL_STATE,)),
+    Commands.ABORT: frozenset((Commands.INITIATE, Commands.TRIGGER)),
+    Commands.SET_OCP_STATE: frozenset((Commands.SET_OCP_STATE,)),
+}
+_OFF_ARGS = frozenset(("0", "OFF"))
+_ON_ARGS = frozenset(("1", "ON"))
+
+
+class QueueFullError(queue.Full):
+    """Raised when a command cannot be queued because the queue stays full"""
+
+
+def is_safety(entry: tuple) -> bool:
+    """Tells whether a (command, args...) entry turns the output off, enables OCP or is in SAFETY_COMMANDS"""
+    command = entry[0]
+    if command in SAFETY_COMMANDS:
+        return True
+    arg = str(entry[1]).strip().upper() if len(entry) > 1 else ""
+    if command is Commands.SET_CHANNEL_STATE:
+        return arg in _OFF_ARGS
+    if command is Commands.SET_OCP_STATE:
+        return arg in _ON_ARGS
+    return False
+
+
+def priority_of(entries: list) -> int:
+    """Returns the priority of a compound message: that of its most urgent command.
+
+    is_safety commands are SAFETY, any other SET command is CONTROL, and
+    messages of queries only are TELEMETRY.
+    """
+    priority = TELEMETRY
+    for entry in entries:
+        if is_safety(entry):
+            return SAFETY
+        if entry[0].type == CmdType.SET:
+            priority = CONTROL
+    return priority
+
+
+def _superseded(entries: list):
+    """Returns the commands whose queued control writes the entries cancel, or None for all of them"""
+    superseded = set()
+    for entry in entries:
+        if entry[0] is Commands.RESET:
+            return None
+        if is_safety(entry):
+            superseded |= SUPERSEDES.get(entry[0], frozenset())
+    return superseded
+
+
+class _Request:
+    __slots__ = ("priority", "sequence", "label", "call", "commands", "future", "queued_at")
+
+    def __init__(self, priority: int, sequence: int, label: str, call: Callable, commands: frozenset) -> None:
+        self.priority = priority
+        self.sequence = sequence
+        self.label = label
+        self.call = call
+        self.commands = commands
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+    def __lt__(self, other: "_Request") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class CommandQueue:
+    """One I/O worker thread and a bounded priority queue in front of a PowerSupply.
+
+    Commands submitted from the worker thread itself (e.g. from a done
+    callback) run at once instead of being queued, since waiting for them
+    there could never finish.
+    """
+
+    _heap: list
+
+    def __init__(self, power_supply: PowerSupply, max_depth: int = 64, wait_metrics: MetricsRegistry = None,
+                 name: str = "psu-io") -> None:
+        if max_depth < 1:
+            raise ValueError("max_depth must be at least 1")
+        if wait_metrics is None:
+            wait_metrics = MetricsRegistry(QUEUE_WAIT_METRIC, "priority",
+                                           "Time a command waited in the queue before it ran.", traffic=False)
+        elif wait_metrics.label != "priority":
+            raise ValueError("wait_metrics must be labelled by priority")
+        self.power_supply = power_supply
+        self.max_depth = max_depth
+        self.wait_metrics = wait_metrics
+        self.rejected = 0
+        self.superseded = 0
+        self.max_depth_seen = 0
+        self._heap = []
+        self._depth = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    @property
+    def protocol(self):
+        return self.power_supply.protocol
+
+    @property
+    def depth(self) -> int:
+        """Non-safety commands waiting to run"""
+        return self._depth
+
+    def submit(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "", priority: int = None,
+               block: bool = True, timeout: float = None) -> Future:
+        """Queues make_command and returns a Future of its reply.
+
+        priority defaults to priority_of the command. When the queue is
+        full, block waits up to timeout seconds for room before raising
+        QueueFullError; without block it raises at once.
+        """
+        if priority is None:
+            priority = priority_of([(scpi_command, arg_0, arg_1)])
+        return self._submit(
+            scpi_command.command, priority,
+            lambda: self.power_supply.make_command(scpi_command, arg_0, arg_1), block, timeout,
+            [(scpi_command, arg_0, arg_1)],
+        )
+
+    def submit_many(self, commands: list, priority: int = None, block: bool = True, timeout: float = None,
+                    reply_timeout: float = None) -> Future:
+        """Queues make_commands (one compound message) and returns a Future of its results"""
+        entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+        if priority is None:
+            priority = priority_of(entries)
+        return self._submit(
+            ";".join(entry[0].command for entry in entries), priority,
+            lambda: self.power_supply.make_commands(entries, reply_timeout), block, timeout, entries,
+        )
+
+    def submit_call(self, label: str, call: Callable, priority: int = CONTROL, block: bool = True,
+                    timeout: float = None) -> Future:
+        """Queues call(power_supply), e.g. a query_all, and returns a Future of its result"""
+        return self._submit(label, priority, lambda: call(self.power_supply), block, timeout)
+
+    def output_off(self) -> Future:
+        return self.submit(Commands.SET_CHANNEL_STATE, "0", priority=SAFETY)
+
+    def make_command(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "") -> str:
+        return self.submit(scpi_command, arg_0, arg_1).result()
+
+    def make_command_raw(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "",
+                         timeout: float = None) -> bytes:
+        entries = [(scpi_command, arg_0, arg_1)]
+        return self._submit(
+            scpi_command.command, priority_of(entries),
+            lambda: self.power_supply.make_command_raw(scpi_command, arg_0, arg_1, timeout), True, None, entries,
+        ).result()
+
+    def make_commands(self, commands: list, timeout: float = None) -> list:
+        return self.submit_many(commands, reply_timeout=timeout).result()
+
+    def query(self, scpi_command: GetCmd, arg_0: str = "", arg_1: str = ""):
+        return self.submit_call(
+            scpi_command.command, lambda power_supply: power_supply.query(scpi_command, arg_0, arg_1), TELEMETRY
+        ).result()
+
+    def query_all(self, commands: list) -> list:
+        entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+        return self.submit_call(
+            ";".join(entry[0].command for entry in entries),
+            lambda power_supply: power_supply.query_all(entries), priority_of(entries),
+        ).result()
+
+    def close(self, cancel_pending: bool = False, timeout: float = None) -> None:
+        """Stops accepting commands and stops the worker once the queue is empty.
+
+        With cancel_pending, queued commands are cancelled instead of run.
+        """
+        with self._condition:
+            self._closed = True
+            if cancel_pending:
+                for request in self._heap:
+                    request.future.cancel()
+                self._heap.clear()
+                self._depth = 0
+            self._condition.notify_all()
+        if threading.current_thread() is not self._worker:
+            self._worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _submit(self, label: str, priority: int, call: Callable, block: bool, timeout: float,
+                entries: list = ()) -> Future:
+        if threading.current_thread() is self._worker:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            _run_into(future, call)
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("the command queue is closed")
+            if priority != SAFETY and self._depth >= self.max_depth:
+                full = not block or not self._condition.wait_for(
+                    lambda: self._closed or self._depth < self.max_depth, timeout
+                )
+                if self._closed:
+                    raise RuntimeError("the command queue is closed")
+                if full:
+                    self.rejected += 1
+                    raise QueueFullError(f"{self._depth} commands are already queued")
+            if priority == SAFETY and entries:
+                self._cancel_superseded(_superseded(entries))
+            commands = frozenset(entry[0] for entry in entries)
+            request = _Request(priority, next(self._sequence), label, call, commands)
+            heapq.heappush(self._heap, request)
+            if priority != SAFETY:
+                self._depth += 1
+                self.max_depth_seen = max(self.max_depth_seen, self._depth)
+            self._condition.notify_all()
+        return request.future
+
+    def _cancel_superseded(self, superseded) -> None:
+        """Cancels the queued control writes of any of the superseded commands (all of them for None).
+
+        Calls queued with submit_call are left alone, since what they send
+        is not known.
+        """
+        kept = []
+        for request in self._heap:
+            if request.priority == CONTROL and request.commands and (
+                    superseded is None or not superseded.isdisjoint(request.commands)):
+                request.future.cancel()
+                self._depth -= 1
+                self.superseded += 1
+                log.debug("cancelled queued %s, superseded by a safety command", request.label)
+            else:
+                kept.append(request)
+        if len(kept) != len(self._heap):
+            heapq.heapify(kept)
+            self._heap = kept
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._heap or self._closed)
+                if not self._heap:
+                    return
+                request = heapq.heappop(self._heap)
+                if request.priority != SAFETY:
+                    self._depth -= 1
+                # Wakes submitters waiting for room
+                self._condition.notify_all()
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            self.wait_metrics.observe(
+                request.label, PRIORITY_NAMES[request.priority], time.perf_counter() - request.queued_at
+            )
+            _run_into(request.future, request.call)
+
+
+class WriteBehindPowerSupply:
+    """Queues writes on a CommandQueue without waiting for them to run.
+
+    make_command and make_commands return "" per command at once when they
+    only hold SET commands. A write that fails is counted in failed, kept
+    in last_error and logged, since there is no caller left to raise to.
+    Anything that expects a reply blocks as on the CommandQueue. A full
+    queue still blocks a write until there is room.
+    """
+
+    def __init__(self, command_queue: CommandQueue) -> None:
+        self.command_queue = command_queue
+        self.failed = 0
+        self.last_error = None
+
+    @property
+    def protocol(self):
+        return self.command_queue.protocol
+
+    def make_command(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "") -> str:
+        if scpi_command.type != CmdType.SET:
+            return self.command_queue.make_command(scpi_command, arg_0, arg_1)
+        self.command_queue.submit(scpi_command, arg_0, arg_1).add_done_callback(self._check_write)
+        return ""
+
+    def make_commands(self, commands: list) -> list:
+        entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+        if any(entry[0].type != CmdType.SET for entry in entries):
+            return self.command_queue.make_commands(entries)
+        self.command_queue.submit_many(entries).add_done_callback(self._check_write)
+        return [""] * len(entries)
+
+    def query(self, scpi_command: GetCmd, arg_0: str = "", arg_1: str = ""):
+        return self.command_queue.query(scpi_command, arg_0, arg_1)
+
+    def query_all(self, commands: list) -> list:
+        return self.command_queue.query_all(commands)
+
+    def close(self, timeout: float = None) -> None:
+        """Closes the command queue, waiting up to timeout seconds for queued writes"""
+        self.command_queue.close(timeout=timeout)
+
+    def _check_write(self, future: Future) -> None:
+        if future.cancelled() or future.exception() is None:
+            return
+        self.failed += 1
+        self.last_error = future.exception()
+        log.warning("queued write failed: %r", self.last_error)
+
+
+def _run_into(future: Future, call: Callable) -> None:
+    try:
+        result = call()
+    except Exception as error:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def example_output_off_preempts_telemetry():
+    """Queues a burst of telemetry and then turns the output off, which runs next"""
+    with CommandQueue(PowerSupply(protocol=DebugProtocol()), max_depth=256) as command_queue:
+        telemetry = [command_queue.submit(Commands.GET_VOLTS) for _ in range(20)]
+        command_queue.output_off().result()
+        print(f"telemetry still queued when the output went off: {sum(not f.done() for f in telemetry)}")
+
+
+def main():
+    example_output_off_preempts_telemetry()
+
+
+if __name__ == "__main__":
+    main()
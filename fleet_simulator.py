@@ -0,0 +1,355 @@
+"""Headless physics simulation of a fleet of power supplies.
+
+PowerSupplyFleet keeps the state of every unit in NumPy arrays and steps
+all of them in one vectorized call. The model covers CV/CC/CP crossover,
+the 80 V / 120 A / 3000 W limits, a resistive load, the voltage slew
+rate and the over-current protection delay. FleetProtocol exposes one
+unit as a Protocol, so a PowerSupply (or anything built on one) drives it
+like a real instrument, which lets orchestration software be load-tested
+at fleet scale without hardware.
+
+Run `python3 fleet_simulator.py --units 10000 --steps 1000` to measure
+how fast a fleet steps.
+"""
+import argparse
+import threading
+import time
+from collections import deque
+
+import numpy
+
+from power_supply import (MAX_CURRENT, MAX_POWER, MAX_VOLTAGE, Commands, PowerSupply, Protocol, decode_bool,
+                          decode_number)
+from scpi_simulator import split_message
+
+# Output modes, indexed by PowerSupplyFleet.mode
+MODES = ("OFF", "CV", "CC", "CP")
+MODE_OFF, MODE_CV, MODE_CC, MODE_CP = range(len(MODES))
+
+# Volts per second the output moves toward its operating point
+DEFAULT_SLEW_RATE = 1000.0
+
+
+class PowerSupplyFleet:
+    """Setpoints, load and output of `units` power supplies, one array element per unit.
+
+    Each unit settles at the lowest of its voltage setpoint (CV), the
+    voltage its current setpoint drives through the load (CC) and the
+    voltage its power setpoint drives through the load (CP). step() moves
+    the output toward that point by at most slew_rate * dt. A unit with
+    OCP enabled that stays in CC for longer than its OCP delay switches
+    its output off and is marked ocp_tripped until it is switched on again.
+
+    Time only passes in step(), unless realtime is set: then advance(),
+    which FleetProtocol calls for every message, steps the whole fleet by
+    the monotonic time since the last step once that exceeds
+    min_realtime_step. The setters take an index, slice or mask of units
+    and clip values to the supply's limits.
+    """
+
+    voltage_setpoint: numpy.ndarray
+    current_setpoint: numpy.ndarray
+    power_setpoint: numpy.ndarray
+    output_on: numpy.ndarray
+    load_resistance: numpy.ndarray
+    slew_rate: numpy.ndarray
+    ocp_enabled: numpy.ndarray
+    ocp_delay: numpy.ndarray
+    ocp_tripped: numpy.ndarray
+    voltage: numpy.ndarray
+    current: numpy.ndarray
+    mode: numpy.ndarray
+
+    min_realtime_step = 0.001
+
+    def __init__(self, units: int, load_resistance=1.0, slew_rate=DEFAULT_SLEW_RATE, realtime: bool = False) -> None:
+        if units < 1:
+            raise ValueError("a fleet needs at least one unit")
+        self.units = units
+        self.voltage_setpoint = numpy.zeros(units)
+        self.current_setpoint = numpy.zeros(units)
+        self.power_setpoint = numpy.full(units, MAX_POWER)
+        self.output_on = numpy.zeros(units, dtype=bool)
+        self.load_resistance = numpy.full(units, 1.0)
+        self.slew_rate = numpy.full(units, DEFAULT_SLEW_RATE)
+        self.ocp_enabled = numpy.zeros(units, dtype=bool)
+        self.ocp_delay = numpy.zeros(units)
+        self.ocp_tripped = numpy.zeros(units, dtype=bool)
+        self.voltage = numpy.zeros(units)
+        self.current = numpy.zeros(units)
+        self.mode = numpy.full(units, MODE_OFF, dtype=numpy.int8)
+        self.time = 0.0
+        self.steps = 0
+        self.realtime = realtime
+        # Steps and FleetProtocol messages hold it, so units can be driven from several threads
+        self.lock = threading.RLock()
+        self.set_load(slice(None), load_resistance)
+        self.slew_rate[:] = slew_rate
+        self._cc_time = numpy.zeros(units)
+        self._last_step = time.monotonic()
+
+    def set_voltage(self, units, values) -> None:
+        self.voltage_setpoint[units] = numpy.clip(values, 0.0, MAX_VOLTAGE)
+
+    def set_current(self, units, values) -> None:
+        self.current_setpoint[units] = numpy.clip(values, 0.0, MAX_CURRENT)
+
+    def set_power(self, units, values) -> None:
+        self.power_setpoint[units] = numpy.clip(values, 0.0, MAX_POWER)
+
+    def set_load(self, units, resistance) -> None:
+        """Sets the load in ohms; 0 is a short circuit and numpy.inf an open one"""
+        resistance = numpy.asarray(resistance, dtype=float)
+        if (resistance < 0).any():
+            raise ValueError("load resistance cannot be negative")
+        self.load_resistance[units] = resistance
+
+    def set_output(self, units, on) -> None:
+        """Switches outputs on or off; switching one on clears its OCP trip"""
+        self.output_on[units] = on
+        self.ocp_tripped[units] &= ~self.output_on[units]
+        self._cc_time[units] = 0.0
+
+    def set_ocp(self, units, enabled, delay=None) -> None:
+        self.ocp_enabled[units] = enabled
+        if delay is not None:
+            self.ocp_delay[units] = numpy.maximum(delay, 0.0)
+
+    def reset(self, units) -> None:
+        """Returns units to their *RST state; the load and slew rate are left alone"""
+        self.voltage_setpoint[units] = 0.0
+        self.current_setpoint[units] = 0.0
+        self.power_setpoint[units] = MAX_POWER
+        self.output_on[units] = False
+        self.ocp_enabled[units] = False
+        self.ocp_delay[units] = 0.0
+        self.ocp_tripped[units] = False
+        self._cc_time[units] = 0.0
+
+    def operating_point(self) -> tuple:
+        """Returns the (voltage, mode) arrays every unit settles at with its present setpoints and load"""
+        resistance = self.load_resistance
+        limits = numpy.empty((3, self.units))
+        limits[0] = self.voltage_setpoint
+        with numpy.errstate(invalid="ignore"):
+            numpy.multiply(self.current_setpoint, resistance, out=limits[1])
+            numpy.sqrt(self.power_setpoint * resistance, out=limits[2])
+        # 0 A or 0 W into an open circuit (0 * inf) does not limit the voltage
+        limits[numpy.isnan(limits)] = numpy.inf
+        limit = numpy.argmin(limits, axis=0)
+        voltage = limits[limit, numpy.arange(self.units)]
+        mode = (limit + MODE_CV).astype(numpy.int8)
+        off = ~self.output_on
+        voltage[off] = 0.0
+        mode[off] = MODE_OFF
+        return voltage, mode
+
+    def step(self, dt: float) -> None:
+        """Advances every unit by dt seconds"""
+        with self.lock:
+            target, mode = self.operating_point()
+            limit = self.slew_rate * dt
+            self.voltage += numpy.clip(target - self.voltage, -limit, limit)
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                current = self.voltage / self.load_resistance
+            # A short circuit carries the current setpoint at 0 V
+            current[self.load_resistance == 0] = numpy.inf
+            numpy.minimum(current, self.current_setpoint, out=current)
+            current[~self.output_on] = 0.0
+            self.current[:] = current
+            self.mode[:] = mode
+            constant_current = self.ocp_enabled & (mode == MODE_CC)
+            self._cc_time = numpy.where(constant_current, self._cc_time + dt, 0.0)
+            trip = constant_current & (self._cc_time >= self.ocp_delay)
+            if trip.any():
+                self.output_on[trip] = False
+                self.ocp_tripped[trip] = True
+                self._cc_time[trip] = 0.0
+            self.time += dt
+            self.steps += 1
+            self._last_step = time.monotonic()
+
+    def advance(self) -> None:
+        """Steps by the real time elapsed since the last step if realtime is set"""
+        if not self.realtime:
+            return
+        with self.lock:
+            elapsed = time.monotonic() - self._last_step
+            if elapsed >= self.min_realtime_step:
+                self.step(elapsed)
+
+    @property
+    def power(self) -> numpy.ndarray:
+        return self.voltage * self.current
+
+    def protocols(self) -> list:
+        """Returns a FleetProtocol for every unit"""
+        return [FleetProtocol(self, unit) for unit in range(self.units)]
+
+
+def _setter(method: str, maximum: float):
+    def set_value(protocol: "FleetProtocol", args: list) -> None:
+        value = decode_number(args[0])
+        if not 0 <= value <= maximum:
+            raise ValueError(value)
+        getattr(protocol.fleet, method)(protocol.unit, value)
+    return set_value
+
+
+def _reading(attribute: str):
+    def read(protocol: "FleetProtocol", args: list) -> str:
+        return f"{getattr(protocol.fleet, attribute)[protocol.unit]:.4f}"
+    return read
+
+
+def _set_output(protocol: "FleetProtocol", args: list) -> None:
+    protocol.fleet.set_output(protocol.unit, decode_bool(args[0]))
+
+
+def _set_ocp_state(protocol: "FleetProtocol", args: list) -> None:
+    protocol.fleet.set_ocp(protocol.unit, decode_bool(args[0]))
+
+
+def _set_ocp_delay(protocol: "FleetProtocol", args: list) -> None:
+    fleet = protocol.fleet
+    fleet.set_ocp(protocol.unit, fleet.ocp_enabled[protocol.unit], decode_number(args[0]))
+
+
+def _read_power(protocol: "FleetProtocol", args: list) -> str:
+    fleet = protocol.fleet
+    return f"{fleet.voltage[protocol.unit] * fleet.current[protocol.unit]:.4f}"
+
+
+def _reset(protocol: "FleetProtocol", args: list) -> None:
+    protocol.fleet.reset(protocol.unit)
+
+
+def _clear(protocol: "FleetProtocol", args: list) -> None:
+    protocol.errors.clear()
+
+
+def _read_error(protocol: "FleetProtocol", args: list) -> str:
+    if not protocol.errors:
+        return '0,"No error"'
+    return protocol.errors.popleft()
+
+
+_HANDLERS = {
+    "MEAS:VOLT?": _reading("voltage"),
+    "MEAS:CURR?": _reading("current"),
+    "MEAS:POW?": _read_power,
+    "VOLT": _setter("set_voltage", MAX_VOLTAGE),
+    "VOLT?": _reading("voltage_setpoint"),
+    "CURR": _setter("set_current", MAX_CURRENT),
+    "CURR?": _reading("current_setpoint"),
+    "POW": _setter("set_power", MAX_POWER),
+    "POW?": _reading("power_setpoint"),
+    "CURR:PROT:STAT": _set_ocp_state,
+    "CURR:PROT:STAT?": lambda protocol, args: str(int(protocol.fleet.ocp_enabled[protocol.unit])),
+    "CURR:PROT:DEL": _set_ocp_delay,
+    "CURR:PROT:DEL?": lambda protocol, args: f"{protocol.fleet.ocp_delay[protocol.unit]:g}",
+    # Every unit has a single channel
+    "INST": lambda protocol, args: None,
+    "INST?": lambda protocol, args: "CH1",
+    "OUTP": _set_output,
+    "OUTP?": lambda protocol, args: str(int(protocol.fleet.output_on[protocol.unit])),
+    "OUTP:MODE?": lambda protocol, args: MODES[protocol.fleet.mode[protocol.unit]],
+    "*RST": _reset,
+    "*CLS": _clear,
+    "*IDN?": lambda protocol, args: f"Elektro-Automatik,PS 9080-120 2U SIMULATED,{protocol.unit},1.0",
+    "*TST?": lambda protocol, args: "0",
+    "*OPC?": lambda protocol, args: "1",
+    "*WAI": lambda protocol, args: None,
+    "SYST:ERR?": _read_error,
+}
+
+
+class FleetProtocol(Protocol):
+    """One unit of a PowerSupplyFleet behind the Protocol interface.
+
+    Messages are executed as they are written and their replies queued
+    for read(), so no sockets or threads are involved. The measured
+    values are those of the fleet's last step.
+    """
+
+    errors: deque
+
+    def __init__(self, fleet: PowerSupplyFleet, unit: int) -> None:
+        if not 0 <= unit < fleet.units:
+            raise IndexError(f"the fleet has no unit {unit}")
+        self.fleet = fleet
+        self.unit = unit
+        self.errors = deque(maxlen=32)
+        self._replies = deque()
+
+    def write(self, msg: bytes = b"") -> None:
+        text = bytes(msg).decode("ascii", errors="replace")
+        with self.fleet.lock:
+            self.fleet.advance()
+            for line in text.splitlines():
+                replies = []
+                for header, args in split_message(line):
+                    reply = self._execute(header, args)
+                    if reply is not None:
+                        replies.append(reply)
+                if replies:
+                    self._replies.append((";".join(replies) + "\n").encode())
+
+    def read(self, timeout: float = None) -> bytes:
+        return self._replies.popleft() if self._replies else b""
+
+    def read_block(self, timeout: float = None) -> bytes:
+        # The array queries are not simulated, so answer with an empty block
+        return b"#10"
+
+    def _execute(self, header: str, args: list) -> str:
+        handler = _HANDLERS.get(header)
+        if handler is None:
+            self.errors.append('-113,"Undefined header"')
+            return None
+        try:
+            return handler(self, args)
+        except (ValueError, IndexError):
+            self.errors.append('-224,"Illegal parameter value"')
+            return None
+
+
+def example_constant_current():
+    """Drives one unit of a fleet through a PowerSupply until it crosses over into CC"""
+    fleet = PowerSupplyFleet(4, load_resistance=2.0)
+    power_supply = PowerSupply(protocol=FleetProtocol(fleet, 0))
+    power_supply.make_commands([(Commands.SET_CURR, 5.0), (Commands.SET_VOLTS, 20.0), (Commands.SET_CHANNEL_STATE, 1)])
+    for _ in range(100):
+        fleet.step(0.001)
+    print(power_supply.query_all([Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step a simulated fleet of power supplies")
+    parser.add_argument("--units", type=int, default=10000)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--dt", type=float, default=0.001, help="simulated seconds per step")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    generator = numpy.random.default_rng(args.seed)
+    everyone = slice(None)
+    fleet = PowerSupplyFleet(args.units, load_resistance=generator.uniform(0.05, 20.0, args.units))
+    fleet.set_voltage(everyone, generator.uniform(0.0, MAX_VOLTAGE, args.units))
+    fleet.set_current(everyone, generator.uniform(0.0, MAX_CURRENT, args.units))
+    fleet.set_ocp(everyone, generator.random(args.units) < 0.1, delay=0.1)
+    fleet.set_output(everyone, True)
+
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        fleet.step(args.dt)
+    elapsed = time.perf_counter() - start
+    print(f"{args.units} units x {args.steps} steps in {elapsed:.3f} s "
+          f"({args.units * args.steps / elapsed:,.0f} unit steps/s)")
+    counts = numpy.bincount(fleet.mode, minlength=len(MODES))
+    print(", ".join(f"{mode}: {count}" for mode, count in zip(MODES, counts))
+          + f", OCP tripped: {int(fleet.ocp_tripped.sum())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,42 @@
+import threading
 import tkinter as tk
+import tkinter.filedialog as filedialog
 import tkinter.ttk as ttk
-from random import random
+from concurrent.futures import Future
 from tkinter import *
 from typing import Callable
 
+from acquisition import AcquisitionWorker
+from command_queue import CommandQueue, WriteBehindPowerSupply
+from noise_generator import DISTRIBUTIONS, NoiseGenerator
 from power_supply import (Commands, DebugProtocol, EthernetProtocol,
-                          PowerSupply, UsbProtocol)
+                          PowerSupply, PowerSupplyConnectionError, QueryCache,
+                          UsbProtocol)
+from profile_player import ProfilePlayer, load_profile
+from render_scheduler import RenderScheduler
+from setpoint_coalescer import CoalescingPowerSupply
+from strip_chart import StripChart
+from telemetry_recorder import TelemetryRecorder
+
+# Maximum number of setpoint writes per second for each of voltage and current
+MAX_SETPOINT_WRITE_RATE = 20.0
+# Seconds between measurements on the acquisition thread
+ACQUISITION_INTERVAL = 0.05
+# Seconds to wait for queued writes when a connection is released
+RELEASE_TIMEOUT = 2.0
+# Milliseconds between refreshes of the actual values shown in the window.
+# Widget updates themselves are batched per frame by the RenderScheduler.
+RENDER_INTERVAL_MS = 100
+# Milliseconds between noise updates of the requested values
+NOISE_INTERVAL_MS = 100
+# Noise values taken per update and spread over it, one per setpoint write
+# the rate limit lets through in that time
+NOISE_ROWS_PER_UPDATE = max(1, int(NOISE_INTERVAL_MS / 1000 * MAX_SETPOINT_WRITE_RATE))
+# Seed for the noise generator, or None for a different run every time
+NOISE_SEED = None
+# Size of the history strip-chart in pixels
+CHART_WIDTH = 720
+CHART_HEIGHT = 240
 
 
 class Application:
@@ -17,6 +48,7 @@ class Application:
     _add_volt_noise_frame: ttk.LabelFrame
     _curr_frame: ttk.LabelFrame
     _excel_frame: ttk.LabelFrame
+    _history_frame: ttk.LabelFrame
     _max_frame: ttk.LabelFrame
     _mult_curr_noise_frame: ttk.LabelFrame
     _mult_volt_noise_frame: ttk.LabelFrame
@@ -24,6 +56,7 @@ class Application:
     _power_frame: ttk.LabelFrame
     _on_frame: ttk.LabelFrame
     _protocol_frame: ttk.LabelFrame
+    _record_frame: ttk.LabelFrame
     _volt_frame: ttk.LabelFrame
     _volt_curr_constant_frame: ttk.LabelFrame
 
@@ -47,6 +80,7 @@ class Application:
     _power_label: ttk.Label
     _on_label: ttk.Label
     _protocol_label: ttk.Label
+    _record_label: ttk.Label
     _actual_voltage_label: ttk.Label
     _actual_current_label: ttk.Label
     _actual_power_label: ttk.Label
@@ -55,12 +89,19 @@ class Application:
 
     _constant_power_button: tk.Button
     _excel_button: tk.Button
+    _excel_label: ttk.Label
     _on_button: tk.Button
     _protocol_button: tk.Button
+    _record_button: tk.Button
     _volt_curr_constant_button: tk.Button
 
+    _history_chart: StripChart
+    _history_count: int
+
     _popup_menu: tk.Menu
+    _renderer: RenderScheduler
     _noise_menu: tk.OptionMenu
+    _noise_distribution_menu: tk.OptionMenu
 
     _max_current: float
     _max_voltage: float
@@ -74,6 +115,8 @@ class Application:
     _requested_mode_is_on: bool
 
     _noise_status: tk.StringVar
+    _noise_distribution: tk.StringVar
+    _noise_generator: NoiseGenerator
 
     _actual_current: float
     _actual_power: float
@@ -81,7 +124,12 @@ class Application:
 
     _actual_mode: str
 
-    _power_supply: PowerSupply
+    _power_supply: CoalescingPowerSupply
+    _command_queue: CommandQueue
+    _connecting: Future
+    _acquisition: AcquisitionWorker
+    _recorder: TelemetryRecorder
+    _profile_player: ProfilePlayer
 
     def __init__(self) -> None:
 
@@ -102,13 +150,24 @@ class Application:
 
         self._actual_mode = "Unknown"
 
-        self._power_supply = PowerSupply(protocol=UsbProtocol())
+        # One channel for voltage noise and one for current noise
+        self._noise_generator = NoiseGenerator(DISTRIBUTIONS[0], seed=NOISE_SEED, channels=2)
+
+        self._power_supply = self._create_power_supply(UsbProtocol())
+        self._connecting = None
+        self._acquisition = AcquisitionWorker(self._power_supply, interval=ACQUISITION_INTERVAL)
+        self._recorder = None
+        self._profile_player = None
+        self._history_count = 0
 
         self._load_all_graphics()
 
     def run(self) -> None:
-        self._app_window.after(100, self._update_noise)
-        self._app_window.after(100, self._update_actual)
+        self._acquisition.start()
+        self._app_window.protocol("WM_DELETE_WINDOW", self._close)
+        self._app_window.after(NOISE_INTERVAL_MS, self._update_noise)
+        self._app_window.after(RENDER_INTERVAL_MS, self._update_actual)
+        self._app_window.after(100, self._flush_setpoints)
         self._app_window.mainloop()
 
 
@@ -127,6 +186,14 @@ class Application:
     def _add_volt_noise_slider_changed(self, event) -> None:
         self._change_add_volt_noise(self._add_volt_noise_slider.get())
 
+    def _apply_noise(self, volt_noise: float, curr_noise: float) -> None:
+        if not self._requested_mode_is_on:
+            pass
+        elif self._noise_status.get() == "Additive":
+            self._create_additive_noise(volt_noise, curr_noise)
+        elif self._noise_status.get() == "Multiplicative":
+            self._create_mult_noise(volt_noise, curr_noise)
+
     def _center_window(self, window_name: tk.Tk) -> None:
         win_width = window_name.winfo_reqwidth()
         win_height = window_name.winfo_reqheight()
@@ -135,24 +202,16 @@ class Application:
         window_name.geometry("+{}+{}".format(horiz_center, vert_center))
 
     def _change_add_curr_noise(self, add_noise: float) -> None:
-        self._add_curr_noise_label.configure(
-            text=f"Add Curr Noise: {round(add_noise, 3)}"
-        )
+        self._renderer.set_text(self._add_curr_noise_label, f"Add Curr Noise: {round(add_noise, 3)}")
 
     def _change_add_volt_noise(self, add_noise: float) -> None:
-        self._add_volt_noise_label.configure(
-            text=f"Add Volt Noise: {round(add_noise, 3)}"
-        )
+        self._renderer.set_text(self._add_volt_noise_label, f"Add Volt Noise: {round(add_noise, 3)}")
 
     def _change_mult_curr_noise(self, mult_noise: float) -> None:
-        self._mult_curr_noise_label.configure(
-            text=f"Mult Curr Noise: {round(mult_noise, 3)}"
-        )
+        self._renderer.set_text(self._mult_curr_noise_label, f"Mult Curr Noise: {round(mult_noise, 3)}")
 
     def _change_mult_volt_noise(self, mult_noise: float) -> None:
-        self._mult_volt_noise_label.configure(
-            text=f"{round(mult_noise, 3)}"
-        )
+        self._renderer.set_text(self._mult_volt_noise_label, f"{round(mult_noise, 3)}")
 
     def _change_curr(self, curr: float) -> None:
         if (curr < 0 or curr > self._max_current):
@@ -162,7 +221,7 @@ class Application:
             self._max_power / self._requested_voltage if self._requested_voltage != 0 
             else curr
         )
-        self._curr_label.configure(text=f"Current: {round(curr, 3)} A")
+        self._renderer.set_text(self._curr_label, f"Current: {round(curr, 3)} A")
         self._power_supply.make_command(Commands.SET_CURR, str(curr))
         self._requested_current = curr
         self._update_power()
@@ -178,21 +237,71 @@ class Application:
             self._max_power / self._requested_current if self._requested_current != 0 
             else volt
         )
-        self._volt_label.configure(text=f"Voltage: {round(volt, 3)} V")
+        self._renderer.set_text(self._volt_label, f"Voltage: {round(volt, 3)} V")
         self._power_supply.make_command(Commands.SET_VOLTS, str(volt))
         self._requested_voltage = volt
         self._update_power()
 
     def _click_excel_button(self) -> None:
-        # TODO - eventually
-        pass
+        if self._profile_player is not None and self._profile_player.running:
+            self._profile_player.stop()
+            return
+        path = filedialog.askopenfilename(
+            filetypes=[("Profiles", "*.csv *.xlsx"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            profile = load_profile(path)
+        except (OSError, RuntimeError, ValueError) as error:
+            self._renderer.set_text(self._excel_label, f"Could not load: {error}")
+            return
+        # The profile writes straight to the instrument, so setpoints
+        # remembered by the coalescing layer are no longer current.
+        self._power_supply.flush(force=True)
+        self._power_supply.forget()
+        # The player runs on its own thread and waits for each of its writes
+        self._profile_player = ProfilePlayer(self._command_queue, profile)
+        self._profile_player.start()
+        self._excel_button.config(text="Stop profile")
+        self._app_window.after(100, self._update_profile_status)
+
+    def _close(self) -> None:
+        if self._profile_player is not None:
+            self._profile_player.stop()
+        if self._connecting is not None:
+            # Nothing will take over a connection that is still being opened
+            self._connecting.add_done_callback(_close_connected)
+            self._connecting = None
+        self._acquisition.stop()
+        self._release_power_supply()
+        self._stop_recording()
+        self._renderer.cancel()
+        self._app_window.destroy()
+
+    def _connect(self, name: str, create_protocol: Callable, button_text: str) -> None:
+        # Opening a port or a socket can take seconds, so it runs on its own
+        # thread and _finish_connect takes over once it is done.
+        self._renderer.set_text(self._protocol_label, f"Connecting to {name}...")
+        self._protocol_button.config(state="disabled")
+        future = self._connecting = Future()
+
+        def connect() -> None:
+            try:
+                future.set_result(create_protocol())
+            except Exception as error:
+                future.set_exception(error)
+
+        threading.Thread(target=connect, name="psu-connect", daemon=True).start()
+        self._app_window.after(100, self._finish_connect, name, button_text)
+
+    def _create_additive_noise(self, volt_noise: float, curr_noise: float) -> None:
 
-    def _create_additive_noise(self) -> None:
         add_volt_factor = self._add_volt_noise_slider.get()
-        self._change_volt(self._requested_voltage + (random() - 0.5)*add_volt_factor)
+        self._change_volt(self._requested_voltage + volt_noise*add_volt_factor)
 
         add_curr_factor = self._add_curr_noise_slider.get()
-        self._change_curr(self._requested_current + (random() - 0.5)*add_curr_factor)
+        self._change_curr(self._requested_current + curr_noise*add_curr_factor)
 
     def _create_frame(self, text: str, row: int, col: int) -> ttk.LabelFrame:
         frame = ttk.LabelFrame(
@@ -211,20 +320,37 @@ class Application:
         label.grid(row=row, column=0, padx=10, pady=10)
         return label
 
-    def _create_mult_noise(self) -> None:
+    def _create_mult_noise(self, volt_noise: float, curr_noise: float) -> None:
+
         mult_volt_factor = self._mult_volt_noise_slider.get()
         # expect mult_factor to be a number between 0 and 1, most definitely closer to 0 though)
         self._change_volt(
             self._requested_voltage
-            * (1 + (random() - 0.5)*mult_volt_factor)
+            * (1 + volt_noise*mult_volt_factor)
         )
 
         mult_curr_factor = self._mult_curr_noise_slider.get()
         self._change_curr(
             self._requested_current
-            * (1 + (random() - 0.5)*mult_curr_factor)
+            * (1 + curr_noise*mult_curr_factor)
+        )
+
+    def _create_power_supply(self, protocol) -> CoalescingPowerSupply:
+        # The command queue runs the GUI's commands and the acquisition's
+        # queries on one I/O thread, turning the output off ahead of queued
+        # telemetry. The GUI's writes are only queued, so the Tk thread
+        # does not wait for the link.
+        self._command_queue = CommandQueue(PowerSupply(protocol=protocol, cache=QueryCache()))
+        return CoalescingPowerSupply(
+            WriteBehindPowerSupply(self._command_queue),
+            max_write_rate=MAX_SETPOINT_WRITE_RATE
         )
 
+    def _release_power_supply(self) -> None:
+        self._power_supply.flush(force=True)
+        self._power_supply.power_supply.close(timeout=RELEASE_TIMEOUT)
+        _close_protocol(self._command_queue.protocol)
+
     def _create_slider(self, frame: ttk.LabelFrame, row: int, max: float, cmd: Callable) -> tk.Scale:
         slider = tk.Scale(
             frame,
@@ -275,6 +401,31 @@ class Application:
     def _curr_res_thousandth(self) -> None:
         self._change_slider_resolution(self._curr_slider, 0.001)
 
+    def _finish_connect(self, name: str, button_text: str) -> None:
+        future = self._connecting
+        if future is None:
+            return
+        if not future.done():
+            self._app_window.after(100, self._finish_connect, name, button_text)
+            return
+        self._connecting = None
+        self._protocol_button.config(state="normal")
+        try:
+            protocol = future.result()
+        except PowerSupplyConnectionError as error:
+            self._renderer.set_text(self._protocol_label, f"{name} unavailable: {error}")
+            return
+        self._renderer.set_text(self._protocol_label, f"Currently using {name}")
+        self._protocol_button.config(text=button_text)
+        self._release_power_supply()
+        self._power_supply = self._create_power_supply(protocol)
+        self._acquisition.power_supply = self._power_supply
+
+    def _flush_setpoints(self) -> None:
+        next_due = self._power_supply.flush()
+        delay = 100 if next_due is None else max(1, int(next_due * 1000))
+        self._app_window.after(min(delay, 100), self._flush_setpoints)
+
     def _load_all_graphics(self) -> None:
         # Load app window first.
         # Then load frames. Theen load labels since sliders and switches modify it.
@@ -287,10 +438,12 @@ class Application:
 
         self._load_noise_menu()
         self._load_popup_menu()
+        self._load_history_chart()
 
     def _load_app_window(self) -> None:
         self._app_window = tk.Tk()
         self._app_window.title("Virtual Power Supply")
+        self._renderer = RenderScheduler(self._app_window)
 
         self._center_window(self._app_window)
 
@@ -309,8 +462,15 @@ class Application:
         self._excel_frame = self._create_frame("Load Excel Data", 2, 3)
         self._on_frame = self._create_frame("Select On/Off", 3, 0)
         self._protocol_frame = self._create_frame("Select Protocol", 3, 1)
+        self._record_frame = self._create_frame("Record Telemetry", 3, 3)
         self._volt_curr_constant_frame = self._create_frame("Keep Voltage/Current Constant", 3, 2)
 
+    def _load_history_chart(self) -> None:
+        self._history_frame = ttk.LabelFrame(self._app_window, text="History")
+        self._history_frame.grid(row=4, column=0, columnspan=4, padx=10, pady=10)
+        self._history_chart = StripChart(self._history_frame, width=CHART_WIDTH, height=CHART_HEIGHT)
+        self._history_chart.grid(row=0, column=0, padx=10, pady=10)
+
     def _load_labels(self) -> None:
         self._actual_current_label = self._create_label(self._actual_frame, "Current: 0.0 A", 1)
         self._actual_mode_label = self._create_label(self._actual_frame, "Mode: Unknown", 3)
@@ -320,11 +480,13 @@ class Application:
         self._add_volt_noise_label = self._create_label(self._add_volt_noise_frame, "Add Volt Noise: 0.0", 0)
         self._constant_power_label = self._create_label(self._constant_power_frame, "Currently using variable power", 0)
         self._curr_label = self._create_label(self._curr_frame, "Curent: 0.0 A", 0)
+        self._excel_label = self._create_label(self._excel_frame, "No profile loaded", 0)
         self._mult_curr_noise_label = self._create_label(self._mult_curr_noise_frame, "Mult Curr Noise: 0.0", 0)
         self._mult_volt_noise_label = self._create_label(self._mult_volt_noise_frame, "Mult Volt Noise: 0.0", 0)
         self._on_label = self._create_label(self._on_frame, "Currently off", 0)
         self._power_label = self._create_label(self._power_frame, "Power: 0.0 W", 0)
         self._protocol_label = self._create_label(self._protocol_frame, "Currently using USB", 0)
+        self._record_label = self._create_label(self._record_frame, "Not recording", 0)
         self._volt_curr_constant_label = self._create_label(self._volt_curr_constant_frame, "Currently using constant voltage", 0)
         self._volt_label = self._create_label(self._volt_frame, "Voltage: 0.0 V", 0)
 
@@ -335,6 +497,16 @@ class Application:
         self._noise_menu = tk.OptionMenu(self._noise_select_frame, self._noise_status, *choices)
         self._noise_menu.grid(row=0, column=0, padx=10, pady=10)
 
+        self._noise_distribution = tk.StringVar()
+        self._noise_distribution.set(DISTRIBUTIONS[0])
+        self._noise_distribution_menu = tk.OptionMenu(
+            self._noise_select_frame,
+            self._noise_distribution,
+            *DISTRIBUTIONS,
+            command=self._noise_distribution_changed
+        )
+        self._noise_distribution_menu.grid(row=1, column=0, padx=10, pady=10)
+
     def _load_popup_menu(self) -> None:
         self._popup_menu = tk.Menu(self._app_window, tearoff=False)
         self._popup_menu.add_command(
@@ -402,19 +574,20 @@ class Application:
         self._excel_button = self._create_switch(self._excel_frame, "Load excel data", self._click_excel_button)
         self._on_button = self._create_switch(self._on_frame, "Turn on", self._toggle_on_switch)
         self._protocol_button = self._create_switch(self._protocol_frame, "Change to Ethernet", self._toggle_protocol_switch)
+        self._record_button = self._create_switch(self._record_frame, "Start recording", self._toggle_record_switch)
         self._volt_curr_constant_button = self._create_switch(self._volt_curr_constant_frame, "Change to constant current", self._toggle_volt_curr_constant_switch)
 
     def _max_curr_slider_changed(self, event) -> None:
         self._max_current = self._max_curr_slider.get()
-        self._curr_slider = self._create_slider(self._curr_frame, 1, self._max_current, self._curr_slider_changed)
+        self._renderer.configure(self._curr_slider, to=self._max_current)
 
     def _max_power_slider_changed(self, event) -> None:
         self._max_power = self._max_power_slider.get()
-        self._power_slider = self._create_slider(self._power_frame, 1, self._max_power, self._power_slider_changed)
+        self._renderer.configure(self._power_slider, to=self._max_power)
 
     def _max_volt_slider_changed(self, event) -> None:
         self._max_voltage = self._max_volt_slider.get()
-        self._volt_slider = self._create_slider(self._volt_frame, 1, self._max_voltage, self._volt_slider_changed)
+        self._renderer.configure(self._volt_slider, to=self._max_voltage)
 
     def _mult_curr_noise_slider_changed(self, event) -> None:
         self._change_mult_curr_noise(self._mult_curr_noise_slider.get())        
@@ -431,6 +604,9 @@ class Application:
     def _mult_volt_noise_slider_changed(self, event) -> None:
         self._change_mult_volt_noise(self._mult_volt_noise_slider.get())
 
+    def _noise_distribution_changed(self, distribution: str) -> None:
+        self._noise_generator = NoiseGenerator(distribution, seed=NOISE_SEED, channels=2)
+
     def _power_slider_changed(self, event) -> None:
         self._requested_power = self._power_slider.get()
         if not self._constant_power:
@@ -454,83 +630,122 @@ class Application:
     def _toggle_constant_power_switch(self) -> None:
         if self._constant_power_button.config("text")[-1] == "Change to constant power":
             self._constant_power = True
-            self._constant_power_label.configure(text="Currently using constant power")
+            self._renderer.set_text(self._constant_power_label, "Currently using constant power")
             self._constant_power_button.config(text="Change to variable power")
         else:
             self._constant_power = False
-            self._constant_power_label.config(text="Currently using variable power")
+            self._renderer.set_text(self._constant_power_label, "Currently using variable power")
             self._constant_power_button.config(text="Change to constant power")
 
     def _toggle_on_switch(self) -> None:
         if self._on_button.config("text")[-1] == "Turn on":
             self._requested_mode_is_on = True
-            self._on_label.configure(text=f"Currently on")
+            self._renderer.set_text(self._on_label, f"Currently on")
             self._on_button.config(text="Turn off")
-            self._power_supply.make_command(Commands.SET_CHANNEL_STATE, str(0))
+            self._power_supply.make_command(Commands.SET_CHANNEL_STATE, str(1))
         else:
             self._requested_mode_is_on = False
-            self._on_label.configure(text=f"Currently off")
+            self._renderer.set_text(self._on_label, f"Currently off")
             self._on_button.config(text="Turn on")
-            self._power_supply.make_command(Commands.SET_CHANNEL_STATE, str(1))
+            self._power_supply.make_command(Commands.SET_CHANNEL_STATE, str(0))
 
     def _toggle_protocol_switch(self) -> None:
-        # TODO - need to change this eventually to be EthernetProtocol and UsbProtocol
+        if self._connecting is not None:
+            return
         if self._protocol_button.config("text")[-1] == "Change to USB":
-            self._protocol_label.configure(text="Currently using USB")
-            self._protocol_button.config(text="Change to Ethernet")
-            self._power_supply = PowerSupply(protocol=UsbProtocol())
+            self._connect("USB", UsbProtocol, "Change to Ethernet")
         else:
-            self._protocol_label.config(text="Currently using Ethernet")
-            self._protocol_button.config(text="Change to USB")
-            self._power_supply = PowerSupply(protocol=EthernetProtocol())
+            self._connect("Ethernet", EthernetProtocol, "Change to USB")
+
+    def _stop_recording(self) -> None:
+        recorder = self._recorder
+        if recorder is None:
+            return
+        self._acquisition.recorder = None
+        self._recorder = None
+        recorder.close()
+
+    def _toggle_record_switch(self) -> None:
+        if self._record_button.config("text")[-1] == "Start recording":
+            path = filedialog.asksaveasfilename(
+                defaultextension=".psurec",
+                filetypes=[("Telemetry recording", "*.psurec")]
+            )
+            if not path:
+                return
+            self._recorder = TelemetryRecorder(path)
+            self._acquisition.recorder = self._recorder
+            self._renderer.set_text(self._record_label, "Recording")
+            self._record_button.config(text="Stop recording")
+        else:
+            self._stop_recording()
+            self._renderer.set_text(self._record_label, "Not recording")
+            self._record_button.config(text="Start recording")
 
     def _toggle_volt_curr_constant_switch(self) -> None:
         if self._volt_curr_constant_button.config("text")[-1] == "Change to constant current":
             self._constant_voltage = False
-            self._volt_curr_constant_label.configure(text="Currently using constant current")
+            self._renderer.set_text(self._volt_curr_constant_label, "Currently using constant current")
             self._volt_curr_constant_button.config(text="Change to constant voltage")
         else:
             self._constant_voltage = True
-            self._volt_curr_constant_label.config(text="Currently using constant voltage")
+            self._renderer.set_text(self._volt_curr_constant_label, "Currently using constant voltage")
             self._volt_curr_constant_button.config(text="Change to constant current")
 
     def _update_actual(self) -> None:
-        try:
-            self._actual_voltage = float(self._power_supply.make_command(Commands.GET_VOLTS))
-        except ValueError:
-            # falls here since make_command for debugging is not real
-            self._actual_voltage = round(random() * -1, 3)  # done for debugging purposes
-        self._actual_voltage_label.configure(text=f"Voltage: {round(self._actual_voltage, 3)} V")
-        try:
-            self._actual_current = float(self._power_supply.make_command(Commands.GET_CURR))
-        except ValueError:
-            # falls here since make_command for debugging is not real
-            self._actual_current = round(random() * -1, 3)  # done for debugging purposes
-        self._actual_current_label.configure(text=f"Current: {round(self._actual_current, 3)} A")
-        try:
-            self._actual_power = self._actual_voltage * self._actual_current
-        except ValueError:
-            # should no longer enter here
-            self._actual_power = 0
-        self._actual_power_label.configure(text=f"Power: {round(self._actual_power, 3)} W")
-        self._actual_mode = self._power_supply.make_command(Commands.GET_OUT_MODE)
-        self._actual_mode_label.configure(text=f"Mode: {self._actual_mode}")
-        self._app_window.after(100, self._update_actual)
+        sample = self._acquisition.samples.latest()
+        if sample is not None:
+            self._actual_voltage = sample.voltage
+            self._actual_current = sample.current
+            self._actual_power = sample.power
+            self._actual_mode = sample.mode
+        self._renderer.set_text(self._actual_voltage_label, f"Voltage: {round(self._actual_voltage, 3)} V")
+        self._renderer.set_text(self._actual_current_label, f"Current: {round(self._actual_current, 3)} A")
+        self._renderer.set_text(self._actual_power_label, f"Power: {round(self._actual_power, 3)} W")
+        self._renderer.set_text(self._actual_mode_label, f"Mode: {self._actual_mode}")
+        self._renderer.add_task(self._update_history)
+        self._app_window.after(RENDER_INTERVAL_MS, self._update_actual)
+
+    def _update_history(self) -> None:
+        samples = self._acquisition.samples
+        # Read once, so a sample appended in between is neither skipped nor drawn twice
+        count = samples.count
+        self._history_chart.add_samples(samples.since(self._history_count, count))
+        self._history_count = count
+        self._history_chart.redraw()
 
     def _update_noise(self) -> None:
-        if not self._requested_mode_is_on:
-            pass
-        elif self._noise_status.get() == "None":
-            pass
-        elif self._noise_status.get() == "Additive":
-            self._create_additive_noise()
-        elif self._noise_status.get() == "Multiplicative":
-            self._create_mult_noise()
-        self._app_window.after(100, self._update_noise)
+        if self._requested_mode_is_on and self._noise_status.get() != "None":
+            # One block from the generator per update instead of a row per write
+            rows = self._noise_generator.take(NOISE_ROWS_PER_UPDATE)
+            for index, (volt_noise, curr_noise) in enumerate(rows):
+                self._app_window.after(
+                    index * NOISE_INTERVAL_MS // len(rows), self._apply_noise, volt_noise, curr_noise
+                )
+        self._app_window.after(NOISE_INTERVAL_MS, self._update_noise)
     
+    def _update_profile_status(self) -> None:
+        player = self._profile_player
+        if player.running:
+            self._renderer.set_text(self._excel_label, f"Playing profile: {round(player.progress * 100)}%")
+            self._app_window.after(100, self._update_profile_status)
+            return
+        report = player.report
+        self._excel_button.config(text="Load excel data")
+        if report is None:
+            self._renderer.set_text(self._excel_label, "Profile stopped")
+            return
+        self._renderer.set_text(
+            self._excel_label,
+            f"Played {report.played}/{report.steps} steps, "
+            f"max late {round(report.max * 1000, 1)} ms, "
+            f"p95 {round(report.p95 * 1000, 1)} ms"
+        )
+
     def _update_power(self) -> None:
-        self._power_label.configure(
-            text=f"Power: {round(self._requested_voltage * self._requested_current, 3)} W"
+        self._renderer.set_text(
+            self._power_label,
+            f"Power: {round(self._requested_voltage * self._requested_current, 3)} W"
         )
 
     def _volt_res_hundredth(self) -> None:
@@ -563,6 +778,17 @@ class Application:
             self._change_volt(self._requested_voltage)
 
 
+
+def _close_connected(future: Future) -> None:
+    if future.exception() is None:
+        _close_protocol(future.result())
+
+
+def _close_protocol(protocol) -> None:
+    close = getattr(protocol, "close", None)
+    if close is not None:
+        close()
+
 def main():
     app = Application()
     app.run()
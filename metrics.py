@@ -0,0 +1,256 @@
+"""Per-command latency, byte and error metrics for PowerSupply.
+
+Pass a MetricsRegistry to PowerSupply(metrics=...) to time every exchange.
+Hooks added with MetricsRegistry.add_hook are called with each Observation,
+and PrometheusFileExporter writes the registry in the Prometheus text
+format (e.g. for the node_exporter textfile collector).
+"""
+import os
+import threading
+import time
+from array import array
+from typing import Callable, NamedTuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of latencies in the style of HdrHistogram.
+
+    Values are recorded as whole microseconds. Below 2**significant_bits
+    every value has its own bucket; above that each power of two is split
+    into 2**(significant_bits - 1) buckets, so any recorded value is off
+    by at most 1 / 2**(significant_bits - 1) (about 3% by default) while
+    the histogram stays a few hundred counters in size.
+    """
+
+    _counts: array
+
+    def __init__(self, significant_bits: int = 6) -> None:
+        self.significant_bits = significant_bits
+        self._sub_count = 1 << significant_bits
+        self._half = self._sub_count >> 1
+        self._counts = array("Q")
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.min = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = max(0, int(seconds * 1e6))
+        index = self._index(micros)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+        if self.count == 0 or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Returns the latency in seconds below which the given fraction of values fall"""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(fraction * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._upper_bound(index) / 1e6, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def _index(self, micros: int) -> int:
+        if micros < self._sub_count:
+            return micros
+        shift = micros.bit_length() - self.significant_bits
+        return self._sub_count + (shift - 1) * self._half + (micros >> shift) - self._half
+
+    def _upper_bound(self, index: int) -> int:
+        if index < self._sub_count:
+            return index
+        shift = (index - self._sub_count) // self._half + 1
+        mantissa = (index - self._sub_count) % self._half + self._half
+        return ((mantissa + 1) << shift) - 1
+
+
+class Observation(NamedTuple):
+    command: str
+    transport: str
+    seconds: float
+    bytes_sent: int
+    bytes_received: int
+    error: bool
+
+
+class CommandMetrics:
+    """Everything measured for one command on one transport"""
+
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.latency.count,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "mean": self.latency.mean,
+            "p50": self.latency.percentile(0.50),
+            "p95": self.latency.percentile(0.95),
+            "p99": self.latency.percentile(0.99),
+            "max": self.latency.max,
+        }
+
+
+class MetricsRegistry:
+    """Collects CommandMetrics per (command, transport) and calls hooks per observation.
+
+    name, label and description are what prometheus_text exports it as:
+    the metric name prefix, the name of the label after command and the
+    help text of the latency. Without traffic only the latency is
+    exported, for registries that never observe bytes or errors.
+    """
+
+    _metrics: dict
+    _hooks: list
+
+    def __init__(self, name: str = "psu_command", label: str = "transport",
+                 description: str = "Round trip time of a command, write to reply.", traffic: bool = True) -> None:
+        self.name = name
+        self.label = label
+        self.description = description
+        self.traffic = traffic
+        self._metrics = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable) -> None:
+        """Calls hook(observation) after every observed command"""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable) -> None:
+        self._hooks.remove(hook)
+
+    def observe(self, command: str, transport: str, seconds: float, bytes_sent: int = 0,
+                bytes_received: int = 0, error: bool = False) -> None:
+        with self._lock:
+            metrics = self._metrics.get((command, transport))
+            if metrics is None:
+                metrics = self._metrics[(command, transport)] = CommandMetrics()
+            metrics.latency.record(seconds)
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.errors += error
+        if self._hooks:
+            observation = Observation(command, transport, seconds, bytes_sent, bytes_received, error)
+            for hook in list(self._hooks):
+                hook(observation)
+
+    def items(self) -> list:
+        """Returns ((command, transport), CommandMetrics) pairs"""
+        with self._lock:
+            return sorted(self._metrics.items())
+
+    def summary(self) -> dict:
+        return {key: metrics.summary() for key, metrics in self.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+
+
+def prometheus_text(registry: MetricsRegistry, prefix: str = None) -> str:
+    """Renders the registry in the Prometheus text exposition format, named prefix or registry.name"""
+    prefix = registry.name if prefix is None else prefix
+    lines = [
+        f"# HELP {prefix}_latency_seconds {registry.description}",
+        f"# TYPE {prefix}_latency_seconds summary",
+    ]
+    items = registry.items()
+    for (command, transport), metrics in items:
+        labels = f'command="{_escape(command)}",{registry.label}="{_escape(transport)}"'
+        for quantile in QUANTILES:
+            lines.append(
+                f'{prefix}_latency_seconds{{{labels},quantile="{quantile}"}} '
+                f"{metrics.latency.percentile(quantile):.9f}"
+            )
+        lines.append(f"{prefix}_latency_seconds_sum{{{labels}}} {metrics.latency.total:.9f}")
+        lines.append(f"{prefix}_latency_seconds_count{{{labels}}} {metrics.latency.count}")
+    families = (
+        ("latency_max_seconds", "Slowest round trip of a command.", "gauge", lambda m: f"{m.latency.max:.9f}"),
+        ("bytes_sent_total", "Bytes written for a command.", "counter", lambda m: m.bytes_sent),
+        ("bytes_received_total", "Bytes read for a command.", "counter", lambda m: m.bytes_received),
+        ("errors_total", "Commands that failed or got no reply.", "counter", lambda m: m.errors),
+    )
+    for name, help_text, kind, value in families if registry.traffic else families[:1]:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for (command, transport), metrics in items:
+            labels = f'command="{_escape(command)}",{registry.label}="{_escape(transport)}"'
+            lines.append(f"{prefix}_{name}{{{labels}}} {value(metrics)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusFileExporter:
+    """Writes a MetricsRegistry to a Prometheus text file, replacing it atomically"""
+
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 15.0) -> None:
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def export(self) -> None:
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write(prometheus_text(self.registry))
+        os.replace(temporary_path, self.path)
+
+    def start(self) -> None:
+        """Exports every interval seconds on a background thread"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="psu-metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.export()
+
+
+class Stopwatch:
+    """Times one exchange and reports it to a registry"""
+
+    __slots__ = ("registry", "command", "transport", "start")
+
+    def __init__(self, registry: MetricsRegistry, command: str, transport: str) -> None:
+        self.registry = registry
+        self.command = command
+        self.transport = transport
+        self.start = time.perf_counter()
+
+    def done(self, bytes_sent: int, bytes_received: int, error: bool = False) -> None:
+        self.registry.observe(
+            self.command, self.transport, time.perf_counter() - self.start,
+            bytes_sent, bytes_received, error,
+        )
@@ -0,0 +1,104 @@
+import numpy as np
+
+DISTRIBUTIONS = ("uniform", "gaussian", "pink", "drift")
+
+# Every distribution is scaled to the standard deviation of uniform noise on
+# [-0.5, 0.5), so the noise sliders mean the same thing for each of them.
+_UNIT_STD = 1 / np.sqrt(12)
+
+
+class NoiseGenerator:
+    """Generates noise for one or more channels in NumPy blocks.
+
+    - uniform: independent samples on [-0.5, 0.5), like random() - 0.5
+    - gaussian: independent normal samples
+    - pink: 1/f noise (Voss-McCartney), which wanders more slowly than white
+    - drift: a random walk whose steps are gaussian samples
+
+    Samples are produced block_size rows at a time and handed out one row
+    (one value per channel) per next() call. Pink and drift noise carry
+    their state across blocks, so the stream is continuous. With the same
+    seed the same stream is produced, which makes perturbation runs
+    reproducible.
+    """
+
+    _block: np.ndarray
+    _position: int
+
+    def __init__(self, distribution: str = "uniform", seed: int = None, channels: int = 1,
+                 block_size: int = 1024, pink_rows: int = 16) -> None:
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+        self.distribution = distribution
+        self.seed = seed
+        self.channels = channels
+        self.block_size = block_size
+        self.pink_rows = pink_rows
+        self._rng = np.random.default_rng(seed)
+        self._samples_generated = 0
+        self._pink_state = self._rng.standard_normal((pink_rows, channels))
+        self._drift_state = np.zeros(channels)
+        self._block = np.empty((0, channels))
+        self._position = 0
+
+    def next(self) -> np.ndarray:
+        """Returns the next sample of every channel"""
+        if self._position == len(self._block):
+            self._block = self.generate(self.block_size)
+            self._position = 0
+        row = self._block[self._position]
+        self._position += 1
+        return row
+
+    def take(self, count: int) -> np.ndarray:
+        """Returns the next count samples as a (count, channels) array"""
+        rows = []
+        while count > 0:
+            if self._position == len(self._block):
+                self._block = self.generate(self.block_size)
+                self._position = 0
+            chunk = self._block[self._position:self._position + count]
+            self._position += len(chunk)
+            count -= len(chunk)
+            rows.append(chunk)
+        return np.concatenate(rows) if rows else np.empty((0, self.channels))
+
+    def generate(self, count: int) -> np.ndarray:
+        """Generates a fresh (count, channels) block, bypassing the buffered one"""
+        shape = (count, self.channels)
+        if self.distribution == "uniform":
+            block = self._rng.random(shape) - 0.5
+        elif self.distribution == "gaussian":
+            block = self._rng.standard_normal(shape) * _UNIT_STD
+        elif self.distribution == "pink":
+            block = self._pink(count)
+        else:
+            steps = self._rng.standard_normal(shape) * _UNIT_STD
+            block = self._drift_state + np.cumsum(steps, axis=0)
+            self._drift_state = block[-1].copy()
+        self._samples_generated += count
+        return block
+
+    def _pink(self, count: int) -> np.ndarray:
+        # Voss-McCartney: row k holds a random value that is redrawn every
+        # 2**k samples, and the sum of all rows plus white noise is pink.
+        index = self._samples_generated + np.arange(count)
+        total = self._rng.standard_normal((count, self.channels))
+        for row in range(self.pink_rows):
+            changes = (index & ((1 << row) - 1)) == 0
+            new_values = self._rng.standard_normal((int(changes.sum()), self.channels))
+            values = np.concatenate((self._pink_state[row][np.newaxis], new_values))
+            total += values[np.cumsum(changes)]
+            if len(new_values):
+                self._pink_state[row] = new_values[-1]
+        return total * (_UNIT_STD / np.sqrt(self.pink_rows + 1))
+
+
+def main():
+    generator = NoiseGenerator("pink", seed=0, channels=2)
+    block = generator.take(100000)
+    print(f"mean {block.mean(axis=0)}, std {block.std(axis=0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
+import errno
+import os
+import select
 import socket
+import threading
+import time
 from enum import Enum
+from typing import Callable
 
 import serial
 
+from metrics import MetricsRegistry, Stopwatch
+
 
 class CmdType(Enum):
     GET = 0
@@ -11,54 +19,257 @@ class CmdType(Enum):
 
 class ScpiCommand(object):
 
+    __slots__ = ("command", "type", "prefix", "decoder")
+
     command: str
     type: CmdType
+    # The command header already encoded for the wire, e.g. b"MEAS:VOLT?"
+    prefix: bytes
+    # Turns a reply into a typed value, or None to keep the stripped text
+    decoder: Callable
 
-    def __init__(self, cmd: str = "") -> None:
-        pass
+    def __init__(self, cmd: str = "", cmd_type: CmdType = CmdType.SET, decoder: Callable = None) -> None:
+        self.command = cmd
+        self.type = cmd_type
+        self.prefix = cmd.encode("ascii")
+        self.decoder = decoder
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.command!r})"
+
+    def decode(self, reply):
+        """Decodes a reply (str or bytes-like) to this command, raising ValueError if it does not parse"""
+        return decode_text(reply) if self.decoder is None else self.decoder(reply)
 
 
 class GetCmd(ScpiCommand):
-    command: str
-    type: CmdType
 
-    def __init__(self, cmd: str = "") -> None:
-        self.command = cmd
-        self.type = CmdType.GET
+    __slots__ = ()
+
+    def __init__(self, cmd: str = "", decoder: Callable = None) -> None:
+        super().__init__(cmd, CmdType.GET, decoder)
+
+
+class BlockCmd(GetCmd):
+    """A query answered with an IEEE 488.2 binary block, decoded into a NumPy array of dtype"""
+
+    __slots__ = ()
+
+    def __init__(self, cmd: str = "", dtype: str = ">f4") -> None:
+        super().__init__(cmd, block_decoder(dtype))
 
 
 class SetCmd(ScpiCommand):
-    command: str
-    type: CmdType
+
+    __slots__ = ()
 
     def __init__(self, cmd: str = "") -> None:
-        self.command = cmd
-        self.type = CmdType.SET
+        super().__init__(cmd, CmdType.SET)
+
+
+def decode_text(reply) -> str:
+    if not isinstance(reply, str):
+        reply = bytes(reply).decode("ascii", errors="replace")
+    return reply.strip()
+
+
+# Unit suffixes the instrument may append to numbers, longest first
+_UNIT_SCALES = (
+    ("OHM", 1.0), ("MV", 1e-3), ("UV", 1e-6), ("MA", 1e-3), ("UA", 1e-6), ("KW", 1e3), ("MW", 1e-3),
+    ("MS", 1e-3), ("US", 1e-6), ("V", 1.0), ("A", 1.0), ("W", 1.0), ("S", 1.0),
+)
+
+# SCPI sends 9.91E37 for "not a number"
+SCPI_NAN = 9.91e37
+
+
+def decode_number(reply) -> float:
+    """Parses a number such as 12.5, 1.25E+01, 12.5 V, 100ms, INF or the SCPI not-a-number value"""
+    text = decode_text(reply)
+    try:
+        value = float(text)
+    except ValueError:
+        text = text.upper()
+        scale = 1.0
+        for suffix, factor in _UNIT_SCALES:
+            if text.endswith(suffix):
+                text = text[:-len(suffix)]
+                scale = factor
+                break
+        value = float(text) * scale
+    return float("nan") if value == SCPI_NAN else value
+
+
+def decode_int(reply) -> int:
+    return int(decode_number(reply))
+
+
+def decode_bool(reply) -> bool:
+    text = decode_text(reply).upper()
+    if text in ("1", "ON"):
+        return True
+    if text in ("0", "OFF"):
+        return False
+    raise ValueError(f"not a boolean: {text!r}")
+
+
+def decode_string(reply) -> str:
+    """Decodes a quoted string reply, removing the quotes"""
+    text = decode_text(reply)
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        text = text[1:-1].replace(text[0] * 2, text[0])
+    return text
+
+
+def decode_error(reply) -> tuple:
+    """Decodes a '<code>,"<message>"' reply such as SYST:ERR? into (code, message)"""
+    code, _, message = decode_text(reply).partition(",")
+    return int(code), decode_string(message)
+
+
+def enum_decoder(*choices: str) -> Callable:
+    """Returns a decoder that accepts only the given (upper case) mnemonics"""
+    def decode_enum(reply) -> str:
+        text = decode_text(reply).upper()
+        if text not in choices:
+            raise ValueError(f"{text!r} is not one of {', '.join(choices)}")
+        return text
+    return decode_enum
+
+
+def list_decoder(item_decoder: Callable = decode_number) -> Callable:
+    """Returns a decoder for comma-separated replies that decodes every item"""
+    def decode_list(reply) -> list:
+        text = decode_text(reply)
+        return [item_decoder(item) for item in text.split(",")] if text else []
+    return decode_list
+
+
+def parse_block_header(data, start: int = 0) -> tuple:
+    """Returns (data offset, data length) of the IEEE 488.2 block #<n><length><data> at start.
+
+    The length is None for an indefinite-length block (#0), whose data
+    runs to the terminator.
+    """
+    if data[start:start + 1] != b"#" or len(data) < start + 2:
+        raise ValueError("not an IEEE 488.2 binary block")
+    digits = data[start + 1] - 48
+    if not 0 <= digits <= 9:
+        raise ValueError("bad IEEE 488.2 block header")
+    if digits == 0:
+        return start + 2, None
+    if len(data) < start + 2 + digits:
+        raise ValueError("truncated IEEE 488.2 block header")
+    return start + 2 + digits, int(bytes(data[start + 2:start + 2 + digits]))
+
+
+def block_decoder(dtype: str = ">f4") -> Callable:
+    """Returns a decoder that views an IEEE 488.2 binary block as a NumPy array without copying.
+
+    dtype defaults to big-endian float32, the instrument's REAL,32 format
+    with the normal byte order. Needs numpy.
+    """
+    def decode_block(reply):
+        import numpy
+        if isinstance(reply, str):
+            reply = reply.encode("latin-1")
+        offset, length = parse_block_header(reply)
+        item_size = numpy.dtype(dtype).itemsize
+        if length is None:
+            length = _trim_space(reply, offset, len(reply)) - offset
+        if offset + length > len(reply) or length % item_size:
+            raise ValueError("truncated IEEE 488.2 block")
+        return numpy.frombuffer(reply, dtype=dtype, count=length // item_size, offset=offset)
+    return decode_block
 
 
 class Commands():
     # TODO - Add more commands as desired
-    GET_VOLTS = GetCmd("MEAS:VOLT?")
+    GET_VOLTS = GetCmd("MEAS:VOLT?", decode_number)
     # TODO - For something like SET_VOLTS, maybe check that
     # arguments are between U-min=10V and U-max=75V
     # (otherwise, it will error according to the reference manual)
     # SIMILARLY, I-min is 5.0A and  I-max is 100.0A.
     SET_VOLTS = SetCmd("VOLT")
-    GET_CURR = GetCmd("MEAS:CURR?")
+    GET_CURR = GetCmd("MEAS:CURR?", decode_number)
     SET_CURR = SetCmd("CURR")
-    GET_OCP_STATE = GetCmd("CURR:PROT:STAT?")
+    GET_POWER = GetCmd("MEAS:POW?", decode_number)
+    SET_POWER = SetCmd("POW")
+    GET_OCP_STATE = GetCmd("CURR:PROT:STAT?", decode_bool)
     SET_OCP_STATE = SetCmd("CURR:PROT:STAT")
     SET_OCP_DELAY = SetCmd("CURR:PROT:DEL")
     GET_OUT_CHANNEL = GetCmd("INST?")
     SET_OUT_CHANNEL = SetCmd("INST CH")
-    GET_OUT_MODE = GetCmd("OUTP:MODE?")
+    GET_OUT_MODE = GetCmd("OUTP:MODE?", enum_decoder("CV", "CC", "CP", "OFF"))
     SET_CHANNEL_STATE = SetCmd("OUTP")
     RESET = SetCmd("*RST")
-    GET_ID_STRING = GetCmd("*IDN?")
-    EXEC_SELF_TEST_AND_GET_RESULT = GetCmd("*TST?")
-    GET_MORE_SELF_TEST_INFO = GetCmd("DIAG:TEST?")
+    GET_ID_STRING = GetCmd("*IDN?", list_decoder(decode_text))
+    EXEC_SELF_TEST_AND_GET_RESULT = GetCmd("*TST?", decode_int)
+    GET_MORE_SELF_TEST_INFO = GetCmd("DIAG:TEST?", decode_error)
     CLEAR = SetCmd("*CLS")
-    GET_EVENT_STATUS_REG = GetCmd("*ESR?")
+    GET_EVENT_STATUS_REG = GetCmd("*ESR?", decode_int)
+    SET_EVENT_STATUS_ENABLE = SetCmd("*ESE")
+    GET_EVENT_STATUS_ENABLE = GetCmd("*ESE?", decode_int)
+    SET_SERVICE_REQUEST_ENABLE = SetCmd("*SRE")
+    GET_SERVICE_REQUEST_ENABLE = GetCmd("*SRE?", decode_int)
+    GET_STATUS_BYTE = GetCmd("*STB?", decode_int)
+    # *OPC sets the operation complete event bit once pending operations
+    # finish, *OPC? answers "1" then, and *WAI holds later commands until then
+    SET_OPERATION_COMPLETE = SetCmd("*OPC")
+    GET_OPERATION_COMPLETE = GetCmd("*OPC?", decode_int)
+    WAIT_TO_CONTINUE = SetCmd("*WAI")
+    # List subsystem: the supply steps through uploaded setpoints itself
+    SET_LIST_VOLTS = SetCmd("LIST:VOLT")
+    GET_LIST_VOLTS = GetCmd("LIST:VOLT?", list_decoder())
+    SET_LIST_CURR = SetCmd("LIST:CURR")
+    GET_LIST_CURR = GetCmd("LIST:CURR?", list_decoder())
+    SET_LIST_DWELL = SetCmd("LIST:DWEL")
+    GET_LIST_DWELL = GetCmd("LIST:DWEL?", list_decoder())
+    SET_LIST_COUNT = SetCmd("LIST:COUN")
+    GET_LIST_COUNT = GetCmd("LIST:COUN?", decode_number)
+    SET_VOLT_MODE = SetCmd("VOLT:MODE")
+    GET_VOLT_MODE = GetCmd("VOLT:MODE?", enum_decoder("FIX", "LIST"))
+    SET_CURR_MODE = SetCmd("CURR:MODE")
+    GET_CURR_MODE = GetCmd("CURR:MODE?", enum_decoder("FIX", "LIST"))
+    SET_TRIGGER_SOURCE = SetCmd("TRIG:SOUR")
+    INITIATE = SetCmd("INIT")
+    TRIGGER = SetCmd("*TRG")
+    ABORT = SetCmd("ABOR")
+    GET_OPERATION_CONDITION = GetCmd("STAT:OPER:COND?", decode_int)
+    # Recent measurements as one IEEE 488.2 binary block of REAL,32 values,
+    # with the number of points as the argument
+    # TODO - Verify the array queries on our Power Supply
+    GET_VOLTS_ARRAY = BlockCmd("MEAS:ARR:VOLT?")
+    GET_CURR_ARRAY = BlockCmd("MEAS:ARR:CURR?")
+
+
+# Conservative size of the instrument's input buffer for one compound message
+MAX_MESSAGE_BYTES = 250
+
+# Output limits of the PS 9080-120 2U
+MAX_VOLTAGE = 80.0
+MAX_CURRENT = 120.0
+MAX_POWER = 3000.0
+
+# Standard event status register bits
+ESR_OPERATION_COMPLETE = 1 << 0
+ESR_QUERY_ERROR = 1 << 2
+ESR_DEVICE_ERROR = 1 << 3
+ESR_EXECUTION_ERROR = 1 << 4
+ESR_COMMAND_ERROR = 1 << 5
+ESR_ERRORS = ESR_QUERY_ERROR | ESR_DEVICE_ERROR | ESR_EXECUTION_ERROR | ESR_COMMAND_ERROR
+
+# Status byte bits
+STB_ERROR_QUEUE = 1 << 2
+STB_EVENT_STATUS = 1 << 5
+STB_MASTER_SUMMARY = 1 << 6
+
+# Operation status register bits for a running list and one waiting for *TRG
+OPER_SWEEPING = 1 << 3
+OPER_WAITING_FOR_TRIGGER = 1 << 5
+
+# Points the list subsystem holds
+MAX_LIST_POINTS = 256
 
 
 class Protocol(object):
@@ -67,94 +278,705 @@ class Protocol(object):
         pass
 
 
+class LineReader:
+    """Frames replies out of a byte stream using one reusable receive buffer.
+
+    fill(view, timeout) must read at most len(view) bytes into view, waiting
+    no longer than timeout seconds, and return how many bytes it read.
+    Replies split across several packets are joined, and replies that
+    arrived together are kept in the buffer for the following reads.
+    """
+
+    _buffer: bytearray
+    _start: int
+    _end: int
+
+    def __init__(self, fill: Callable, terminator: bytes = b"\n", buffer_size: int = 4096) -> None:
+        self.fill = fill
+        self.terminator = terminator
+        self._buffer = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+
+    def read_line(self, timeout: float = 2.0) -> bytes:
+        """Returns the next reply including its terminator.
+
+        Raises TimeoutError if no complete reply arrives within timeout
+        seconds, keeping any partial reply for the next call.
+        """
+        deadline = time.monotonic() + timeout
+        # Bytes after _start that were already searched, so that data is
+        # only scanned once however many packets a reply arrives in
+        searched = 0
+        while True:
+            found = self._buffer.find(self.terminator, self._start + searched, self._end)
+            if found >= 0:
+                stop = found + len(self.terminator)
+                line = bytes(self._buffer[self._start:stop])
+                self._start = stop
+                return line
+            searched = max(0, self._end - self._start - len(self.terminator) + 1)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"no complete reply within {timeout} s")
+            self._receive(remaining)
+
+    def read_block(self, timeout: float = 2.0) -> bytes:
+        """Returns the next reply as an IEEE 488.2 binary block, header included.
+
+        The data of a definite-length block (#<n><length><data>) may hold
+        terminator bytes, so it is read by its length rather than up to a
+        terminator; the terminator after it is consumed. A reply that is
+        not a definite-length block is read as a line.
+        """
+        deadline = time.monotonic() + timeout
+        self._wait_for(2, deadline, timeout)
+        buffer = self._buffer
+        start = self._start
+        if buffer[start] != ord("#") or buffer[start + 1] == ord("0"):
+            return self.read_line(max(0.0, deadline - time.monotonic()))
+        digits = buffer[start + 1] - 48
+        self._wait_for(2 + digits, deadline, timeout)
+        _, length = parse_block_header(self._buffer, self._start)
+        size = 2 + digits + length
+        self._wait_for(size + len(self.terminator), deadline, timeout)
+        start = self._start
+        block = bytes(self._buffer[start:start + size])
+        self._start = start + size
+        if self._buffer.startswith(self.terminator, self._start, self._end):
+            self._start += len(self.terminator)
+        return block
+
+    def clear(self) -> None:
+        """Drops any buffered data, e.g. after a reconnect"""
+        self._start = 0
+        self._end = 0
+
+    def _receive(self, timeout: float) -> None:
+        buffer = self._buffer
+        if self._start:
+            # Move the unread bytes to the front to make room at the end
+            pending = self._end - self._start
+            buffer[:pending] = buffer[self._start:self._end]
+            self._start = 0
+            self._end = pending
+        if self._end == len(buffer):
+            buffer.extend(bytes(len(buffer)))
+        with memoryview(buffer) as view:
+            self._end += self.fill(view[self._end:], timeout)
+
+    def _wait_for(self, count: int, deadline: float, timeout: float) -> None:
+        """Receives until at least count unread bytes are buffered"""
+        while self._end - self._start < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"no complete reply within {timeout} s")
+            self._receive(remaining)
+
+
+# Seconds a serial read timeout may differ from the time left before it is set again
+_TIMEOUT_TOLERANCE = 0.01
+
+
 class UsbProtocol(Protocol):
+    """SCPI over a serial port.
+
+    A read that times out raises TimeoutError. The reply may still arrive
+    afterwards, so the input is drained before the next write rather than
+    taken for the answer to the next query.
+    """
 
     # TODO - Verify that ports and baudrate are accurate
-    def __init__(self, port: str = "COM8", baudrate: int = 115200) -> None:
+    def __init__(self, port: str = "COM8", baudrate: int = 115200, timeout: float = 2.0) -> None:
+        self.timeout = timeout
+        self._reader = LineReader(self._fill)
+        # Set when a read timed out and a late reply may be on its way
+        self._stale = False
         try:
-            self.conn = serial.Serial(port=port, baudrate=baudrate)
+            self.conn = serial.Serial(port=port, baudrate=baudrate, timeout=timeout)
         except:
             pass
 
-    def write(self, msg: str = "") -> None:
+    def write(self, msg: bytes = b"") -> None:
         # TODO - Test that USB write works
         try:
+            if self._stale:
+                self._discard_input()
             self.conn.write(msg)
         except:
             pass
 
-    def read(self) -> str:
+    def read(self, timeout: float = None) -> bytes:
         # TODO - Test that USB read works
-        response = ""
+        return self._read(self._reader.read_line, timeout)
+
+    def read_block(self, timeout: float = None) -> bytes:
+        return self._read(self._reader.read_block, timeout)
+
+    def _read(self, read: Callable, timeout: float) -> bytes:
+        response = b""
         try:
-            response = self.conn.readline()
+            response = read(self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            self._stale = True
+            raise
         except:
             pass
         return response
 
-    def __del__(self):
+    def _discard_input(self, quiet_time: float = 0.1) -> None:
+        """Reads and drops input until the line has been quiet for quiet_time"""
+        self._stale = False
+        self._reader.clear()
+        self.conn.timeout = quiet_time
+        deadline = time.monotonic() + max(self.timeout, quiet_time) * 2
+        while self.conn.read(4096) and time.monotonic() < deadline:
+            pass
+        self.conn.reset_input_buffer()
+
+    def _fill(self, view: memoryview, timeout: float) -> int:
+        # Take everything that already arrived in one call, or wait for at
+        # least one byte. Asking for more than is waiting would block until
+        # the serial timeout.
+        waiting = self.conn.in_waiting
+        if waiting:
+            return self.conn.readinto(view[:min(waiting, len(view))]) or 0
+        # pyserial reconfigures the port on every timeout assignment, so keep
+        # the current one unless it is more than _TIMEOUT_TOLERANCE off the
+        # time left; the deadline is then overrun by at most that much
+        current = self.conn.timeout
+        if current is None or abs(current - timeout) > _TIMEOUT_TOLERANCE:
+            self.conn.timeout = timeout
+        return self.conn.readinto(view[:1]) or 0
+
+    def close(self) -> None:
         try:
             self.conn.close()
         except:
             pass
 
+    def __del__(self):
+        self.close()
+
+
+class PowerSupplyConnectionError(ConnectionError):
+    """Raised when the link to the instrument is lost and cannot be restored"""
+
 
 class EthernetProtocol(Protocol):
+    """SCPI over a raw TCP socket.
+
+    The socket disables Nagle's algorithm (TCP_NODELAY) so that small
+    commands are sent immediately, and enables TCP keepalive. A write on a
+    dropped link reconnects with exponential backoff, and a link that was
+    idle for health_check_interval seconds is checked with *OPC? before
+    it is used again. When the link cannot be restored, or is lost while
+    waiting for a reply, PowerSupplyConnectionError is raised. A read that
+    times out raises TimeoutError and closes the connection, since the
+    late reply would otherwise answer the next query; the next write
+    reconnects.
+    """
 
     # TODO - Verify that IP is accurate (192.168.0.2 is usually the default ip)
     # According to the reference manual, the standard port is 5025
-    def __init__(self, ip: str = "192.168.0.2", port: int = 5025) -> None:
+    def __init__(self, ip: str = "192.168.0.2", port: int = 5025, timeout: float = 2.0,
+                 connect_timeout: float = 3.0, reconnect_attempts: int = 3, backoff: float = 0.1,
+                 max_backoff: float = 2.0, health_check_interval: float = 30.0) -> None:
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.health_check_interval = health_check_interval
+        self.s = None
+        self._reader = LineReader(self._fill)
+        self._last_used = 0.0
+        self.connect()
+
+    def connect(self) -> None:
+        self.close()
         try:
-            self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            # TODO - COMMENTED OUT TEMPORARILY BECAUSE PROGRAM GETS STUCK ON THIS
-            # self.s.connect((ip, port))
-        except:
-            pass
-
-    def write(self, msg: str = "") -> None:
-        # TODO - Test that Ethernet write works
+            self.s = _open_socket(self.ip, self.port, self.connect_timeout)
+        except OSError as error:
+            raise PowerSupplyConnectionError(
+                f"could not connect to {self.ip}:{self.port}: {error}"
+            ) from error
+        self._reader.clear()
+        self._last_used = time.monotonic()
+
+    def reconnect(self) -> None:
+        """Reconnects with exponential backoff, raising PowerSupplyConnectionError if every attempt fails"""
+        delay = self.backoff
+        for attempt in range(self.reconnect_attempts):
+            try:
+                self.connect()
+                return
+            except PowerSupplyConnectionError:
+                if attempt == self.reconnect_attempts - 1:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+
+    def write(self, msg: bytes = b"") -> None:
+        if self.s is None:
+            self.reconnect()
+        elif time.monotonic() - self._last_used > self.health_check_interval and not self._is_healthy():
+            self.reconnect()
         try:
             self.s.sendall(msg)
-        except:
-            pass
-
-    def read(self) -> str:
-        # TODO - Test that Ethernet read works
-        response = ""
+        except OSError:
+            # The link dropped since the last exchange. Nothing of this
+            # message was answered yet, so it is safe to send it again.
+            self.reconnect()
+            try:
+                self.s.sendall(msg)
+            except OSError as error:
+                self.close()
+                raise PowerSupplyConnectionError(f"lost connection to {self.ip}:{self.port}") from error
+        self._last_used = time.monotonic()
+
+    def read(self, timeout: float = None) -> bytes:
+        return self._read(self._reader.read_line, timeout)
+
+    def read_block(self, timeout: float = None) -> bytes:
+        return self._read(self._reader.read_block, timeout)
+
+    def _read(self, read: Callable, timeout: float) -> bytes:
+        if self.s is None:
+            raise PowerSupplyConnectionError(f"not connected to {self.ip}:{self.port}")
         try:
-            response = self.s.recv()
-        except:
-            pass
+            response = read(self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            self.close()
+            raise
+        except OSError as error:
+            self.close()
+            raise PowerSupplyConnectionError(f"lost connection to {self.ip}:{self.port}") from error
+        self._last_used = time.monotonic()
         return response
 
-    def __del__(self):
+    def close(self) -> None:
+        if self.s is not None:
+            try:
+                self.s.close()
+            except OSError:
+                pass
+            self.s = None
+
+    def _is_healthy(self) -> bool:
         try:
-            self.s.close()
-        except:
-            pass
+            self.s.sendall(b"*OPC?\n")
+            return self._reader.read_line(self.timeout).strip() == b"1"
+        except OSError:
+            return False
+
+    def _fill(self, view: memoryview, timeout: float) -> int:
+        self.s.settimeout(timeout)
+        try:
+            received = self.s.recv_into(view)
+        except socket.timeout:
+            return 0
+        if received == 0:
+            raise ConnectionResetError("connection closed by the instrument")
+        return received
+
+    def __del__(self):
+        self.close()
+
+
+def _open_socket(ip: str, port: int, timeout: float) -> socket.socket:
+    """Connects without blocking for longer than timeout and sets low-latency options"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", 10), ("TCP_KEEPINTVL", 5), ("TCP_KEEPCNT", 3)):
+            if hasattr(socket, option):
+                s.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        s.setblocking(False)
+        error = s.connect_ex((ip, port))
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            raise OSError(error, os.strerror(error))
+        if error != 0:
+            _, writable, _ = select.select([], [s], [], timeout)
+            if not writable:
+                raise socket.timeout(f"timed out after {timeout} s")
+            error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error != 0:
+                raise OSError(error, os.strerror(error))
+        s.setblocking(True)
+        return s
+    except OSError:
+        s.close()
+        raise
 
 class DebugProtocol(Protocol):
 
     def __init__(self) -> None:
         pass
 
-    def write(self, msg: str = "") -> None:
-        print(msg)
+    def write(self, msg: bytes = b"") -> None:
+        print(bytes(msg).decode(errors="replace"))
+
+    def read(self, timeout: float = None) -> bytes:
+        return b"READ DEBUG\n"
+
+    def read_block(self, timeout: float = None) -> bytes:
+        return b"#10"
 
-    def read(self) -> str:
-        return "READ DEBUG\n"
+
+class CommandEncoder:
+    """Encodes commands into one reusable bytearray.
+
+    The returned buffer is overwritten by the next encode call, so it must
+    be written to the transport before encoding again.
+    """
+
+    _buffer: bytearray
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def encode(self, scpi_command: ScpiCommand, arg_0="", arg_1="") -> bytearray:
+        buffer = self._buffer
+        buffer.clear()
+        self._append(buffer, scpi_command, arg_0, arg_1)
+        buffer += b"\n"
+        return buffer
+
+    def encode_compound(self, entries: list) -> bytearray:
+        """Encodes (ScpiCommand, arg_0, arg_1) entries into one ';'-separated message"""
+        buffer = self._buffer
+        buffer.clear()
+        for index, entry in enumerate(entries):
+            if index:
+                buffer += b";"
+                # Every command after the first is rooted with a leading colon
+                # so that a previous header (e.g. MEAS:VOLT?) does not change
+                # how it is parsed. Common commands (*RST, ...) always are.
+                if not entry[0].prefix.startswith(b"*"):
+                    buffer += b":"
+            self._append(buffer, *entry)
+        buffer += b"\n"
+        return buffer
+
+    @staticmethod
+    def _append(buffer: bytearray, scpi_command: ScpiCommand, arg_0="", arg_1="") -> None:
+        buffer += scpi_command.prefix
+        for arg in (arg_0, arg_1):
+            if isinstance(arg, bool):
+                buffer += b" 1" if arg else b" 0"
+            elif isinstance(arg, int):
+                buffer += b" %d" % arg
+            elif isinstance(arg, float):
+                buffer += b" %.10g" % arg
+            elif isinstance(arg, (bytes, bytearray)):
+                if arg:
+                    buffer += b" "
+                    buffer += arg
+            elif arg is not None and arg != "":
+                buffer += b" "
+                buffer += str(arg).encode("ascii")
+
+
+def split_reply(reply) -> list:
+    """Splits a compound reply into memoryview fields without copying.
+
+    Surrounding whitespace and the terminator are excluded from each field.
+    """
+    view = memoryview(reply)
+    fields = []
+    start = 0
+    end = len(reply)
+    while True:
+        separator = reply.find(b";", start)
+        stop = end if separator < 0 else separator
+        fields.append(view[_skip_space(reply, start, stop):_trim_space(reply, start, stop)])
+        if separator < 0:
+            return fields
+        start = separator + 1
+
+
+def _skip_space(data, start: int, stop: int) -> int:
+    while start < stop and data[start] in b" \t\r\n":
+        start += 1
+    return start
+
+
+def _trim_space(data, start: int, stop: int) -> int:
+    while stop > start and data[stop - 1] in b" \t\r\n":
+        stop -= 1
+    return stop
+
+
+class QueryCache:
+    """Caches the replies of slow-changing queries inside a PowerSupply.
+
+    ttls maps each cacheable GetCmd to how many seconds its reply stays
+    valid (None keeps it until it is invalidated). invalidations maps a
+    SetCmd to the queries whose cached replies it makes stale, and the
+    commands in clear_all (RESET by default) drop the whole cache.
+    Queries that are not in ttls, such as measurements, are never cached.
+    """
+
+    DEFAULT_TTLS = {
+        Commands.GET_ID_STRING: None,
+        Commands.GET_OUT_CHANNEL: None,
+        Commands.GET_OCP_STATE: None,
+        Commands.GET_OUT_MODE: 0.5,
+    }
+
+    DEFAULT_INVALIDATIONS = {
+        # Changing the channel changes what every channel-specific query answers
+        Commands.SET_OUT_CHANNEL: (Commands.GET_OUT_CHANNEL, Commands.GET_OCP_STATE, Commands.GET_OUT_MODE),
+        Commands.SET_OCP_STATE: (Commands.GET_OCP_STATE,),
+        Commands.SET_CHANNEL_STATE: (Commands.GET_OUT_MODE,),
+        Commands.SET_VOLTS: (Commands.GET_OUT_MODE,),
+        Commands.SET_CURR: (Commands.GET_OUT_MODE,),
+        Commands.INITIATE: (Commands.GET_OUT_MODE,),
+        Commands.TRIGGER: (Commands.GET_OUT_MODE,),
+        Commands.ABORT: (Commands.GET_OUT_MODE,),
+    }
+
+    DEFAULT_CLEAR_ALL = (Commands.RESET,)
+
+    ttls: dict
+    invalidations: dict
+    hits: int
+    misses: int
+    invalidated: int
+
+    def __init__(self, ttls: dict = None, invalidations: dict = None, clear_all: tuple = None) -> None:
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.invalidations = dict(self.DEFAULT_INVALIDATIONS if invalidations is None else invalidations)
+        self.clear_all = frozenset(self.DEFAULT_CLEAR_ALL if clear_all is None else clear_all)
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._entries = {}
+
+    def is_cacheable(self, scpi_command: ScpiCommand) -> bool:
+        return scpi_command in self.ttls
+
+    def get(self, scpi_command: ScpiCommand, arg_0="", arg_1=""):
+        """Returns the cached reply, or None on a miss"""
+        if scpi_command not in self.ttls:
+            return None
+        entry = self._entries.get((scpi_command, arg_0, arg_1))
+        if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, scpi_command: ScpiCommand, reply, arg_0="", arg_1="") -> None:
+        """Caches reply unless it is empty or does not decode, e.g. after a failed read"""
+        if scpi_command not in self.ttls:
+            return
+        try:
+            if not decode_text(reply):
+                return
+            scpi_command.decode(reply)
+        except ValueError:
+            return
+        ttl = self.ttls[scpi_command]
+        expires = None if ttl is None else time.monotonic() + ttl
+        self._entries[(scpi_command, arg_0, arg_1)] = (reply, expires)
+
+    def invalidate_for(self, scpi_command: ScpiCommand) -> None:
+        """Drops the cached replies made stale by sending scpi_command"""
+        if scpi_command in self.clear_all:
+            self.invalidated += len(self._entries)
+            self._entries.clear()
+            return
+        stale = self.invalidations.get(scpi_command)
+        if not stale:
+            return
+        for key in [key for key in self._entries if key[0] in stale]:
+            del self._entries[key]
+            self.invalidated += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
 
 
 class PowerSupply:
     
-    def __init__(self, protocol: Protocol = UsbProtocol) -> None:
+    def __init__(self, protocol: Protocol = UsbProtocol, cache: QueryCache = None,
+                 metrics: MetricsRegistry = None) -> None:
         self.protocol = protocol
+        self.cache = cache
+        self.metrics = metrics
+        self._encoder = CommandEncoder()
+        # Held for each complete exchange so that threads sharing the
+        # connection never interleave writes or take each other's replies
+        self._lock = threading.RLock()
 
     def make_command(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "") -> str:
-        self.protocol.write(f"{scpi_command.command} {arg_0} {arg_1}\n")
-        if scpi_command.type == CmdType.SET:
-            return ""
-        return self.protocol.read()
+        with self._lock:
+            cache = self.cache
+            if cache is not None and scpi_command.type == CmdType.GET:
+                cached = cache.get(scpi_command, arg_0, arg_1)
+                if cached is not None:
+                    return cached
+            reply = self.make_command_raw(scpi_command, arg_0, arg_1)
+            if isinstance(reply, (bytes, bytearray)):
+                reply = reply.decode(errors="replace")
+            if cache is not None and scpi_command.type == CmdType.GET:
+                cache.put(scpi_command, reply, arg_0, arg_1)
+            return reply
+
+    def make_command_raw(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "",
+                         timeout: float = None) -> bytes:
+        """Same as make_command but returns the reply as the transport's raw bytes, bypassing the cache.
+
+        timeout overrides how long the transport waits for the reply.
+        """
+        with self._lock:
+            reply = self._exchange(
+                scpi_command.command,
+                self._encoder.encode(scpi_command, arg_0, arg_1),
+                scpi_command.type == CmdType.GET,
+                timeout,
+                block=isinstance(scpi_command, BlockCmd),
+            )
+            if scpi_command.type == CmdType.SET and self.cache is not None:
+                self.cache.invalidate_for(scpi_command)
+            return reply
+
+    def make_commands(self, commands: list, timeout: float = None) -> list:
+        """Sends several commands as one compound message and returns one result per command.
+
+        Each entry of commands is either a ScpiCommand or a tuple of
+        (ScpiCommand, arg_0, arg_1) with the args optional. SET commands
+        get "" as their result, the same as make_command. timeout
+        overrides how long the transport waits for the reply.
+        """
+        with self._lock:
+            if not commands:
+                return []
+            entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+            results = self._cached_results(entries)
+            to_send = [entry for entry, result in zip(entries, results) if result is None]
+            if not to_send:
+                return results
+            queries = [entry for entry in to_send if entry[0].type == CmdType.GET]
+            reply = self._exchange(
+                ";".join(entry[0].command for entry in to_send),
+                self._encoder.encode_compound(to_send),
+                bool(queries),
+                timeout,
+            )
+            replies = _split_compound_reply(reply, len(queries)) if queries else []
+            # A query answered before a SET later in the same message may
+            # already be stale, so only the ones after the last SET are cached
+            last_set = max((index for index, entry in enumerate(entries) if entry[0].type == CmdType.SET),
+                           default=-1)
+            for index, entry in enumerate(entries):
+                if results[index] is not None:
+                    continue
+                if entry[0].type == CmdType.SET:
+                    results[index] = ""
+                    continue
+                results[index] = replies.pop(0)
+                if self.cache is not None and index > last_set:
+                    self.cache.put(entry[0], results[index], *entry[1:])
+            return results
+
+    def query(self, scpi_command: GetCmd, arg_0: str = "", arg_1: str = ""):
+        """Runs a query and returns its reply decoded by the command's decoder.
+
+        Raises ValueError if the reply does not parse, e.g. because the
+        transport returned nothing.
+        """
+        if isinstance(scpi_command, BlockCmd):
+            return scpi_command.decode(self.make_command_raw(scpi_command, arg_0, arg_1))
+        return scpi_command.decode(self.make_command(scpi_command, arg_0, arg_1))
+
+    def query_all(self, commands: list) -> list:
+        """Runs several queries in one round trip (see make_commands) and decodes every reply.
+
+        Replies that do not parse are returned as None.
+        """
+        entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+        values = []
+        for entry, reply in zip(entries, self.make_commands(entries)):
+            try:
+                values.append(entry[0].decode(reply) if entry[0].type == CmdType.GET else None)
+            except ValueError:
+                values.append(None)
+        return values
+
+    def _exchange(self, label: str, message, expects_reply: bool, timeout: float = None, block: bool = False):
+        """Writes message, reads the reply if one is expected, and records metrics when enabled"""
+        if self.metrics is None:
+            self.protocol.write(message)
+            return self._read(timeout, block) if expects_reply else b""
+        stopwatch = Stopwatch(self.metrics, label, type(self.protocol).__name__)
+        sent = len(message)
+        try:
+            self.protocol.write(message)
+            reply = self._read(timeout, block) if expects_reply else b""
+        except Exception:
+            stopwatch.done(sent, 0, error=True)
+            raise
+        # Transports that swallow their errors answer with an empty reply
+        stopwatch.done(sent, len(reply), error=expects_reply and not reply)
+        return reply
+
+    def _read(self, timeout: float = None, block: bool = False):
+        if block:
+            return self.protocol.read_block(timeout)
+        # Only pass a timeout when one is given, so transports whose read
+        # takes no arguments keep working
+        return self.protocol.read() if timeout is None else self.protocol.read(timeout)
+
+    def _cached_results(self, entries: list) -> list:
+        """Returns the cached reply of each entry, or None for entries that must be sent.
+
+        Entries are walked in order so that a query following a SET that
+        invalidates it within the same batch is sent rather than served.
+        """
+        if self.cache is None:
+            return [None] * len(entries)
+        results = []
+        for entry in entries:
+            if entry[0].type == CmdType.SET:
+                self.cache.invalidate_for(entry[0])
+                results.append(None)
+            else:
+                cached = self.cache.get(*entry)
+                results.append(None if cached is None else cached.strip())
+        return results
+
+
+def _split_compound_reply(reply, count: int) -> list:
+    """Splits the reply to a compound query into count separate results.
+
+    The instrument leaves out the reply to a query that fails, so when the
+    number of fields is not count there is no telling which field answers
+    which query. Every result is then empty, i.e. failed.
+    """
+    if isinstance(reply, (bytes, bytearray)):
+        reply = reply.decode(errors="replace")
+    if count == 1:
+        return [reply.strip()]
+    parts = [part.strip() for part in reply.strip().split(";")]
+    if len(parts) != count:
+        return [""] * count
+    return parts
 
 
 def example_usage_one():
@@ -0,0 +1,161 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable
+
+from power_supply import Commands, DebugProtocol, PowerSupply, ScpiCommand
+
+
+class GroupResult:
+    """Outcome of one operation on one power supply of a group"""
+
+    name: str
+    value: object
+    error: Exception
+    timestamp: float
+    duration: float
+
+    def __init__(self, name: str, value: object = None, error: Exception = None,
+                 timestamp: float = 0.0, duration: float = 0.0) -> None:
+        self.name = name
+        self.value = value
+        self.error = error
+        self.timestamp = timestamp
+        self.duration = duration
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        if self.ok:
+            return f"GroupResult({self.name!r}, value={self.value!r}, timestamp={self.timestamp:.6f})"
+        return f"GroupResult({self.name!r}, error={self.error!r})"
+
+
+class PowerSupplyGroup:
+    """Drives several power supplies concurrently through a worker pool.
+
+    Each supply keeps its own persistent connection. An operation is run on
+    every supply at once, so a call takes as long as the slowest supply
+    rather than the sum of all of them. A failing supply is reported in its
+    GroupResult and does not stop the others.
+
+    Each supply is only ever used by one worker at a time: while a call
+    that missed its timeout is still running on a supply, later calls skip
+    that supply and report it as busy rather than interleave their I/O
+    with the abandoned call. The group itself should be driven from a
+    single thread.
+    """
+
+    _power_supplies: dict
+    _executor: ThreadPoolExecutor
+    _running: dict
+
+    def __init__(self, power_supplies: dict, max_workers: int = None) -> None:
+        self._power_supplies = dict(power_supplies)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(1, len(self._power_supplies)),
+            thread_name_prefix="psu-group",
+        )
+        # The last future submitted per supply
+        self._running = {}
+
+    @property
+    def names(self) -> list:
+        return list(self._power_supplies)
+
+    def __getitem__(self, name: str) -> PowerSupply:
+        return self._power_supplies[name]
+
+    def __len__(self) -> int:
+        return len(self._power_supplies)
+
+    def run_all(self, func: Callable, timeout: float = None) -> dict:
+        """Calls func(power_supply) for every supply concurrently and returns a GroupResult per name.
+
+        A supply that misses the timeout is reported as failed, but its call
+        keeps running in the background until the supply answers. Until then
+        the supply is reported as busy instead of being called again.
+        """
+        futures = {}
+        results = {}
+        for name, power_supply in self._power_supplies.items():
+            running = self._running.get(name)
+            if running is not None and not running.done():
+                results[name] = GroupResult(
+                    name, error=RuntimeError(f"{name} is still busy with a call that timed out")
+                )
+                continue
+            futures[name] = self._running[name] = self._executor.submit(_timed_call, name, func, power_supply)
+        wait(futures.values(), timeout=timeout)
+        for name, future in futures.items():
+            if future.done():
+                results[name] = future.result()
+            else:
+                results[name] = GroupResult(name, error=TimeoutError(f"{name} did not answer within {timeout} s"))
+        return {name: results[name] for name in self._power_supplies}
+
+    def set_all(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "",
+                timeout: float = None) -> dict:
+        """Applies the same setpoint to every supply"""
+        return self.run_all(
+            lambda power_supply: power_supply.make_command(scpi_command, arg_0, arg_1),
+            timeout=timeout,
+        )
+
+    def measure_all(self, commands: list = None, timeout: float = None) -> dict:
+        """Runs the given queries on every supply in one round trip each.
+
+        The value of each GroupResult is the list of replies, in the order of
+        commands. By default voltage, current and output mode are measured.
+        """
+        if commands is None:
+            commands = [Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]
+        return self.run_all(
+            lambda power_supply: power_supply.make_commands(commands),
+            timeout=timeout,
+        )
+
+    def close(self) -> None:
+        """Closes every supply's connection without waiting for calls still running.
+
+        Queued calls are cancelled, and closing the connections ends calls
+        stuck waiting on a supply that stopped answering.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for power_supply in self._power_supplies.values():
+            close = getattr(power_supply.protocol, "close", None)
+            if close is not None:
+                close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _timed_call(name: str, func: Callable, power_supply: PowerSupply) -> GroupResult:
+    start = time.monotonic()
+    try:
+        value = func(power_supply)
+    except Exception as error:
+        return GroupResult(name, error=error, timestamp=time.time(), duration=time.monotonic() - start)
+    return GroupResult(name, value=value, timestamp=time.time(), duration=time.monotonic() - start)
+
+
+def example_group_usage():
+    """Sets the voltage of several supplies at once and measures them"""
+    power_supplies = {f"psu{index}": PowerSupply(protocol=DebugProtocol()) for index in range(3)}
+    with PowerSupplyGroup(power_supplies) as group:
+        group.set_all(Commands.SET_VOLTS, 10.0)
+        for result in group.measure_all().values():
+            print(result)
+
+
+def main():
+    example_group_usage()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Plays voltage/current/power profiles from CSV or Excel on a PowerSupply.
+
+A profile file has a header row with a time column (seconds from the start)
+and any of voltage, current and power columns, e.g.
+
+    time,voltage,current
+    0,5,10
+    0.5,10,10
+
+Run `python3 profile_player.py profile.csv` to play one on the DebugProtocol.
+"""
+import argparse
+import csv
+import threading
+import time
+from array import array
+
+from power_supply import MAX_CURRENT, MAX_POWER, MAX_VOLTAGE, Commands, DebugProtocol, PowerSupply
+
+_COLUMN_PREFIXES = {"time": "time", "volt": "voltage", "curr": "current", "pow": "power"}
+
+
+class Profile:
+    """Timeline of setpoints, precomputed into flat arrays.
+
+    times are seconds from the start of the profile. voltages and currents
+    hold the setpoint per step, or are None when the profile does not set
+    them. A power column is turned into currents up front (I = P / V), so
+    nothing is computed during playback.
+    """
+
+    times: array
+    voltages: array
+    currents: array
+
+    def __init__(self, times: list, voltages: list = None, currents: list = None, powers: list = None) -> None:
+        if not times:
+            raise ValueError("a profile needs at least one step")
+        order = sorted(range(len(times)), key=lambda index: times[index])
+        start = times[order[0]]
+        self.times = array("d", (times[index] - start for index in order))
+        self.voltages = None if voltages is None else array("d", (voltages[index] for index in order))
+        if currents is None and powers is not None:
+            if self.voltages is None:
+                raise ValueError("a power column needs a voltage column")
+            currents = [
+                min(power / voltage, MAX_CURRENT) if voltage > 0 else 0.0
+                for power, voltage in zip(powers, voltages)
+            ]
+        self.currents = None if currents is None else array("d", (currents[index] for index in order))
+        self._check_limits()
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1]
+
+    def steps(self) -> list:
+        """Returns the commands to send at each step, as entries for PowerSupply.make_commands"""
+        steps = []
+        for index in range(len(self.times)):
+            entries = []
+            if self.voltages is not None:
+                entries.append((Commands.SET_VOLTS, self.voltages[index]))
+            if self.currents is not None:
+                entries.append((Commands.SET_CURR, self.currents[index]))
+            steps.append(entries)
+        return steps
+
+    def _check_limits(self) -> None:
+        if self.voltages is not None and not all(0 <= value <= MAX_VOLTAGE for value in self.voltages):
+            raise ValueError(f"profile voltages must be between 0 and {MAX_VOLTAGE} V")
+        if self.currents is not None and not all(0 <= value <= MAX_CURRENT for value in self.currents):
+            raise ValueError(f"profile currents must be between 0 and {MAX_CURRENT} A")
+        if self.voltages is not None and self.currents is not None:
+            for voltage, current in zip(self.voltages, self.currents):
+                if voltage * current > MAX_POWER:
+                    raise ValueError(f"profile power must not exceed {MAX_POWER} W")
+
+
+def load_profile(path: str) -> Profile:
+    """Loads a profile from a .csv file or an Excel (.xlsx) file"""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        rows = _read_xlsx_rows(path)
+    else:
+        with open(path, newline="") as file:
+            rows = list(csv.reader(file))
+    return _profile_from_rows(rows)
+
+
+def _read_xlsx_rows(path: str) -> list:
+    try:
+        from openpyxl import load_workbook
+    except ImportError as error:
+        raise RuntimeError("Excel profiles need openpyxl (pip install openpyxl)") from error
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+def _profile_from_rows(rows: list) -> Profile:
+    # Row numbers as in the file, for error messages
+    rows = [(number, row) for number, row in enumerate(rows, start=1)
+            if row and any(cell not in (None, "") for cell in row)]
+    if not rows:
+        raise ValueError("the profile is empty")
+    columns = {}
+    for index, name in enumerate(rows[0][1]):
+        name = str(name or "").strip().lower()
+        for prefix, column in _COLUMN_PREFIXES.items():
+            if name.startswith(prefix) and column not in columns:
+                columns[column] = index
+    if "time" not in columns:
+        raise ValueError("the profile needs a time column")
+    if len(columns) == 1:
+        raise ValueError("the profile needs a voltage, current or power column")
+    values = {column: [] for column in columns}
+    for number, row in rows[1:]:
+        for column, index in columns.items():
+            values[column].append(_cell_value(number, row, index, column))
+    return Profile(
+        values["time"],
+        voltages=values.get("voltage"),
+        currents=values.get("current"),
+        powers=values.get("power"),
+    )
+
+
+def _cell_value(number: int, row: list, index: int, column: str) -> float:
+    cell = row[index] if index < len(row) else None
+    if cell is None or str(cell).strip() == "":
+        raise ValueError(f"row {number}: the {column} cell is empty")
+    try:
+        return float(cell)
+    except (TypeError, ValueError):
+        raise ValueError(f"row {number}: {column} {cell!r} is not a number") from None
+
+
+class JitterReport:
+    """Achieved versus scheduled timing of a playback"""
+
+    def __init__(self, lateness: array, steps: int, end_error: float) -> None:
+        ordered = sorted(lateness)
+        self.steps = steps
+        self.played = len(ordered)
+        self.mean = sum(ordered) / len(ordered) if ordered else 0.0
+        self.max = ordered[-1] if ordered else 0.0
+        self.p50 = _percentile(ordered, 0.50)
+        self.p95 = _percentile(ordered, 0.95)
+        self.p99 = _percentile(ordered, 0.99)
+        self.end_error = end_error
+
+    def __str__(self) -> str:
+        return (
+            f"{self.played}/{self.steps} steps, lateness mean {self.mean * 1000:.2f} ms, "
+            f"p50 {self.p50 * 1000:.2f} ms, p95 {self.p95 * 1000:.2f} ms, "
+            f"p99 {self.p99 * 1000:.2f} ms, max {self.max * 1000:.2f} ms, "
+            f"end error {self.end_error * 1000:.2f} ms"
+        )
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ProfilePlayer:
+    """Plays a Profile on a PowerSupply against absolute monotonic deadlines.
+
+    Every step is due at start + its profile time, so a late step does not
+    push back the ones after it and lateness never accumulates. The lateness
+    of each step (when its write started versus when it was due) is kept
+    for the JitterReport.
+    """
+
+    # Below this many seconds before a deadline the player spins instead of
+    # sleeping, since sleeps can overshoot by about a scheduler tick.
+    spin_threshold = 0.002
+
+    def __init__(self, power_supply: PowerSupply, profile: Profile) -> None:
+        self.power_supply = power_supply
+        self.profile = profile
+        self.report = None
+        self._steps = profile.steps()
+        self._lateness = array("d")
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def play(self) -> JitterReport:
+        """Plays the whole profile on the calling thread and returns its JitterReport"""
+        self._stop_event.clear()
+        self._lateness = array("d")
+        times = self.profile.times
+        start = time.monotonic()
+        for index, entries in enumerate(self._steps):
+            deadline = start + times[index]
+            if not self._wait_until(deadline):
+                break
+            self._lateness.append(time.monotonic() - deadline)
+            self.power_supply.make_commands(entries)
+        end_error = (time.monotonic() - start) - self.profile.duration
+        self.report = JitterReport(self._lateness, len(self._steps), end_error)
+        return self.report
+
+    def start(self) -> None:
+        """Plays the profile on a background thread"""
+        self._thread = threading.Thread(target=self.play, name="psu-profile", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def progress(self) -> float:
+        return len(self._lateness) / len(self._steps)
+
+    def _wait_until(self, deadline: float) -> bool:
+        """Returns once the deadline is reached, or False if playback was stopped"""
+        remaining = deadline - time.monotonic()
+        if remaining > self.spin_threshold:
+            if self._stop_event.wait(remaining - self.spin_threshold):
+                return False
+        while time.monotonic() < deadline:
+            pass
+        return not self._stop_event.is_set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a voltage/current/power profile")
+    parser.add_argument("profile", help="profile file, .csv or .xlsx")
+    args = parser.parse_args()
+
+    player = ProfilePlayer(PowerSupply(protocol=DebugProtocol()), load_profile(args.profile))
+    print(player.play())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Command line entry point for running SCPI scripts against the power supply.
+
+Run
+`python3 psu.py run sequence.txt --connection ethernet:192.168.0.2`
+or pipe lines into `python3 psu.py run -`. Each line is either a named
+Commands entry with its arguments (`SET_VOLTS 12.5`) or raw SCPI
+(`VOLT 12.5`, `MEAS:VOLT?`); `WAIT <seconds>` pauses the script and lines
+starting with # are comments. Consecutive commands are sent as compound
+messages over one connection and the reply to every query is written to
+the output, one line each, in script order. Raw SCPI queries are sent in
+messages of their own, since their replies may hold several fields.
+"""
+import argparse
+import sys
+import time
+
+from power_supply import MAX_MESSAGE_BYTES, BlockCmd, Commands, CmdType, GetCmd, PowerSupply, ScpiCommand, SetCmd
+from psu_daemon import create_protocol
+from traffic_capture import CaptureProtocol
+
+MAX_BATCH_COMMANDS = 16
+
+# Commands that take long or change the whole instrument state are sent
+# in a message of their own rather than in the middle of a batch
+ISOLATED_HEADERS = {"*RST", "*TST?", "DIAG:TEST?"}
+
+# Queries whose reply is known to be one field, so they can share a
+# compound message: the named Commands queries, except binary blocks
+BATCHABLE_QUERIES = frozenset(
+    command for command in vars(Commands).values()
+    if isinstance(command, GetCmd) and not isinstance(command, BlockCmd)
+)
+
+
+class ScriptError(ValueError):
+    """Raised for a script line that cannot be run"""
+
+
+def parse_line(line: str) -> list:
+    """Returns the (ScpiCommand, arg_0, arg_1) entries of one script line.
+
+    A WAIT directive is returned as ("WAIT", seconds); blank lines and
+    comments give an empty list.
+    """
+    text = line.strip()
+    if not text or text.startswith("#"):
+        return []
+    name, _, rest = text.partition(" ")
+    if name.upper() == "WAIT":
+        try:
+            return [("WAIT", float(rest))]
+        except ValueError:
+            raise ScriptError(f"WAIT needs a number of seconds, not {rest!r}")
+    command = getattr(Commands, name.upper(), None) if name.isidentifier() else None
+    if isinstance(command, ScpiCommand):
+        args = rest.replace(",", " ").split()
+        if len(args) > 2:
+            raise ScriptError(f"{name} takes at most two arguments")
+        if command.type == CmdType.GET and args:
+            raise ScriptError(f"{name} is a query and takes no arguments")
+        return [(command, *args)]
+    entries = []
+    # Raw SCPI may itself be a compound message
+    for part in text.split(";"):
+        part = part.strip().lstrip(":")
+        if not part:
+            continue
+        try:
+            part.encode("ascii")
+        except UnicodeEncodeError:
+            raise ScriptError(f"SCPI must be ASCII: {part!r}")
+        header = part.partition(" ")[0]
+        entries.append((GetCmd(part) if header.endswith("?") else SetCmd(part),))
+    return entries
+
+
+def read_chunks(file, size: int = 65536):
+    """Yields the complete lines of file as lists, one list per read.
+
+    Each read returns what is available without waiting for more, so a
+    script piped in interactively runs line by line while a file is
+    taken in large chunks that batch well.
+    """
+    pending = b""
+    while True:
+        data = file.read1(size)
+        if not data:
+            break
+        pending += data
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        if lines:
+            yield [line.decode(errors="replace") for line in lines]
+    if pending.strip():
+        yield [pending.decode(errors="replace")]
+
+
+class ScriptRunner:
+    """Streams script lines to a PowerSupply in compound messages.
+
+    Commands are queued until a batch holds max_commands commands or
+    max_bytes bytes, a WAIT or isolated command is reached, or the input
+    has no more lines ready, and are then sent in one round trip. Queries
+    other than BATCHABLE_QUERIES are isolated: a reply of several fields
+    would otherwise be taken for the replies of the queries after it.
+    """
+
+    _batch: list
+
+    def __init__(self, power_supply: PowerSupply, output, max_commands: int = MAX_BATCH_COMMANDS,
+                 max_bytes: int = MAX_MESSAGE_BYTES, echo: bool = False) -> None:
+        self.power_supply = power_supply
+        self.output = output
+        self.max_commands = max_commands
+        self.max_bytes = max_bytes
+        self.echo = echo
+        self.commands_sent = 0
+        self.messages_sent = 0
+        self._batch = []
+        self._batch_bytes = 0
+
+    def run(self, chunks) -> None:
+        line_number = 0
+        for lines in chunks:
+            for line in lines:
+                line_number += 1
+                try:
+                    entries = parse_line(line)
+                except ScriptError as error:
+                    self.flush()
+                    raise ScriptError(f"line {line_number}: {error}") from error
+                for entry in entries:
+                    self.add(entry)
+            self.flush()
+        self.flush()
+
+    def add(self, entry: tuple) -> None:
+        if entry[0] == "WAIT":
+            self.flush()
+            time.sleep(entry[1])
+            return
+        size = _entry_size(entry)
+        command = entry[0]
+        isolated = command.command.upper() in ISOLATED_HEADERS or (
+            command.type == CmdType.GET and command not in BATCHABLE_QUERIES
+        )
+        if self._batch and (isolated or len(self._batch) >= self.max_commands
+                            or self._batch_bytes + size > self.max_bytes):
+            self.flush()
+        self._batch.append(entry)
+        self._batch_bytes += size
+        if isolated:
+            self.flush()
+
+    def flush(self) -> None:
+        batch = self._batch
+        if not batch:
+            return
+        self._batch = []
+        self._batch_bytes = 0
+        if len(batch) == 1:
+            results = [self.power_supply.make_command(*batch[0]).strip()]
+        else:
+            results = self.power_supply.make_commands(batch)
+        self.commands_sent += len(batch)
+        self.messages_sent += 1
+        for entry, result in zip(batch, results):
+            if entry[0].type != CmdType.GET:
+                continue
+            if self.echo:
+                self.output.write(f"{entry[0].command}\t{result}\n")
+            else:
+                self.output.write(f"{result}\n")
+        self.output.flush()
+
+
+def _entry_size(entry: tuple) -> int:
+    # Header, separating "; :" and the arguments with their spaces
+    return len(entry[0].prefix) + 2 + sum(len(str(arg)) + 1 for arg in entry[1:])
+
+
+def run_command(args) -> int:
+    protocol = create_protocol(args.connection)
+    if args.capture:
+        protocol = CaptureProtocol(protocol, args.capture)
+    power_supply = PowerSupply(protocol=protocol)
+    runner = ScriptRunner(power_supply, sys.stdout, max_commands=args.batch,
+                          max_bytes=args.max_bytes, echo=args.echo)
+    script = sys.stdin.buffer if args.script == "-" else open(args.script, "rb")
+    try:
+        runner.run(read_chunks(script))
+    except ScriptError as error:
+        print(f"psu run: {error}", file=sys.stderr)
+        return 2
+    finally:
+        if script is not sys.stdin.buffer:
+            script.close()
+        if args.capture:
+            protocol.flush()
+    if args.verbose:
+        print(f"{runner.commands_sent} commands in {runner.messages_sent} messages", file=sys.stderr)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control the power supply from the command line")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+
+    run_parser = subparsers.add_parser("run", help="stream a script of commands to the power supply")
+    run_parser.add_argument("script", nargs="?", default="-", help="script file, or - for stdin (default)")
+    run_parser.add_argument("--connection", default="usb:COM8",
+                            help='"debug", "usb[:port[:baudrate]]", "ethernet:ip[:port]" '
+                                 'or "replay[-fast]:capture_path"')
+    run_parser.add_argument("--capture", metavar="PATH", help="append the session's traffic to a capture file")
+    run_parser.add_argument("--batch", type=int, default=MAX_BATCH_COMMANDS,
+                            help="most commands per compound message (1 disables batching)")
+    run_parser.add_argument("--max-bytes", type=int, default=MAX_MESSAGE_BYTES,
+                            help="most bytes per compound message")
+    run_parser.add_argument("--echo", action="store_true", help="prefix every reply with its query")
+    run_parser.add_argument("--verbose", action="store_true", help="report how many messages were sent")
+    run_parser.set_defaults(func=run_command)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Thin client for psu_daemon.py.
+
+Only uses the standard library so that scripts importing it start in
+milliseconds; pyserial and the power supply code live in the daemon.
+"""
+import json
+import os
+import socket
+import tempfile
+
+SOCKET_ENV_VAR = "PSU_DAEMON_SOCKET"
+DEFAULT_CONNECTION = "usb:COM8"
+
+
+class DaemonUnavailable(ConnectionError):
+    """Raised when no daemon is listening on the socket"""
+
+
+class DaemonError(RuntimeError):
+    """Raised when the daemon could not run a command"""
+
+
+def default_socket_path() -> str:
+    return os.environ.get(SOCKET_ENV_VAR) or os.path.join(
+        tempfile.gettempdir(), f"psu-daemon-{_user_id()}.sock"
+    )
+
+
+def request(message: dict, socket_path: str = None, timeout: float = 10.0) -> dict:
+    """Sends one JSON request to the daemon and returns its JSON response"""
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("Unix sockets are not available on this platform")
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        try:
+            client.connect(socket_path or default_socket_path())
+        except (FileNotFoundError, ConnectionRefusedError) as error:
+            raise DaemonUnavailable(f"no daemon is running: {error}") from error
+        client.sendall(json.dumps(message).encode() + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            chunk = client.recv(4096)
+            if not chunk:
+                raise DaemonUnavailable("the daemon closed the connection")
+            response += chunk
+    finally:
+        client.close()
+    return json.loads(response)
+
+
+def send_command(command: str, args: list = (), connection: str = DEFAULT_CONNECTION,
+                 socket_path: str = None, timeout: float = 10.0) -> str:
+    """Runs a named Commands entry (e.g. "SET_VOLTS") through the daemon and returns its reply"""
+    response = request(
+        {"connection": connection, "command": command, "args": [str(arg) for arg in args]},
+        socket_path=socket_path,
+        timeout=timeout,
+    )
+    if not response.get("ok"):
+        raise DaemonError(response.get("error", "unknown error"))
+    return response.get("reply", "")
+
+
+def _user_id() -> str:
+    getuid = getattr(os, "getuid", None)
+    return str(getuid()) if getuid else os.environ.get("USERNAME", "user")
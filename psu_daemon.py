@@ -0,0 +1,197 @@
+"""Long-lived daemon that owns the power supply connections.
+
+Scripts such as set_voltage.py send their command to it over a Unix
+socket through psu_client, so the serial port or TCP connection is opened
+once instead of on every run.
+
+Run `python3 psu_daemon.py` (optionally with `--socket PATH`) and leave it
+running. Requests are single JSON lines:
+
+    {"connection": "usb:COM8", "command": "SET_VOLTS", "args": ["12.5"]}
+
+where connection is "debug", "usb[:port[:baudrate]]",
+"ethernet:ip[:port]" or "replay[-fast]:capture_path" (see traffic_capture). Each gets one JSON line back:
+{"ok": true, "reply": "..."} or {"ok": false, "error": "..."}. A query
+that gets no reply is an error.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from power_supply import (CmdType, Commands, DebugProtocol, EthernetProtocol,
+                          PowerSupply, PowerSupplyConnectionError,
+                          ScpiCommand, UsbProtocol)
+from psu_client import default_socket_path
+
+# Connection kinds whose instrument must answer *IDN? before it is used.
+# The USB transport cannot tell a port that failed to open from a silent one.
+CHECKED_KINDS = ("usb", "ethernet")
+
+
+class ConnectionPool:
+    """Opens each power supply connection on first use and keeps it open.
+
+    A new connection of one of the CHECKED_KINDS must answer *IDN?, or
+    PowerSupplyConnectionError is raised and nothing is kept.
+    """
+
+    _power_supplies: dict
+
+    def __init__(self) -> None:
+        self._power_supplies = {}
+        self._lock = threading.Lock()
+
+    def get(self, connection: str) -> PowerSupply:
+        with self._lock:
+            power_supply = self._power_supplies.get(connection)
+            if power_supply is None:
+                power_supply = PowerSupply(protocol=create_protocol(connection))
+                if connection.partition(":")[0].lower() in CHECKED_KINDS:
+                    _check_answers(power_supply, connection)
+                self._power_supplies[connection] = power_supply
+            return power_supply
+
+    def discard(self, connection: str) -> None:
+        with self._lock:
+            power_supply = self._power_supplies.pop(connection, None)
+        if power_supply is not None:
+            _close_protocol(power_supply.protocol)
+
+    def close(self) -> None:
+        with self._lock:
+            power_supplies = list(self._power_supplies.values())
+            self._power_supplies.clear()
+        for power_supply in power_supplies:
+            _close_protocol(power_supply.protocol)
+
+
+def _close_protocol(protocol) -> None:
+    close = getattr(protocol, "close", None)
+    if close is not None:
+        close()
+
+
+def _check_answers(power_supply: PowerSupply, connection: str) -> None:
+    try:
+        answered = bool(power_supply.make_command(Commands.GET_ID_STRING).strip())
+    except OSError:
+        answered = False
+    if not answered:
+        _close_protocol(power_supply.protocol)
+        raise PowerSupplyConnectionError(f"no instrument answered *IDN? on {connection}")
+
+
+def create_protocol(connection: str):
+    kind, _, address = connection.partition(":")
+    kind = kind.lower()
+    if kind == "debug":
+        return DebugProtocol()
+    if kind == "usb":
+        port, _, baudrate = address.partition(":")
+        return UsbProtocol(port=port or "COM8", baudrate=int(baudrate or 115200))
+    if kind == "ethernet":
+        ip, _, port = address.partition(":")
+        return EthernetProtocol(ip=ip or "192.168.0.2", port=int(port or 5025))
+    if kind in ("replay", "replay-fast"):
+        from traffic_capture import ReplayProtocol
+        return ReplayProtocol(address, realtime=kind == "replay")
+    raise ValueError(f"unknown connection {connection!r}")
+
+
+def _socket_answers(socket_path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(1.0)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def lookup_command(name: str) -> ScpiCommand:
+    command = getattr(Commands, name.upper(), None)
+    if not isinstance(command, ScpiCommand):
+        raise ValueError(f"unknown command {name!r}")
+    return command
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.execute(line)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class PowerSupplyDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str) -> None:
+        if os.path.exists(socket_path):
+            if _socket_answers(socket_path):
+                raise RuntimeError(f"a daemon is already listening on {socket_path}")
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.socket_path = socket_path
+        self.pool = ConnectionPool()
+
+    def execute(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            if request.get("command") == "PING":
+                return {"ok": True, "reply": "PONG"}
+            connection = request.get("connection", "usb:COM8")
+            command = lookup_command(request["command"])
+            args = list(request.get("args", []))[:2]
+            power_supply = self.pool.get(connection)
+        except (KeyError, TypeError, ValueError, PowerSupplyConnectionError) as error:
+            return {"ok": False, "error": str(error)}
+        try:
+            reply = power_supply.make_command(command, *args).strip()
+        except (OSError, PowerSupplyConnectionError) as error:
+            # Reopen the connection on the next request
+            self.pool.discard(connection)
+            return {"ok": False, "error": str(error)}
+        if command.type == CmdType.GET and not reply:
+            return {"ok": False, "error": f"no reply to {command.command} on {connection}"}
+        return {"ok": True, "reply": reply}
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep power supply connections open for scripts")
+    parser.add_argument("--socket", default=default_socket_path(), help="Unix socket path to listen on")
+    args = parser.parse_args()
+
+    try:
+        daemon = PowerSupplyDaemon(args.socket)
+    except RuntimeError as error:
+        parser.exit(1, f"{error}\n")
+    with daemon:
+        print(f"Listening on {args.socket}")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
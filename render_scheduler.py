@@ -0,0 +1,95 @@
+"""Batches Tk widget updates into one pass per frame.
+
+Event handlers such as slider callbacks can fire many times between two
+frames. Instead of reconfiguring widgets on every event, they hand their
+updates to a RenderScheduler, which applies only the last value of each
+option once per frame and skips options whose value is already shown.
+"""
+import tkinter as tk
+from typing import Callable
+
+# Milliseconds between two frames while there are updates to apply
+FRAME_INTERVAL_MS = 33
+
+_MISSING = object()
+
+
+class RenderScheduler:
+    """Applies pending widget options and frame tasks once per frame.
+
+    A frame is only scheduled while something is pending, so an idle
+    window costs nothing. Options a widget already shows are skipped;
+    every widget updated through the scheduler must only be updated
+    through it, or that cache goes stale.
+    """
+
+    _pending: dict
+    _applied: dict
+    _tasks: dict
+
+    def __init__(self, root: tk.Misc, frame_interval_ms: int = FRAME_INTERVAL_MS) -> None:
+        self.root = root
+        self.frame_interval_ms = frame_interval_ms
+        self._pending = {}
+        self._applied = {}
+        self._tasks = {}
+        self._after_id = None
+        self.frames = 0
+        self.applied = 0
+        self.skipped = 0
+
+    def configure(self, widget: tk.Misc, **options) -> None:
+        """Sets widget options on the next frame; later calls before it overwrite earlier ones"""
+        self._pending.setdefault(widget, {}).update(options)
+        self._schedule()
+
+    def set_text(self, widget: tk.Misc, text: str) -> None:
+        self.configure(widget, text=text)
+
+    def add_task(self, task: Callable) -> None:
+        """Calls task once on the next frame, however often it is added before then"""
+        self._tasks[task] = None
+        self._schedule()
+
+    def flush(self) -> None:
+        """Applies everything pending now"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._run_frame()
+
+    def cancel(self) -> None:
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._pending.clear()
+        self._tasks.clear()
+
+    def forget(self, widget: tk.Misc) -> None:
+        """Drops what is known about a widget, e.g. before it is destroyed"""
+        self._pending.pop(widget, None)
+        self._applied.pop(widget, None)
+
+    def _schedule(self) -> None:
+        if self._after_id is None:
+            self._after_id = self.root.after(self.frame_interval_ms, self._on_frame)
+
+    def _on_frame(self) -> None:
+        self._after_id = None
+        self._run_frame()
+
+    def _run_frame(self) -> None:
+        pending, self._pending = self._pending, {}
+        tasks, self._tasks = self._tasks, {}
+        self.frames += 1
+        for widget, options in pending.items():
+            applied = self._applied.setdefault(widget, {})
+            changed = {name: value for name, value in options.items() if applied.get(name, _MISSING) != value}
+            if not changed:
+                self.skipped += 1
+                continue
+            widget.configure(**changed)
+            applied.update(changed)
+            self.applied += 1
+        for task in tasks:
+            task()
@@ -0,0 +1,554 @@
+"""Loopback SCPI instrument simulator for testing without hardware.
+
+Speaks the SCPI subset used by power_supply.Commands over TCP, keeps real
+instrument state and can add per-command latency, jitter and errors.
+
+Run
+`python3 scpi_simulator.py --port 5025 --latency 0.002 --jitter 0.001`
+and point an EthernetProtocol at 127.0.0.1.
+"""
+import argparse
+import asyncio
+import math
+import random
+import struct
+import threading
+import time
+
+from power_supply import (ESR_COMMAND_ERROR, ESR_EXECUTION_ERROR, ESR_OPERATION_COMPLETE, MAX_CURRENT,
+                          MAX_LIST_POINTS, MAX_POWER, MAX_VOLTAGE, OPER_SWEEPING, OPER_WAITING_FOR_TRIGGER,
+                          STB_ERROR_QUEUE, STB_EVENT_STATUS, STB_MASTER_SUMMARY, decode_bool, decode_int,
+                          decode_number)
+
+MAX_ARRAY_POINTS = 100000
+
+
+class SimulatedInstrument:
+    """State of one simulated EA-PS power supply driving a resistive load"""
+
+    voltage: float
+    current: float
+    power: float
+    output_on: bool
+    ocp_state: bool
+    ocp_delay: float
+    channel: str
+    load_resistance: float
+    event_status: int
+    event_status_enable: int
+    service_request_enable: int
+    errors: list
+    list_voltages: list
+    list_currents: list
+    list_dwells: list
+    list_count: float
+    voltage_mode: str
+    current_mode: str
+    trigger_source: str
+    waiting_for_trigger: bool
+    # Monotonic time the running list started at, or None
+    list_start: float
+
+    def __init__(self, load_resistance: float = 1.0) -> None:
+        self.load_resistance = load_resistance
+        # The enable registers keep their value through *RST
+        self.event_status_enable = 0
+        self.service_request_enable = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.voltage = 0.0
+        self.current = 0.0
+        self.power = MAX_POWER
+        self.output_on = False
+        self.ocp_state = False
+        self.ocp_delay = 0.0
+        self.channel = "CH1"
+        self.event_status = 0
+        self.errors = []
+        self.list_voltages = []
+        self.list_currents = []
+        self.list_dwells = []
+        self.list_count = 1
+        self.voltage_mode = "FIX"
+        self.current_mode = "FIX"
+        self.trigger_source = "IMM"
+        self.waiting_for_trigger = False
+        self.list_start = None
+
+    def setpoints(self) -> tuple:
+        """Returns the (voltage, current) setpoints in effect, following a running list"""
+        if self.list_start is None:
+            return self.voltage, self.current
+        length = max(len(self.list_voltages) if self.voltage_mode == "LIST" else 0,
+                     len(self.list_currents) if self.current_mode == "LIST" else 0)
+        dwells = [_list_value(self.list_dwells, index) for index in range(length)]
+        cycle = sum(dwells)
+        elapsed = time.monotonic() - self.list_start
+        if cycle <= 0 or elapsed >= cycle * self.list_count:
+            # The list has finished and the output stays at its last point
+            self.list_start = None
+            index = length - 1
+        else:
+            elapsed %= cycle
+            index = 0
+            while index < length - 1 and elapsed >= dwells[index]:
+                elapsed -= dwells[index]
+                index += 1
+        if self.voltage_mode == "LIST" and self.list_voltages:
+            voltage = _list_value(self.list_voltages, index)
+        else:
+            voltage = self.voltage
+        if self.current_mode == "LIST" and self.list_currents:
+            current = _list_value(self.list_currents, index)
+        else:
+            current = self.current
+        if self.list_start is None:
+            self.voltage, self.current = voltage, current
+        return voltage, current
+
+    def output(self) -> tuple:
+        """Returns the (voltage, current, mode) the output settles at"""
+        if not self.output_on:
+            return 0.0, 0.0, "OFF"
+        set_voltage, set_current = self.setpoints()
+        voltage = set_voltage
+        current = voltage / self.load_resistance if self.load_resistance > 0 else MAX_CURRENT
+        mode = "CV"
+        if current > set_current:
+            current = set_current
+            voltage = min(current * self.load_resistance, set_voltage)
+            mode = "CC"
+        if voltage * current > self.power:
+            voltage = math.sqrt(self.power * self.load_resistance)
+            current = self.power / voltage if voltage > 0 else 0.0
+            mode = "CP"
+        return voltage, current, mode
+
+    def add_error(self, code: int, message: str, esr_bit: int) -> None:
+        self.errors.append(f'{code},"{message}"')
+        self.event_status |= esr_bit
+
+    def execute(self, header: str, args: list) -> str:
+        """Executes one command and returns its reply, or None for commands without one"""
+        handler = _HANDLERS.get(header)
+        if handler is None:
+            self.add_error(-113, "Undefined header", ESR_COMMAND_ERROR)
+            return None
+        try:
+            return handler(self, args)
+        except (ValueError, IndexError, OverflowError):
+            self.add_error(-224, "Illegal parameter value", ESR_EXECUTION_ERROR)
+            return None
+
+
+def _set_voltage(instrument: SimulatedInstrument, args: list) -> None:
+    voltage = decode_number(args[0])
+    if not 0 <= voltage <= MAX_VOLTAGE:
+        raise ValueError(voltage)
+    instrument.voltage = voltage
+
+
+def _set_current(instrument: SimulatedInstrument, args: list) -> None:
+    current = decode_number(args[0])
+    if not 0 <= current <= MAX_CURRENT:
+        raise ValueError(current)
+    instrument.current = current
+
+
+def _set_power(instrument: SimulatedInstrument, args: list) -> None:
+    power = decode_number(args[0])
+    if not 0 <= power <= MAX_POWER:
+        raise ValueError(power)
+    instrument.power = power
+
+
+def _set_ocp_state(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.ocp_state = decode_bool(args[0])
+
+
+def _set_ocp_delay(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.ocp_delay = decode_number(args[0])
+
+
+def _set_channel(instrument: SimulatedInstrument, args: list) -> None:
+    # Accepts both "INST CH1" and the "INST CH CH1" form sent by Commands.SET_OUT_CHANNEL
+    instrument.channel = args[-1].upper()
+
+
+def _set_output(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.output_on = decode_bool(args[0])
+
+
+def _list_value(values: list, index: int) -> float:
+    # A list with a single value applies it to every point
+    return values[0] if len(values) == 1 else values[index]
+
+
+def _parse_list(args: list, maximum: float) -> list:
+    values = [decode_number(arg) for arg in args]
+    if not values or len(values) > MAX_LIST_POINTS or not all(0 <= value <= maximum for value in values):
+        raise ValueError(args)
+    return values
+
+
+def _set_list_voltages(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.list_voltages = _parse_list(args, MAX_VOLTAGE)
+
+
+def _set_list_currents(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.list_currents = _parse_list(args, MAX_CURRENT)
+
+
+def _set_list_dwells(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.list_dwells = _parse_list(args, math.inf)
+
+
+def _set_list_count(instrument: SimulatedInstrument, args: list) -> None:
+    count = math.inf if args[0].upper().startswith("INF") else int(args[0])
+    if count < 1:
+        raise ValueError(count)
+    instrument.list_count = count
+
+
+def _set_mode(attribute: str):
+    def set_mode(instrument: SimulatedInstrument, args: list) -> None:
+        mode = args[0].upper()
+        if mode not in ("FIX", "LIST"):
+            raise ValueError(mode)
+        setattr(instrument, attribute, mode)
+    return set_mode
+
+
+def _set_trigger_source(instrument: SimulatedInstrument, args: list) -> None:
+    source = args[0].upper()
+    if source not in ("IMM", "BUS"):
+        raise ValueError(source)
+    instrument.trigger_source = source
+
+
+def _initiate(instrument: SimulatedInstrument, args: list) -> None:
+    if instrument.voltage_mode != "LIST" and instrument.current_mode != "LIST":
+        instrument.add_error(-221, "Settings conflict", ESR_EXECUTION_ERROR)
+        return
+    instrument.list_start = None
+    if instrument.trigger_source == "IMM":
+        instrument.list_start = time.monotonic()
+    else:
+        instrument.waiting_for_trigger = True
+
+
+def _trigger(instrument: SimulatedInstrument, args: list) -> None:
+    if instrument.waiting_for_trigger:
+        instrument.waiting_for_trigger = False
+        instrument.list_start = time.monotonic()
+
+
+def _abort(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.waiting_for_trigger = False
+    instrument.list_start = None
+
+
+def _read_operation_condition(instrument: SimulatedInstrument, args: list) -> str:
+    instrument.setpoints()
+    condition = OPER_SWEEPING if instrument.list_start is not None else 0
+    if instrument.waiting_for_trigger:
+        condition |= OPER_WAITING_FOR_TRIGGER
+    return str(condition)
+
+
+def _measure_array(index: int):
+    def measure_array(instrument: SimulatedInstrument, args: list) -> str:
+        points = int(args[0]) if args else 100
+        if not 0 < points <= MAX_ARRAY_POINTS:
+            raise ValueError(points)
+        return _binary_block(struct.pack(f">{points}f", *[instrument.output()[index]] * points))
+    return measure_array
+
+
+def _binary_block(data: bytes) -> str:
+    """Formats data as an IEEE 488.2 definite-length block, as latin-1 text"""
+    length = str(len(data))
+    return f"#{len(length)}{length}" + data.decode("latin-1")
+
+
+def _format_list(values: list) -> str:
+    return ",".join(f"{value:g}" for value in values)
+
+
+def _reset(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.reset()
+
+
+def _clear(instrument: SimulatedInstrument, args: list) -> None:
+    instrument.event_status = 0
+    instrument.errors = []
+
+
+def _read_event_status(instrument: SimulatedInstrument, args: list) -> str:
+    event_status = instrument.event_status
+    instrument.event_status = 0
+    return str(event_status)
+
+
+def _set_register(attribute: str):
+    def set_register(instrument: SimulatedInstrument, args: list) -> None:
+        value = decode_int(args[0])
+        if not 0 <= value <= 255:
+            raise ValueError(value)
+        setattr(instrument, attribute, value)
+    return set_register
+
+
+def _operation_complete(instrument: SimulatedInstrument, args: list) -> None:
+    # Every command has finished by the time the next one is parsed
+    instrument.event_status |= ESR_OPERATION_COMPLETE
+
+
+def _read_status_byte(instrument: SimulatedInstrument, args: list) -> str:
+    status = 0
+    if instrument.errors:
+        status |= STB_ERROR_QUEUE
+    if instrument.event_status & instrument.event_status_enable:
+        status |= STB_EVENT_STATUS
+    if status & instrument.service_request_enable:
+        status |= STB_MASTER_SUMMARY
+    return str(status)
+
+
+def _read_error(instrument: SimulatedInstrument, args: list) -> str:
+    if not instrument.errors:
+        return '0,"No error"'
+    return instrument.errors.pop(0)
+
+
+_HANDLERS = {
+    "MEAS:VOLT?": lambda instrument, args: f"{instrument.output()[0]:.4f}",
+    "MEAS:CURR?": lambda instrument, args: f"{instrument.output()[1]:.4f}",
+    "MEAS:ARR:VOLT?": _measure_array(0),
+    "MEAS:ARR:CURR?": _measure_array(1),
+    "VOLT": _set_voltage,
+    "VOLT?": lambda instrument, args: f"{instrument.voltage:.4f}",
+    "CURR": _set_current,
+    "CURR?": lambda instrument, args: f"{instrument.current:.4f}",
+    "MEAS:POW?": lambda instrument, args: f"{instrument.output()[0] * instrument.output()[1]:.4f}",
+    "POW": _set_power,
+    "POW?": lambda instrument, args: f"{instrument.power:.4f}",
+    "CURR:PROT:STAT": _set_ocp_state,
+    "CURR:PROT:STAT?": lambda instrument, args: str(int(instrument.ocp_state)),
+    "CURR:PROT:DEL": _set_ocp_delay,
+    "CURR:PROT:DEL?": lambda instrument, args: f"{instrument.ocp_delay:g}",
+    "INST": _set_channel,
+    "INST?": lambda instrument, args: instrument.channel,
+    "OUTP": _set_output,
+    "OUTP?": lambda instrument, args: str(int(instrument.output_on)),
+    "OUTP:MODE?": lambda instrument, args: instrument.output()[2],
+    "LIST:VOLT": _set_list_voltages,
+    "LIST:VOLT?": lambda instrument, args: _format_list(instrument.list_voltages),
+    "LIST:CURR": _set_list_currents,
+    "LIST:CURR?": lambda instrument, args: _format_list(instrument.list_currents),
+    "LIST:DWEL": _set_list_dwells,
+    "LIST:DWEL?": lambda instrument, args: _format_list(instrument.list_dwells),
+    "LIST:COUN": _set_list_count,
+    "LIST:COUN?": lambda instrument, args: "INF" if math.isinf(instrument.list_count) else str(instrument.list_count),
+    "VOLT:MODE": _set_mode("voltage_mode"),
+    "VOLT:MODE?": lambda instrument, args: instrument.voltage_mode,
+    "CURR:MODE": _set_mode("current_mode"),
+    "CURR:MODE?": lambda instrument, args: instrument.current_mode,
+    "TRIG:SOUR": _set_trigger_source,
+    "INIT": _initiate,
+    "*TRG": _trigger,
+    "ABOR": _abort,
+    "STAT:OPER:COND?": _read_operation_condition,
+    "*RST": _reset,
+    "*CLS": _clear,
+    "*IDN?": lambda instrument, args: "Elektro-Automatik,PS 9080-120 2U SIMULATED,0,1.0",
+    "*TST?": lambda instrument, args: "0",
+    "DIAG:TEST?": lambda instrument, args: '0,"No error"',
+    "*ESR?": _read_event_status,
+    "*OPC?": lambda instrument, args: "1",
+    "*OPC": _operation_complete,
+    "*WAI": lambda instrument, args: None,
+    "*ESE": _set_register("event_status_enable"),
+    "*ESE?": lambda instrument, args: str(instrument.event_status_enable),
+    "*SRE": _set_register("service_request_enable"),
+    "*SRE?": lambda instrument, args: str(instrument.service_request_enable),
+    "*STB?": _read_status_byte,
+    "SYST:ERR?": _read_error,
+}
+
+
+def split_message(message: str) -> list:
+    """Splits a (possibly compound) SCPI message into (header, args) pairs"""
+    commands = []
+    for part in message.split(";"):
+        part = part.strip().lstrip(":")
+        if not part:
+            continue
+        header, _, rest = part.partition(" ")
+        args = [arg for arg in rest.replace(",", " ").split() if arg]
+        commands.append((header.upper(), args))
+    return commands
+
+
+class ScpiSimulator:
+    """Asyncio TCP server answering SCPI messages from a SimulatedInstrument.
+
+    latency is the default delay per command in seconds and
+    command_latency overrides it per header (e.g. {"MEAS:VOLT?": 0.005}).
+    Each command is delayed by an extra uniform random jitter of up to
+    jitter seconds, and fails with an execution error with probability
+    error_rate. By default all connections share one instrument, like the
+    real supply; per_connection_state gives every client its own.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 command_latency: dict = None, load_resistance: float = 1.0,
+                 per_connection_state: bool = False, seed: int = None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.command_latency = dict(command_latency or {})
+        self.load_resistance = load_resistance
+        self.per_connection_state = per_connection_state
+        self.instrument = SimulatedInstrument(load_resistance)
+        self.connections = 0
+        self.commands_served = 0
+        self._random = random.Random(seed)
+        self._server = None
+        # Writer of every open client connection, by the task serving it
+        self._clients = {}
+        # Event loop and thread of start_in_thread, while it runs
+        self._loop = None
+        self._thread = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 5025) -> int:
+        """Starts listening and returns the bound port (useful with port=0)"""
+        self._server = await asyncio.start_server(self._handle_client, host, port, backlog=4096)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 5025) -> None:
+        await self.start(host, port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in self._clients.values():
+                writer.close()
+            await asyncio.gather(*self._clients, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Runs the simulator on its own event loop thread and returns the bound port"""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        bound = []
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            bound.append(loop.run_until_complete(self.start(host, port)))
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.close()
+
+        thread = threading.Thread(target=run, name="scpi-simulator", daemon=True)
+        thread.start()
+        started.wait()
+        self._loop = loop
+        self._thread = thread
+        return bound[0]
+
+    def stop_thread(self, timeout: float = 5.0) -> None:
+        """Stops a simulator started with start_in_thread; does nothing if it is not running"""
+        loop, thread = self._loop, self._thread
+        if loop is None:
+            return
+        self._loop = self._thread = None
+        asyncio.run_coroutine_threadsafe(self.stop(), loop).result(timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def _delay(self, header: str) -> float:
+        delay = self.command_latency.get(header, self.latency)
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        return delay
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._clients[asyncio.current_task()] = writer
+        instrument = SimulatedInstrument(self.load_resistance) if self.per_connection_state else self.instrument
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                replies = []
+                for header, args in split_message(line.decode(errors="replace")):
+                    delay = self._delay(header)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    self.commands_served += 1
+                    if self.error_rate and self._random.random() < self.error_rate:
+                        instrument.add_error(-200, "Execution error", ESR_EXECUTION_ERROR)
+                        continue
+                    reply = instrument.execute(header, args)
+                    if reply is not None:
+                        replies.append(reply)
+                if replies:
+                    # latin-1 keeps the bytes of binary blocks as they are
+                    writer.write((";".join(replies) + "\n").encode("latin-1"))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self._clients.pop(asyncio.current_task(), None)
+            writer.close()
+
+
+def _parse_command_latency(values: list) -> dict:
+    command_latency = {}
+    for value in values or []:
+        header, _, seconds = value.partition("=")
+        command_latency[header.upper()] = float(seconds)
+    return command_latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated EA-PS SCPI instrument over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5025)
+    parser.add_argument("--latency", type=float, default=0.0, help="default delay per command in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum extra random delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability that a command fails")
+    parser.add_argument("--command-latency", action="append", metavar="HEADER=SECONDS",
+                        help="delay for a single header, e.g. MEAS:VOLT?=0.005")
+    parser.add_argument("--load-resistance", type=float, default=1.0, help="simulated load in ohms")
+    parser.add_argument("--per-connection-state", action="store_true",
+                        help="give every client its own instrument state")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = ScpiSimulator(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        command_latency=_parse_command_latency(args.command_latency),
+        load_resistance=args.load_resistance,
+        per_connection_state=args.per_connection_state,
+        seed=args.seed,
+    )
+    try:
+        asyncio.run(simulator.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
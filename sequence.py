@@ -0,0 +1,256 @@
+"""Runs setpoint sequences on the power supply itself using its list subsystem.
+
+A ListSequence is uploaded once and then stepped through by the
+instrument with its own timing, so the waveform is as precise as the
+supply rather than as the host's sleeps. Build one from a Profile with
+ListSequence.from_profile, or from setpoint arrays directly.
+
+Run `python3 sequence.py profile.csv --connection ethernet:192.168.0.2`
+to upload a profile file and start it.
+"""
+import argparse
+import time
+
+from power_supply import (MAX_CURRENT, MAX_LIST_POINTS, MAX_MESSAGE_BYTES, MAX_VOLTAGE, OPER_SWEEPING,
+                          OPER_WAITING_FOR_TRIGGER, Commands, DebugProtocol, PowerSupply)
+from profile_player import Profile, load_profile
+from synchronization import StatusSynchronizer, parse_register
+
+MIN_DWELL = 0.001
+
+
+class ListSequence:
+    """Voltage and/or current setpoints with the time each one is held.
+
+    voltages and currents are None when the sequence does not step them.
+    count is how many times the list runs, or None to repeat it until it
+    is aborted.
+    """
+
+    dwells: list
+    voltages: list
+    currents: list
+
+    def __init__(self, dwells: list, voltages: list = None, currents: list = None, count: int = 1) -> None:
+        if voltages is None and currents is None:
+            raise ValueError("a sequence needs voltages or currents")
+        length = len(voltages if voltages is not None else currents)
+        if len(dwells) == 1:
+            dwells = list(dwells) * length
+        for values in (dwells, voltages, currents):
+            if values is not None and len(values) != length:
+                raise ValueError("dwells, voltages and currents must have the same length")
+        if not 0 < length <= MAX_LIST_POINTS:
+            raise ValueError(f"a sequence has between 1 and {MAX_LIST_POINTS} points")
+        if not all(dwell >= MIN_DWELL for dwell in dwells):
+            raise ValueError(f"every point must be held at least {MIN_DWELL} s")
+        if voltages is not None and not all(0 <= value <= MAX_VOLTAGE for value in voltages):
+            raise ValueError(f"voltages must be between 0 and {MAX_VOLTAGE} V")
+        if currents is not None and not all(0 <= value <= MAX_CURRENT for value in currents):
+            raise ValueError(f"currents must be between 0 and {MAX_CURRENT} A")
+        if count is not None and count < 1:
+            raise ValueError("count must be at least 1, or None to repeat forever")
+        self.dwells = [float(dwell) for dwell in dwells]
+        self.voltages = None if voltages is None else [float(value) for value in voltages]
+        self.currents = None if currents is None else [float(value) for value in currents]
+        self.count = count
+
+    @classmethod
+    def from_profile(cls, profile: Profile, hold: float = MIN_DWELL, count: int = 1) -> "ListSequence":
+        """Compiles a Profile into the fewest list points.
+
+        Each step is held until the next one, and the last step for hold
+        seconds. Steps that repeat the previous setpoints are merged into
+        it, and steps replaced at the same instant are dropped.
+        """
+        times = profile.times
+        dwells, voltages, currents = [], [], []
+        for index in range(len(times)):
+            dwell = (times[index + 1] if index + 1 < len(times) else times[index] + hold) - times[index]
+            if dwell <= 0:
+                continue
+            voltage = None if profile.voltages is None else profile.voltages[index]
+            current = None if profile.currents is None else profile.currents[index]
+            if dwells and (voltages[-1], currents[-1]) == (voltage, current):
+                dwells[-1] += dwell
+                continue
+            dwells.append(dwell)
+            voltages.append(voltage)
+            currents.append(current)
+        return cls(
+            dwells,
+            voltages=None if profile.voltages is None else voltages,
+            currents=None if profile.currents is None else currents,
+            count=count,
+        )
+
+    def __len__(self) -> int:
+        return len(self.dwells)
+
+    @property
+    def cycle_duration(self) -> float:
+        return sum(self.dwells)
+
+    @property
+    def duration(self) -> float:
+        """Seconds the whole sequence runs for, or None if it repeats forever"""
+        return None if self.count is None else self.cycle_duration * self.count
+
+    def entries(self) -> list:
+        """Returns the commands that upload the sequence, as entries for PowerSupply.make_commands.
+
+        A list whose points all have the same value is sent as that one
+        value, which the instrument applies to every point.
+        """
+        entries = [(Commands.ABORT,)]
+        for command, values in ((Commands.SET_LIST_VOLTS, self.voltages),
+                                (Commands.SET_LIST_CURR, self.currents),
+                                (Commands.SET_LIST_DWELL, self.dwells)):
+            if values is not None:
+                entries.append((command, _format_list(values)))
+        entries.append((Commands.SET_LIST_COUNT, "INF" if self.count is None else self.count))
+        entries.append((Commands.SET_VOLT_MODE, "FIX" if self.voltages is None else "LIST"))
+        entries.append((Commands.SET_CURR_MODE, "FIX" if self.currents is None else "LIST"))
+        return entries
+
+    def messages(self, max_bytes: int = MAX_MESSAGE_BYTES) -> list:
+        """Packs entries() into as few compound messages of at most max_bytes as possible.
+
+        A list longer than max_bytes on its own is sent in a message of
+        its own.
+        """
+        messages = []
+        size = 0
+        for entry in self.entries():
+            entry_size = len(entry[0].prefix) + 2 + sum(len(str(arg)) + 1 for arg in entry[1:])
+            if messages and size + entry_size <= max_bytes:
+                messages[-1].append(entry)
+                size += entry_size
+            else:
+                messages.append([entry])
+                size = entry_size
+        return messages
+
+
+def _format_list(values: list) -> str:
+    if all(value == values[0] for value in values):
+        values = values[:1]
+    return ",".join(f"{value:.6g}" for value in values)
+
+
+class SequenceController:
+    """Uploads ListSequences to a PowerSupply and starts, stops and monitors them"""
+
+    def __init__(self, power_supply: PowerSupply) -> None:
+        self.power_supply = power_supply
+        self.sequence = None
+        self._started_at = None
+
+    def upload(self, sequence: ListSequence, max_bytes: int = MAX_MESSAGE_BYTES) -> int:
+        """Uploads sequence, aborting any running one, and returns how many messages it took"""
+        messages = sequence.messages(max_bytes)
+        for entries in messages:
+            self.power_supply.make_commands(entries)
+        self.sequence = sequence
+        self._started_at = None
+        return len(messages)
+
+    def start(self, trigger: bool = False) -> None:
+        """Starts the uploaded sequence now, or on the next trigger() if trigger is set"""
+        if self.sequence is None:
+            raise RuntimeError("upload a sequence before starting it")
+        self.power_supply.make_commands([
+            (Commands.SET_TRIGGER_SOURCE, "BUS" if trigger else "IMM"),
+            (Commands.INITIATE,),
+        ])
+        self._started_at = None if trigger else time.monotonic()
+
+    def trigger(self) -> None:
+        self.power_supply.make_command(Commands.TRIGGER)
+        self._started_at = time.monotonic()
+
+    def play(self, sequence: ListSequence) -> int:
+        """Uploads sequence and starts it, returning how many upload messages it took"""
+        messages = self.upload(sequence)
+        self.start()
+        return messages
+
+    def stop(self) -> None:
+        """Aborts the sequence and returns the output to its fixed setpoints"""
+        self.power_supply.make_commands([
+            (Commands.ABORT,),
+            (Commands.SET_VOLT_MODE, "FIX"),
+            (Commands.SET_CURR_MODE, "FIX"),
+        ])
+        self._started_at = None
+
+    def operation_condition(self) -> int:
+        """Returns the operation status condition register, or 0 if it could not be read"""
+        return parse_register(self.power_supply.make_command_raw(Commands.GET_OPERATION_CONDITION))
+
+    @property
+    def running(self) -> bool:
+        """Asks the instrument whether the sequence is still running or waiting for its trigger"""
+        return bool(self.operation_condition() & (OPER_SWEEPING | OPER_WAITING_FOR_TRIGGER))
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the sequence played, estimated from the host clock without a query"""
+        if self._started_at is None or self.sequence is None or self.sequence.duration is None:
+            return 0.0
+        return min(1.0, (time.monotonic() - self._started_at) / self.sequence.duration)
+
+    def wait(self, timeout: float = None, poll_interval: float = 0.05) -> bool:
+        """Waits for the sequence to finish and returns False on timeout.
+
+        Sleeps through the expected run time first, so the instrument is
+        only polled near the end.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._started_at is not None and self.sequence.duration is not None:
+            expected_end = self._started_at + self.sequence.duration
+            if deadline is not None:
+                expected_end = min(expected_end, deadline)
+            time.sleep(max(0.0, expected_end - time.monotonic()))
+        remaining = float("inf") if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            StatusSynchronizer(self.power_supply, poll_interval).wait_until(
+                Commands.GET_OPERATION_CONDITION,
+                lambda reply: not parse_register(reply) & (OPER_SWEEPING | OPER_WAITING_FOR_TRIGGER),
+                remaining,
+            )
+        except TimeoutError:
+            return False
+        return True
+
+
+def example_square_wave():
+    """Uploads a 1 Hz square wave between 5 V and 10 V that repeats until stopped"""
+    controller = SequenceController(PowerSupply(protocol=DebugProtocol()))
+    sequence = ListSequence([0.5], voltages=[5.0, 10.0], count=None)
+    controller.play(sequence)
+    controller.stop()
+
+
+def main():
+    from psu_daemon import create_protocol
+
+    parser = argparse.ArgumentParser(description="Upload a profile to run on the power supply")
+    parser.add_argument("profile", help="profile file, .csv or .xlsx")
+    parser.add_argument("--connection", default="debug",
+                        help='"debug", "usb[:port[:baudrate]]" or "ethernet:ip[:port]"')
+    parser.add_argument("--count", type=int, default=1, help="times to run the profile, 0 to repeat forever")
+    parser.add_argument("--hold", type=float, default=MIN_DWELL, help="seconds to hold the last step")
+    parser.add_argument("--wait", action="store_true", help="wait until the sequence has finished")
+    args = parser.parse_args()
+
+    sequence = ListSequence.from_profile(load_profile(args.profile), hold=args.hold, count=args.count or None)
+    controller = SequenceController(PowerSupply(protocol=create_protocol(args.connection)))
+    messages = controller.play(sequence)
+    print(f"Uploaded {len(sequence)} points in {messages} messages")
+    if args.wait:
+        controller.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import sys
 
-from power_supply import Commands, DebugProtocol, EthernetProtcol, PowerSupply, UsbProtocol
+from psu_client import DaemonUnavailable, send_command
 
 
 def main():
-    power_supply = PowerSupply(protocol=UsbProtocol())
-    power_supply.make_command(Commands.SET_VOLTS, sys.argv[1])
+    try:
+        send_command("SET_VOLTS", [sys.argv[1]])
+    except DaemonUnavailable:
+        # No daemon is running (see psu_daemon.py), so open the port directly
+        from power_supply import Commands, PowerSupply, UsbProtocol
+        power_supply = PowerSupply(protocol=UsbProtocol())
+        power_supply.make_command(Commands.SET_VOLTS, sys.argv[1])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+import time
+
+from power_supply import CmdType, Commands, DebugProtocol, PowerSupply, ScpiCommand
+
+
+class CoalescingPowerSupply:
+    """Sits in front of a PowerSupply and thins out setpoint writes.
+
+    For the coalesced commands (SET_VOLTS and SET_CURR by default) it
+    - remembers the last value written per command and output channel,
+    - drops writes of a value that is already on the instrument, and
+    - writes at most max_write_rate times per second per command and
+      channel, keeping only the latest value of a burst as pending.
+
+    Pending values are written by flush(), which the owner should call
+    periodically (e.g. from a Tk after() loop), and before any other SET
+    command so that the order of writes on the instrument is preserved.
+    """
+
+    _last_written: dict
+    _last_write_time: dict
+    _pending: dict
+
+    def __init__(self, power_supply: PowerSupply, max_write_rate: float = 20.0,
+                 coalesced_commands: tuple = (Commands.SET_VOLTS, Commands.SET_CURR)) -> None:
+        self.power_supply = power_supply
+        self.min_interval = 1.0 / max_write_rate if max_write_rate > 0 else 0.0
+        self.coalesced_commands = frozenset(coalesced_commands)
+        self.channel = None
+        self.writes = 0
+        self.suppressed = 0
+        self.coalesced = 0
+        self._last_written = {}
+        self._last_write_time = {}
+        self._pending = {}
+
+    @property
+    def protocol(self):
+        return self.power_supply.protocol
+
+    def make_command(self, scpi_command: ScpiCommand, arg_0: str = "", arg_1: str = "") -> str:
+        if scpi_command in self.coalesced_commands:
+            self._request(scpi_command, (arg_0, arg_1))
+            return ""
+        if scpi_command.type == CmdType.SET:
+            self.flush(force=True)
+            self._track(scpi_command, arg_0)
+        return self.power_supply.make_command(scpi_command, arg_0, arg_1)
+
+    def make_commands(self, commands: list) -> list:
+        """Passes a compound message through, flushing first if it contains SET commands"""
+        entries = [entry if isinstance(entry, tuple) else (entry,) for entry in commands]
+        if any(entry[0].type == CmdType.SET for entry in entries):
+            self.flush(force=True)
+            for scpi_command, arg_0, arg_1 in (entry + ("", "")[len(entry) - 1:] for entry in entries):
+                if scpi_command in self.coalesced_commands:
+                    self._remember((scpi_command, self.channel), (arg_0, arg_1), time.monotonic())
+                self._track(scpi_command, arg_0)
+        return self.power_supply.make_commands(commands)
+
+    def query_all(self, commands: list) -> list:
+        """Passes queries through; pending setpoints are not flushed for them"""
+        return self.power_supply.query_all(commands)
+
+    def flush(self, force: bool = False) -> float:
+        """Writes the pending setpoints that are due (or all of them when force is set).
+
+        Returns the number of seconds until the next pending setpoint is due,
+        or None when nothing is pending.
+        """
+        now = time.monotonic()
+        next_due = None
+        for key, value in list(self._pending.items()):
+            due = self._last_write_time.get(key, 0.0) + self.min_interval
+            if force or due <= now:
+                del self._pending[key]
+                self._write(key, value, now)
+            else:
+                next_due = due - now if next_due is None else min(next_due, due - now)
+        return next_due
+
+    def forget(self) -> None:
+        """Forgets every remembered value, e.g. after the instrument was changed from elsewhere"""
+        self._last_written.clear()
+        self._pending.clear()
+
+    def _request(self, scpi_command: ScpiCommand, value: tuple) -> None:
+        key = (scpi_command, self.channel)
+        if self._last_written.get(key) == value:
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self.suppressed += 1
+            return
+        now = time.monotonic()
+        if key not in self._pending and now - self._last_write_time.get(key, float("-inf")) >= self.min_interval:
+            self._write(key, value, now)
+            return
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = value
+
+    def _write(self, key: tuple, value: tuple, now: float) -> None:
+        self.power_supply.make_command(key[0], *value)
+        self._remember(key, value, now)
+        self.writes += 1
+
+    def _remember(self, key: tuple, value: tuple, now: float) -> None:
+        self._last_written[key] = value
+        self._last_write_time[key] = now
+
+    def _track(self, scpi_command: ScpiCommand, arg_0) -> None:
+        if scpi_command is Commands.SET_OUT_CHANNEL:
+            self.channel = arg_0
+        elif scpi_command is Commands.RESET:
+            self.forget()
+
+
+def example_coalescing():
+    """Sends a burst of slider-like voltage changes, of which only a few reach the instrument"""
+    power_supply = CoalescingPowerSupply(PowerSupply(protocol=DebugProtocol()), max_write_rate=10)
+    for step in range(100):
+        power_supply.make_command(Commands.SET_VOLTS, str(round(step * 0.1, 1)))
+        time.sleep(0.002)
+    power_supply.flush(force=True)
+    print(f"writes: {power_supply.writes}, coalesced: {power_supply.coalesced}, suppressed: {power_supply.suppressed}")
+
+
+def main():
+    example_coalescing()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Live strip-chart of the actual voltage, current and power for the GUI.
+
+HistoryDecimator keeps the whole history as min/max buckets of a fixed
+count, so memory and drawing cost do not grow with the length of a
+session. StripChart draws it on a Tk canvas with one vertical line per
+pixel column and channel, and only moves the lines whose column changed
+since the last frame.
+"""
+import math
+import tkinter as tk
+
+import numpy
+
+# Name, unit and colour of each channel, in the order values are appended
+CHANNELS = (
+    ("Voltage", "V", "#1f77b4"),
+    ("Current", "A", "#d62728"),
+    ("Power", "W", "#2ca02c"),
+)
+
+
+class HistoryDecimator:
+    """Min/max history of any length in a fixed number of buckets.
+
+    Each bucket holds the minimum and maximum of span consecutive samples.
+    When every bucket is in use, neighbouring buckets are merged pairwise
+    and span doubles, so appending stays O(1) amortized and the full
+    history is always described by at most `buckets` rows. Samples with a
+    NaN or infinite value (e.g. the instrument's not-a-number reply) are
+    counted in skipped and left out, since they have no place on a scale.
+    """
+
+    mins: numpy.ndarray
+    maxs: numpy.ndarray
+
+    def __init__(self, channels: int = 3, buckets: int = 2048) -> None:
+        if buckets < 2 or buckets % 2:
+            raise ValueError("buckets must be an even number of at least 2")
+        self.buckets = buckets
+        self.mins = numpy.zeros((buckets, channels), dtype=numpy.float32)
+        self.maxs = numpy.zeros((buckets, channels), dtype=numpy.float32)
+        self.latest = numpy.zeros(channels)
+        self.filled = 0
+        self.span = 1
+        self.count = 0
+        self.skipped = 0
+        self.first_time = None
+        self.last_time = None
+        # generation changes whenever buckets are merged and so move,
+        # version whenever anything changes
+        self.generation = 0
+        self.version = 0
+        self._in_bucket = 0
+
+    def append(self, timestamp: float, values) -> None:
+        if not all(map(math.isfinite, values)):
+            self.skipped += 1
+            return
+        if self._in_bucket == 0:
+            if self.filled == self.buckets:
+                self._merge()
+            index = self.filled
+            self.mins[index] = values
+            self.maxs[index] = values
+            self.filled += 1
+        else:
+            index = self.filled - 1
+            numpy.minimum(self.mins[index], values, out=self.mins[index])
+            numpy.maximum(self.maxs[index], values, out=self.maxs[index])
+        self._in_bucket += 1
+        if self._in_bucket == self.span:
+            self._in_bucket = 0
+        self.latest[:] = values
+        if self.first_time is None:
+            self.first_time = timestamp
+        self.last_time = timestamp
+        self.count += 1
+        self.version += 1
+
+    def columns(self, width: int) -> tuple:
+        """Returns (mins, maxs) per pixel column for a chart width columns wide.
+
+        Column c always covers the same buckets until the next merge, so
+        new samples only change the columns at the end. Only the columns
+        that hold data are returned.
+        """
+        width = min(width, self.buckets)
+        edges = numpy.arange(width) * self.buckets // width
+        used = int(numpy.searchsorted(edges, self.filled))
+        if used == 0:
+            empty = numpy.empty((0, self.mins.shape[1]), dtype=numpy.float32)
+            return empty, empty
+        edges = edges[:used]
+        return (
+            numpy.minimum.reduceat(self.mins[:self.filled], edges),
+            numpy.maximum.reduceat(self.maxs[:self.filled], edges),
+        )
+
+    @property
+    def duration(self) -> float:
+        return 0.0 if self.first_time is None else self.last_time - self.first_time
+
+    def clear(self) -> None:
+        self.filled = 0
+        self.span = 1
+        self.count = 0
+        self.skipped = 0
+        self.first_time = None
+        self.last_time = None
+        self._in_bucket = 0
+        self.generation += 1
+        self.version += 1
+
+    def _merge(self) -> None:
+        half = self.buckets // 2
+        self.mins[:half] = numpy.minimum(self.mins[0::2], self.mins[1::2])
+        self.maxs[:half] = numpy.maximum(self.maxs[0::2], self.maxs[1::2])
+        self.filled = half
+        self.span *= 2
+        self.generation += 1
+
+
+class StripChart:
+    """Canvas with one band per channel showing the HistoryDecimator's min/max envelope"""
+
+    _lines: list
+    _drawn: list
+    _scales: list
+    _texts: dict
+
+    def __init__(self, parent, width: int = 600, height: int = 240, buckets: int = 2048) -> None:
+        self.width = width
+        self.height = height
+        self.history = HistoryDecimator(len(CHANNELS), buckets)
+        self.canvas = tk.Canvas(parent, width=width, height=height, background="white", highlightthickness=0)
+        self._band_height = height // len(CHANNELS)
+        self._lines = []
+        self._drawn = []
+        self._scales = []
+        for index, (_, _, colour) in enumerate(CHANNELS):
+            top = index * self._band_height
+            if index:
+                self.canvas.create_line(0, top, width, top, fill="#cccccc")
+            self._lines.append([
+                self.canvas.create_line(column, 0, column, 0, fill=colour, state="hidden")
+                for column in range(width)
+            ])
+            self._drawn.append(numpy.full((width, 2), -1, dtype=numpy.int32))
+            self._scales.append(None)
+        self._texts = {}
+        self._drawn_version = -1
+        self._drawn_generation = -1
+
+    def grid(self, **kwargs) -> None:
+        self.canvas.grid(**kwargs)
+
+    def add_samples(self, samples: list) -> None:
+        history = self.history
+        for sample in samples:
+            history.append(sample.timestamp, (sample.voltage, sample.current, sample.power))
+
+    def redraw(self) -> None:
+        """Moves the lines of the columns that changed; does nothing if no sample arrived"""
+        history = self.history
+        if history.version == self._drawn_version:
+            return
+        mins, maxs = history.columns(self.width)
+        moved = history.generation != self._drawn_generation
+        for index, (name, unit, _) in enumerate(CHANNELS):
+            scale = _nice_range(mins[:, index], maxs[:, index])
+            rescaled = moved or scale != self._scales[index]
+            self._scales[index] = scale
+            self._redraw_channel(index, self._to_pixels(index, scale, mins[:, index], maxs[:, index]), rescaled)
+            self._set_text(
+                f"label{index}", 4, index * self._band_height + 2,
+                f"{name}: {history.latest[index]:.3f} {unit}  ({scale[0]:g} to {scale[1]:g} {unit})",
+            )
+        self._set_text("span", self.width - 4, 2, f"History: {_format_duration(history.duration)}", anchor="ne")
+        self._drawn_version = history.version
+        self._drawn_generation = history.generation
+
+    def _to_pixels(self, index: int, scale: tuple, mins, maxs):
+        low, high = scale
+        top = index * self._band_height + 16
+        bottom = (index + 1) * self._band_height - 3
+        factor = (bottom - top) / (high - low)
+        pixels = numpy.empty((len(mins), 2), dtype=numpy.int32)
+        # The maximum is drawn higher on the canvas, so it gives the top end
+        pixels[:, 0] = numpy.rint(bottom - (maxs - low) * factor)
+        pixels[:, 1] = numpy.rint(bottom - (mins - low) * factor) + 1
+        return pixels
+
+    def _redraw_channel(self, index: int, pixels, rescaled: bool) -> None:
+        drawn = self._drawn[index]
+        lines = self._lines[index]
+        used = len(pixels)
+        if rescaled:
+            changed = range(used)
+            for column in range(used, self.width):
+                if drawn[column, 0] >= 0:
+                    self.canvas.itemconfigure(lines[column], state="hidden")
+                    drawn[column] = -1
+        else:
+            changed = numpy.flatnonzero((pixels != drawn[:used]).any(axis=1))
+        for column in changed:
+            top, bottom = pixels[column]
+            if drawn[column, 0] < 0:
+                self.canvas.itemconfigure(lines[column], state="normal")
+            self.canvas.coords(lines[column], column, int(top), column, int(bottom))
+            drawn[column] = (top, bottom)
+
+    def _set_text(self, key: str, x: int, y: int, text: str, anchor: str = "nw") -> None:
+        item = self._texts.get(key)
+        if item is None:
+            self._texts[key] = (self.canvas.create_text(x, y, text=text, anchor=anchor), text)
+        elif item[1] != text:
+            self.canvas.itemconfigure(item[0], text=text)
+            self._texts[key] = (item[0], text)
+
+
+def _nice_ceiling(value: float) -> float:
+    """Rounds value up to 1, 2 or 5 times a power of ten; 0 for anything not positive and finite"""
+    if not math.isfinite(value) or value <= 0:
+        return 0.0
+    magnitude = 10 ** math.floor(math.log10(value))
+    for step in (1, 2, 5, 10):
+        if value <= step * magnitude:
+            return step * magnitude
+    return 10 * magnitude
+
+
+def _nice_range(mins, maxs) -> tuple:
+    """Returns the (low, high) scale of a band, ignoring NaN and infinite values"""
+    mins = mins[numpy.isfinite(mins)]
+    maxs = maxs[numpy.isfinite(maxs)]
+    if len(mins) == 0 or len(maxs) == 0:
+        return 0.0, 1.0
+    lowest = float(mins.min())
+    low = -_nice_ceiling(-lowest) if lowest < 0 else 0.0
+    high = _nice_ceiling(float(maxs.max()))
+    if high <= low:
+        high = low + 1.0
+    return low, high
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
@@ -0,0 +1,156 @@
+"""Waits on the instrument's own completion and status reporting instead of fixed sleeps.
+
+*OPC? answers only once every pending operation has finished, *WAI holds
+the commands after it until then, and the event status register (*ESR?),
+its enable mask (*ESE) and the status byte (*STB?) report events as they
+happen. StatusSynchronizer builds on these so that a sequence continues
+as soon as the instrument is ready rather than after a worst-case delay.
+"""
+import time
+from typing import Callable
+
+from power_supply import (ESR_OPERATION_COMPLETE, STB_EVENT_STATUS, Commands, DebugProtocol, GetCmd,
+                          PowerSupply, decode_int, decode_number)
+
+
+class StatusSynchronizer:
+    """Synchronizes a PowerSupply with the instrument's status reporting.
+
+    Waits that have to poll start at min_poll_interval and back off to
+    poll_interval, so a condition that holds almost at once is seen
+    almost at once while a long wait costs few queries. Every wait raises
+    TimeoutError if its condition does not hold within timeout seconds.
+    """
+
+    min_poll_interval = 0.001
+
+    def __init__(self, power_supply: PowerSupply, poll_interval: float = 0.05) -> None:
+        self.power_supply = power_supply
+        self.poll_interval = poll_interval
+        self._event_status_enable = None
+
+    def wait_complete(self, timeout: float = 10.0) -> None:
+        """Blocks on *OPC? until every pending operation has finished"""
+        reply = self.power_supply.make_command_raw(Commands.GET_OPERATION_COMPLETE, timeout=timeout)
+        if parse_register(reply) != 1:
+            raise TimeoutError(f"operations did not complete within {timeout} s")
+
+    def apply(self, commands: list, timeout: float = 10.0) -> list:
+        """Sends commands followed by *OPC? in one message and returns once they have taken effect.
+
+        commands are entries as for PowerSupply.make_commands, and their
+        results are returned.
+        """
+        results = self.power_supply.make_commands(
+            list(commands) + [Commands.GET_OPERATION_COMPLETE], timeout=timeout
+        )
+        if parse_register(results[-1]) != 1:
+            raise TimeoutError(f"commands did not complete within {timeout} s")
+        return results[:-1]
+
+    def apply_and_measure(self, commands: list, queries: list, timeout: float = 10.0) -> list:
+        """Sends commands, *WAI and queries in one message and returns the query results.
+
+        *WAI makes the instrument hold the queries until the commands have
+        taken effect, so the measurement follows the setpoint in a single
+        round trip.
+        """
+        results = self.power_supply.make_commands(
+            list(commands) + [Commands.WAIT_TO_CONTINUE] + list(queries), timeout=timeout
+        )
+        return results[len(commands) + 1:]
+
+    def enable_events(self, event_mask: int, service_request_mask: int = None) -> None:
+        """Sets which event status bits are summarized in the status byte (*ESE),
+        and optionally which status byte bits request service (*SRE)"""
+        entries = []
+        if event_mask != self._event_status_enable:
+            entries.append((Commands.SET_EVENT_STATUS_ENABLE, event_mask))
+        if service_request_mask is not None:
+            entries.append((Commands.SET_SERVICE_REQUEST_ENABLE, service_request_mask))
+        if entries:
+            self.power_supply.make_commands(entries)
+        self._event_status_enable = event_mask
+
+    def status_byte(self) -> int:
+        return parse_register(self.power_supply.make_command_raw(Commands.GET_STATUS_BYTE))
+
+    def read_events(self) -> int:
+        """Reads and clears the event status register"""
+        return parse_register(self.power_supply.make_command_raw(Commands.GET_EVENT_STATUS_REG))
+
+    def wait_for_event(self, event_mask: int, timeout: float = 10.0) -> int:
+        """Waits until one of the event status bits in event_mask is set and returns the register.
+
+        Only the status byte is polled, which leaves the event register
+        alone; it is read (and so cleared) once the event has fired.
+        """
+        self.enable_events(event_mask)
+        self._poll(lambda: self.status_byte() & STB_EVENT_STATUS, timeout, "event")
+        return self.read_events()
+
+    def wait_complete_polled(self, timeout: float = 10.0) -> int:
+        """Like wait_complete, but polls for the operation complete event set by *OPC
+        so that other threads can use the connection while waiting"""
+        self.read_events()
+        self.power_supply.make_command(Commands.SET_OPERATION_COMPLETE)
+        return self.wait_for_event(ESR_OPERATION_COMPLETE, timeout)
+
+    def wait_until(self, query: GetCmd, condition: Callable, timeout: float = 10.0) -> str:
+        """Polls query until condition(reply) is true and returns that reply"""
+        replies = []
+
+        def check() -> bool:
+            reply = self.power_supply.make_command_raw(query)
+            if isinstance(reply, (bytes, bytearray)):
+                reply = reply.decode(errors="replace")
+            replies.append(reply.strip())
+            return condition(replies[-1])
+
+        self._poll(check, timeout, query.command)
+        return replies[-1]
+
+    def wait_for_value(self, query: GetCmd, target: float, tolerance: float, timeout: float = 10.0) -> float:
+        """Polls a numeric query (e.g. Commands.GET_VOLTS) until it is within tolerance of target"""
+        def settled(reply: str) -> bool:
+            try:
+                return abs(decode_number(reply) - target) <= tolerance
+            except ValueError:
+                return False
+
+        return decode_number(self.wait_until(query, settled, timeout))
+
+    def _poll(self, check: Callable, timeout: float, what: str) -> None:
+        deadline = time.monotonic() + timeout
+        interval = self.min_poll_interval
+        while not check():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{what} did not happen within {timeout} s")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.poll_interval)
+
+
+def parse_register(reply) -> int:
+    """Decodes a status register reply, treating a missing or garbled one as 0"""
+    try:
+        return decode_int(reply)
+    except (ValueError, OverflowError):
+        return 0
+
+
+def example_set_and_measure():
+    """Sets the voltage and measures it as soon as the setting has taken effect"""
+    synchronizer = StatusSynchronizer(PowerSupply(protocol=DebugProtocol()))
+    print(synchronizer.apply_and_measure(
+        [(Commands.SET_VOLTS, 10.0), (Commands.SET_CHANNEL_STATE, "ON")],
+        [Commands.GET_VOLTS, Commands.GET_CURR],
+    ))
+
+
+def main():
+    example_set_and_measure()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Streams telemetry samples to an append-only binary recording.
+
+A recording is a 16 byte header followed by fixed-size records of five
+little-endian float64 values: timestamp, voltage, current, power and mode
+code (an index into MODES). Since every record has the same size, a file
+can be memory-mapped for analysis, e.g. with open_recording() or
+numpy.memmap(path, dtype="<f8", offset=HEADER_SIZE).reshape(-1, 5).
+
+To convert a recording, run
+`python3 telemetry_recorder.py export run.psurec run.csv`
+(or run.xlsx, which needs openpyxl).
+"""
+import argparse
+import csv
+import mmap
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from acquisition import Sample
+
+MAGIC = b"PSUREC01"
+HEADER = struct.Struct("<8sII")
+HEADER_SIZE = HEADER.size
+FIELDS = ("timestamp", "voltage", "current", "power", "mode")
+RECORD_SIZE = 8 * len(FIELDS)
+MODES = ("Unknown", "OFF", "CV", "CC", "CP")
+XLSX_MAX_ROWS = 1048576
+
+_MODE_CODES = {mode: float(code) for code, mode in enumerate(MODES)}
+
+
+class TelemetryRecorder:
+    """Records samples into a preallocated chunk that is appended to a file when full.
+
+    Memory use is fixed by chunk_size no matter how long the run is. The
+    chunk is also written out once it holds samples older than
+    flush_interval seconds, which bounds what a crash can lose at slow
+    sample rates. The array module stores the values in native byte order,
+    which matches the little-endian file format on the platforms this runs on.
+    """
+
+    _chunk: array
+    _used: int
+
+    def __init__(self, path: str, chunk_size: int = 4096, flush_interval: float = 1.0) -> None:
+        if sys.byteorder != "little":
+            raise RuntimeError("TelemetryRecorder only supports little-endian hosts")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._chunk = array("d", bytes(RECORD_SIZE * chunk_size))
+        self._used = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, len(FIELDS), 0))
+        else:
+            try:
+                if self._file.tell() < HEADER_SIZE or (self._file.tell() - HEADER_SIZE) % RECORD_SIZE:
+                    raise ValueError("not a telemetry recording")
+                with open(path, "rb") as existing:
+                    _check_header(existing.read(HEADER_SIZE))
+            except ValueError:
+                self._file.close()
+                raise ValueError(f"{path} is not a telemetry recording") from None
+        self._chunk_started = None
+
+    def append(self, sample: Sample) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            offset = self._used * len(FIELDS)
+            chunk = self._chunk
+            chunk[offset] = sample.timestamp
+            chunk[offset + 1] = sample.voltage
+            chunk[offset + 2] = sample.current
+            chunk[offset + 3] = sample.power
+            chunk[offset + 4] = _MODE_CODES.get(str(sample.mode).strip().upper(), 0.0)
+            self._used += 1
+            self.records += 1
+            if self._used == 1:
+                self._chunk_started = time.monotonic()
+            if self._used == self.chunk_size:
+                self._flush_chunk()
+            elif time.monotonic() - self._chunk_started >= self.flush_interval:
+                self._flush_chunk()
+                self._file.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_chunk()
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_chunk()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _flush_chunk(self) -> None:
+        if self._used:
+            with memoryview(self._chunk) as view:
+                self._file.write(view[:self._used * len(FIELDS)])
+            self._used = 0
+
+
+def open_recording(path: str) -> memoryview:
+    """Memory-maps a recording and returns a (records, 5) float64 memoryview of it.
+
+    A recording without any records gives an empty flat view.
+    """
+    with open(path, "rb") as file:
+        size = file.seek(0, 2)
+        if size <= HEADER_SIZE:
+            return memoryview(array("d"))
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    _check_header(mapped[:HEADER_SIZE])
+    records = (size - HEADER_SIZE) // RECORD_SIZE
+    view = memoryview(mapped)[HEADER_SIZE:HEADER_SIZE + records * RECORD_SIZE]
+    return view.cast("d", shape=[records, len(FIELDS)])
+
+
+def iter_records(path: str, chunk_records: int = 65536):
+    """Yields (timestamp, voltage, current, power, mode) rows, reading chunk_records at a time"""
+    buffer = bytearray(RECORD_SIZE * chunk_records)
+    record = struct.Struct("<5d")
+    with open(path, "rb") as file:
+        _check_header(file.read(HEADER_SIZE))
+        while True:
+            read = file.readinto(buffer)
+            read -= read % RECORD_SIZE
+            if not read:
+                return
+            for timestamp, voltage, current, power, mode in record.iter_unpack(memoryview(buffer)[:read]):
+                yield timestamp, voltage, current, power, _mode_name(mode)
+
+
+def export_csv(path: str, csv_path: str) -> int:
+    """Writes a recording to CSV row by row and returns the number of rows"""
+    rows = 0
+    with open(csv_path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(FIELDS)
+        for row in iter_records(path):
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+
+def export_xlsx(path: str, xlsx_path: str) -> int:
+    """Writes a recording to XLSX in streaming mode and returns the number of rows.
+
+    Rows beyond what one sheet can hold continue on additional sheets.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError as error:
+        raise RuntimeError("XLSX export needs openpyxl (pip install openpyxl)") from error
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    rows = 0
+    for row in iter_records(path):
+        if sheet_rows == XLSX_MAX_ROWS:
+            sheet = workbook.create_sheet(f"Telemetry {len(workbook.worksheets) + 1}")
+            sheet.append(FIELDS)
+            sheet_rows = 1
+        sheet.append(row)
+        sheet_rows += 1
+        rows += 1
+    if sheet is None:
+        workbook.create_sheet("Telemetry 1").append(FIELDS)
+    workbook.save(xlsx_path)
+    return rows
+
+
+def export(path: str, out_path: str) -> int:
+    if out_path.lower().endswith(".xlsx"):
+        return export_xlsx(path, out_path)
+    return export_csv(path, out_path)
+
+
+def _check_header(header: bytes) -> None:
+    magic, fields, _ = HEADER.unpack(header)
+    if magic != MAGIC or fields != len(FIELDS):
+        raise ValueError("not a telemetry recording")
+
+
+def _mode_name(code: float) -> str:
+    index = int(code)
+    return MODES[index] if 0 <= index < len(MODES) else MODES[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry recording tools")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    export_parser = subparsers.add_parser("export", help="convert a recording to CSV or XLSX")
+    export_parser.add_argument("recording")
+    export_parser.add_argument("output", help="output file, .csv or .xlsx")
+    args = parser.parse_args()
+
+    if args.action == "export":
+        rows = export(args.recording, args.output)
+        print(f"Exported {rows} samples to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Test doubles shared by the tests"""
+import time
+
+from power_supply import Protocol
+from scpi_simulator import SimulatedInstrument, split_message
+
+
+class FakeProtocol(Protocol):
+    """Records every write and answers each read with the next queued reply.
+
+    Reads after the last queued reply return an empty reply, like a
+    transport that timed out. Every read takes delay seconds. When
+    write_error or read_error is set, every write or read raises it
+    instead. close() only records that it was called.
+    """
+
+    def __init__(self, *replies, delay: float = 0.0, write_error: Exception = None,
+                 read_error: Exception = None) -> None:
+        self.replies = list(replies)
+        self.writes = []
+        self.delay = delay
+        self.write_error = write_error
+        self.read_error = read_error
+        self.closed = False
+
+    def write(self, msg=b"") -> None:
+        if self.write_error is not None:
+            raise self.write_error
+        # PowerSupply reuses its encode buffer, so keep a copy
+        self.writes.append(bytes(msg))
+
+    def read(self, timeout: float = None):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.read_error is not None:
+            raise self.read_error
+        return self.replies.pop(0) if self.replies else ""
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class InstrumentProtocol(Protocol):
+    """Runs every message on an in-process SimulatedInstrument, without a socket"""
+
+    def __init__(self, instrument: SimulatedInstrument = None) -> None:
+        self.instrument = SimulatedInstrument() if instrument is None else instrument
+        self.writes = []
+        self._replies = []
+
+    def write(self, msg=b"") -> None:
+        self.writes.append(bytes(msg))
+        replies = [reply for header, args in split_message(bytes(msg).decode())
+                   if (reply := self.instrument.execute(header, args)) is not None]
+        if replies:
+            self._replies.append(";".join(replies) + "\n")
+
+    def read(self, timeout: float = None):
+        return self._replies.pop(0) if self._replies else ""
@@ -0,0 +1,108 @@
+import logging
+import time
+
+from acquisition import AcquisitionWorker, Sample, SampleRing
+from fakes import FakeProtocol, InstrumentProtocol
+from power_supply import Commands, PowerSupply
+from scpi_simulator import SimulatedInstrument
+
+
+def make_sample(index: int) -> Sample:
+    return Sample(float(index), 1.0, 2.0, 2.0, "CV")
+
+
+def wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_ring_returns_samples_since_a_count():
+    ring = SampleRing(size=4)
+    assert ring.latest() is None
+    for index in range(3):
+        ring.append(make_sample(index))
+    assert len(ring) == 3
+    assert ring.latest().timestamp == 2.0
+    assert [sample.timestamp for sample in ring.since(1)] == [1.0, 2.0]
+    assert ring.since(ring.count) == []
+    assert [sample.timestamp for sample in ring.since(0, 2)] == [0.0, 1.0]
+
+
+def test_ring_skips_overwritten_samples():
+    ring = SampleRing(size=4)
+    for index in range(10):
+        ring.append(make_sample(index))
+    assert len(ring) == 4
+    assert ring.count == 10
+    # One slot is never read while it may be overwritten, so at most size - 1 come back
+    assert [sample.timestamp for sample in ring.since(0)] == [7.0, 8.0, 9.0]
+
+
+def test_worker_measures_into_the_ring():
+    power_supply = PowerSupply(protocol=InstrumentProtocol(SimulatedInstrument(load_resistance=2.0)))
+    power_supply.make_commands([(Commands.SET_VOLTS, 10), (Commands.SET_CURR, 10), (Commands.SET_CHANNEL_STATE, 1)])
+    worker = AcquisitionWorker(power_supply, interval=0.01)
+    worker.start()
+    try:
+        wait_for(lambda: worker.samples.count >= 3)
+    finally:
+        worker.stop()
+    sample = worker.samples.latest()
+    assert (sample.voltage, sample.current, sample.power) == (10.0, 5.0, 50.0)
+    assert sample.mode.strip() == "CV"
+    assert not worker.is_alive()
+
+
+def test_worker_counts_errors_and_keeps_running():
+    worker = AcquisitionWorker(PowerSupply(protocol=FakeProtocol(read_error=TimeoutError())), interval=0.01)
+    worker.start()
+    try:
+        wait_for(lambda: worker.errors >= 2)
+    finally:
+        worker.stop()
+    assert isinstance(worker.last_error, TimeoutError)
+    assert worker.samples.count == 0
+
+
+def test_worker_skips_replies_that_do_not_decode():
+    worker = AcquisitionWorker(PowerSupply(protocol=FakeProtocol(*["READ DEBUG"] * 100)), interval=0.01)
+    worker.start()
+    try:
+        wait_for(lambda: worker.errors >= 2)
+    finally:
+        worker.stop()
+    assert isinstance(worker.last_error, ValueError)
+    assert worker.samples.count == 0
+
+
+class FlakyProtocol(InstrumentProtocol):
+    """Fails the first failures reads with a timeout, then answers from the instrument"""
+
+    def __init__(self, failures: int) -> None:
+        super().__init__(SimulatedInstrument(load_resistance=2.0))
+        self.failures = failures
+
+    def read(self, timeout: float = None):
+        reply = super().read(timeout)
+        if self.failures:
+            self.failures -= 1
+            raise TimeoutError("no reply")
+        return reply
+
+
+def test_worker_logs_a_run_of_failures_once_and_its_end(caplog):
+    caplog.set_level(logging.INFO, logger="acquisition")
+    worker = AcquisitionWorker(PowerSupply(protocol=FlakyProtocol(failures=3)), interval=0.01)
+    worker.start()
+    try:
+        wait_for(lambda: worker.samples.count >= 1)
+    finally:
+        worker.stop()
+    assert worker.errors == 3
+    messages = [(record.levelname, record.getMessage()) for record in caplog.records]
+    assert messages == [
+        ("WARNING", "acquisition failed: TimeoutError('no reply')"),
+        ("INFO", "acquisition recovered after 3 failed measurements"),
+    ]
@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+
+from async_power_supply import AsyncEthernetProtocol, AsyncPowerSupply, AsyncProtocol
+from power_supply import Commands
+
+
+class EchoProtocol(AsyncProtocol):
+    """Answers every written line with "<line>=reply" after a short delay, logging each step"""
+
+    def __init__(self, read_error: Exception = None) -> None:
+        self.log = []
+        self.unanswered = deque()
+        self.written = asyncio.Event()
+        self.read_error = read_error
+
+    async def write(self, msg: bytes = b"") -> None:
+        self.log.append(("write", msg))
+        self.unanswered.append(msg.decode().strip())
+        self.written.set()
+
+    async def read(self) -> str:
+        await asyncio.sleep(0.01)
+        if self.read_error is not None:
+            raise self.read_error
+        while not self.unanswered:
+            self.written.clear()
+            await self.written.wait()
+        reply = f"{self.unanswered.popleft()}=reply\n"
+        self.log.append(("read", reply))
+        return reply
+
+
+def test_queries_are_pipelined_and_matched_in_order():
+    async def scenario():
+        protocol = EchoProtocol()
+        power_supply = AsyncPowerSupply(protocol)
+        replies = await asyncio.gather(
+            power_supply.make_command(Commands.GET_VOLTS),
+            power_supply.make_command(Commands.GET_CURR),
+            power_supply.make_command(Commands.GET_OUT_MODE),
+        )
+        return protocol.log, replies
+
+    log, replies = asyncio.run(scenario())
+    assert [kind for kind, _ in log] == ["write", "write", "write", "read", "read", "read"]
+    assert [reply.strip() for reply in replies] == ["MEAS:VOLT?=reply", "MEAS:CURR?=reply", "OUTP:MODE?=reply"]
+
+
+def test_set_commands_do_not_wait_for_a_reply():
+    async def scenario():
+        protocol = EchoProtocol()
+        reply = await AsyncPowerSupply(protocol).make_command(Commands.SET_VOLTS, "5")
+        return protocol.log, reply
+
+    log, reply = asyncio.run(scenario())
+    assert reply == ""
+    assert [kind for kind, _ in log] == ["write"]
+
+
+def test_read_error_fails_every_pending_query():
+    async def scenario():
+        power_supply = AsyncPowerSupply(EchoProtocol(read_error=ConnectionResetError("gone")))
+        return await asyncio.gather(
+            power_supply.make_command(Commands.GET_VOLTS),
+            power_supply.make_command(Commands.GET_CURR),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ConnectionResetError) for result in results)
+
+
+def test_ethernet_protocol_talks_to_a_tcp_server():
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            writer.write(b"5.000;1.000\n" if line.startswith(b"MEAS") else b"?\n")
+            await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        power_supply = AsyncPowerSupply(AsyncEthernetProtocol("127.0.0.1", port, timeout=2.0))
+        try:
+            return await power_supply.make_commands([Commands.GET_VOLTS, (Commands.SET_VOLTS, 5), Commands.GET_CURR])
+        finally:
+            await power_supply.close()
+            server.close()
+            await server.wait_closed()
+
+    assert asyncio.run(scenario()) == ["5.000", "", "1.000"]
+
+
+def test_make_commands_with_nothing_to_send():
+    async def scenario():
+        protocol = EchoProtocol()
+        return await AsyncPowerSupply(protocol).make_commands([]), protocol.log
+
+    assert asyncio.run(scenario()) == ([], [])
+
+
+class LateProtocol(EchoProtocol):
+    """Times out on the first read; its reply stays queued until the input is discarded"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.timeouts = 1
+
+    async def read(self) -> str:
+        if self.timeouts:
+            self.timeouts -= 1
+            raise TimeoutError("no reply")
+        return await super().read()
+
+    async def discard_input(self) -> None:
+        self.log.append(("discard", len(self.unanswered)))
+        self.unanswered.clear()
+
+
+def test_late_reply_is_discarded_after_a_timeout():
+    async def scenario():
+        protocol = LateProtocol()
+        power_supply = AsyncPowerSupply(protocol)
+        first = await asyncio.gather(power_supply.make_command(Commands.GET_VOLTS), return_exceptions=True)
+        second = await power_supply.make_command(Commands.GET_CURR)
+        return protocol.log, first, second
+
+    log, first, second = asyncio.run(scenario())
+    assert isinstance(first[0], TimeoutError)
+    assert second.strip() == "MEAS:CURR?=reply"
+    assert ("discard", 1) in log
@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+
+from benchmark import compare, measure, run
+
+
+def test_measure_reports_throughput_and_percentiles():
+    calls = []
+    result = measure(lambda: calls.append(None), 50)
+    assert len(calls) == 100
+    assert result["iterations"] == 50
+    assert result["ops_per_sec"] > 0
+    assert 0 <= result["p50"] <= result["p99"] <= result["max"]
+
+
+def test_run_covers_every_case_of_the_selected_benchmarks():
+    results = run(20, ["debug", "ethernet_loopback"])
+    assert set(results["benchmarks"]) == {"debug", "ethernet_loopback"}
+    assert set(results["benchmarks"]["ethernet_loopback"]) == {"get_volts", "set_volts", "telemetry_batch"}
+    assert results["metadata"]["iterations"] == 20
+
+
+def test_compare_matches_cases_present_in_both_runs():
+    baseline = {"benchmarks": {"debug": {"get_volts": {"ops_per_sec": 100.0}}}}
+    current = {"benchmarks": {"debug": {"get_volts": {"ops_per_sec": 150.0}, "set_volts": {"ops_per_sec": 1.0}}}}
+    assert compare(baseline, current) == [("debug", "get_volts", 100.0, 150.0, 1.5)]
+
+
+def test_gui_benchmark_closes_the_app_afterwards():
+    threads = set(threading.enumerate())
+    results = run(5, ["gui"])
+    if "gui" in results["skipped"]:
+        pytest.skip(results["skipped"]["gui"])
+    assert results["benchmarks"]["gui"]["update_actual"]["iterations"] == 5
+    assert set(threading.enumerate()) <= threads
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+from command_queue import (CONTROL, SAFETY, TELEMETRY, CommandQueue, QueueFullError, WriteBehindPowerSupply,
+                           priority_of)
+from fakes import FakeProtocol
+from metrics import prometheus_text
+from power_supply import Commands, PowerSupply
+
+
+@pytest.mark.parametrize("entries, expected", [
+    ([(Commands.SET_CHANNEL_STATE, "0")], SAFETY),
+    ([(Commands.SET_CHANNEL_STATE, " off ")], SAFETY),
+    ([(Commands.SET_CHANNEL_STATE, "1")], CONTROL),
+    ([(Commands.RESET,)], SAFETY),
+    ([(Commands.SET_OCP_STATE, "1")], SAFETY),
+    ([(Commands.SET_OCP_STATE, "0")], CONTROL),
+    ([(Commands.SET_OCP_DELAY, "0.1")], CONTROL),
+    ([(Commands.ABORT,)], SAFETY),
+    ([(Commands.SET_VOLTS, "5")], CONTROL),
+    ([(Commands.GET_VOLTS,), (Commands.GET_CURR,)], TELEMETRY),
+    ([(Commands.GET_VOLTS,), (Commands.SET_VOLTS, "5"), (Commands.SET_CHANNEL_STATE, "OFF")], SAFETY),
+])
+def test_priority_of(entries, expected):
+    assert priority_of(entries) == expected
+
+
+def test_output_off_runs_ahead_of_queued_telemetry():
+    protocol = FakeProtocol()
+    with CommandQueue(PowerSupply(protocol=protocol), max_depth=256) as command_queue:
+        gate = command_queue.submit_call("gate", lambda power_supply: time.sleep(0.1))
+        telemetry = [command_queue.submit(Commands.GET_VOLTS) for _ in range(5)]
+        command_queue.output_off().result()
+        gate.result()
+        for future in telemetry:
+            future.result()
+    assert protocol.writes[0] == b"OUTP 0\n"
+    assert protocol.writes[1:] == [b"MEAS:VOLT?\n"] * 5
+
+
+def test_reset_cancels_the_control_writes_queued_before_it():
+    protocol = FakeProtocol()
+    command_queue = CommandQueue(PowerSupply(protocol=protocol))
+    power_supply = WriteBehindPowerSupply(command_queue)
+    gate = command_queue.submit_call("gate", lambda _: time.sleep(0.1))
+    power_supply.make_command(Commands.SET_VOLTS, "50")
+    power_supply.make_command(Commands.SET_CHANNEL_STATE, "1")
+    power_supply.make_command(Commands.RESET)
+    power_supply.make_command(Commands.SET_OCP_STATE, "0")
+    gate.result()
+    power_supply.close(timeout=1.0)
+    assert protocol.writes == [b"*RST\n", b"CURR:PROT:STAT 0\n"]
+    assert command_queue.superseded == 2
+    assert power_supply.failed == 0
+
+
+def test_output_off_cancels_a_queued_output_on_but_keeps_setpoints():
+    protocol = FakeProtocol()
+    command_queue = CommandQueue(PowerSupply(protocol=protocol))
+    power_supply = WriteBehindPowerSupply(command_queue)
+    gate = command_queue.submit_call("gate", lambda _: time.sleep(0.1))
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    power_supply.make_command(Commands.SET_CHANNEL_STATE, "1")
+    power_supply.make_command(Commands.SET_CHANNEL_STATE, "0")
+    gate.result()
+    power_supply.close(timeout=1.0)
+    assert protocol.writes == [b"OUTP 0\n", b"VOLT 5\n"]
+
+
+def test_wait_is_exported_as_its_own_metric_by_priority():
+    with CommandQueue(PowerSupply(protocol=FakeProtocol())) as command_queue:
+        command_queue.output_off().result()
+    text = prometheus_text(command_queue.wait_metrics)
+    assert 'psu_queue_wait_latency_seconds_count{command="OUTP",priority="safety"} 1' in text
+    assert "transport" not in text
+    assert "bytes_sent" not in text
+
+
+def test_full_queue_refuses_without_blocking_but_takes_safety_commands():
+    protocol = FakeProtocol()
+    with CommandQueue(PowerSupply(protocol=protocol), max_depth=1) as command_queue:
+        gate = command_queue.submit_call("gate", lambda power_supply: time.sleep(0.1))
+        time.sleep(0.02)
+        command_queue.submit(Commands.SET_VOLTS, "5")
+        with pytest.raises(QueueFullError):
+            command_queue.submit(Commands.SET_VOLTS, "6", block=False)
+        off = command_queue.output_off()
+        gate.result()
+        off.result()
+    assert protocol.writes == [b"OUTP 0\n", b"VOLT 5\n"]
+
+
+def test_blocking_calls_return_replies_and_errors():
+    protocol = FakeProtocol(b"5.0\n")
+    with CommandQueue(PowerSupply(protocol=protocol)) as command_queue:
+        assert command_queue.query(Commands.GET_VOLTS) == 5.0
+        failed = command_queue.submit_call("boom", lambda power_supply: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            failed.result()
+
+
+def test_write_behind_returns_before_the_write_runs():
+    protocol = FakeProtocol()
+    command_queue = CommandQueue(PowerSupply(protocol=protocol))
+    power_supply = WriteBehindPowerSupply(command_queue)
+    gate = command_queue.submit_call("gate", lambda _: time.sleep(0.2))
+    start = time.monotonic()
+    assert power_supply.make_command(Commands.SET_VOLTS, "5") == ""
+    assert time.monotonic() - start < 0.1
+    gate.result()
+    power_supply.close(timeout=1.0)
+    assert protocol.writes == [b"VOLT 5\n"]
+
+
+def test_write_behind_records_failed_writes():
+    protocol = FakeProtocol(write_error=OSError("link down"))
+    power_supply = WriteBehindPowerSupply(CommandQueue(PowerSupply(protocol=protocol)))
+    assert power_supply.make_commands([(Commands.SET_VOLTS, "5"), (Commands.SET_CURR, "1")]) == ["", ""]
+    power_supply.close(timeout=1.0)
+    assert power_supply.failed == 1
+    assert isinstance(power_supply.last_error, OSError)
+
+
+def test_write_behind_waits_for_queries():
+    power_supply = WriteBehindPowerSupply(CommandQueue(PowerSupply(protocol=FakeProtocol(b"5.0\n"))))
+    try:
+        assert power_supply.query(Commands.GET_VOLTS) == 5.0
+    finally:
+        power_supply.close(timeout=1.0)
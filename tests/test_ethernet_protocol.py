@@ -0,0 +1,114 @@
+import socket
+import time
+
+import pytest
+
+from power_supply import Commands, EthernetProtocol, PowerSupply, PowerSupplyConnectionError
+from scpi_simulator import ScpiSimulator
+
+
+@pytest.fixture
+def simulator():
+    simulator = ScpiSimulator(command_latency={"*TST?": 0.3})
+    port = simulator.start_in_thread()
+    yield simulator, port
+    simulator.stop_thread()
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_round_trip_against_the_simulator(simulator):
+    _, port = simulator
+    protocol = EthernetProtocol("127.0.0.1", port)
+    try:
+        power_supply = PowerSupply(protocol=protocol)
+        replies = power_supply.make_commands([(Commands.SET_VOLTS, 5), Commands.GET_ID_STRING, Commands.GET_OUT_MODE])
+        assert replies[0] == ""
+        assert replies[2] == "OFF"
+        assert protocol.s.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    finally:
+        protocol.close()
+
+
+def test_connection_refused_raises():
+    with pytest.raises(PowerSupplyConnectionError):
+        EthernetProtocol("127.0.0.1", unused_port(), connect_timeout=0.5)
+
+
+def test_slow_reply_raises_timeout(simulator):
+    _, port = simulator
+    protocol = EthernetProtocol("127.0.0.1", port, timeout=0.05)
+    try:
+        protocol.write(b"*TST?\n")
+        with pytest.raises(TimeoutError):
+            protocol.read()
+    finally:
+        protocol.close()
+
+
+def test_late_reply_does_not_answer_the_next_query():
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        protocol = EthernetProtocol("127.0.0.1", listener.getsockname()[1], timeout=0.05)
+        try:
+            first, _ = listener.accept()
+            with first:
+                protocol.write(b"MEAS:VOLT?\n")
+                with pytest.raises(TimeoutError):
+                    protocol.read()
+                first.sendall(b"5.000\n")
+                protocol.write(b"MEAS:CURR?\n")
+                second, _ = listener.accept()
+                with second:
+                    assert second.recv(64) == b"MEAS:CURR?\n"
+                    second.sendall(b"1.000\n")
+                    assert protocol.read() == b"1.000\n"
+        finally:
+            protocol.close()
+
+
+def test_write_reconnects_after_the_link_dropped():
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        protocol = EthernetProtocol("127.0.0.1", listener.getsockname()[1], backoff=0.01)
+        try:
+            listener.accept()[0].close()
+            # The first write after the drop only brings back the peer's reset
+            protocol.write(b"*OPC?\n")
+            time.sleep(0.05)
+            protocol.write(b"*OPC?\n")
+            instrument, _ = listener.accept()
+            with instrument:
+                assert instrument.recv(64) == b"*OPC?\n"
+                instrument.sendall(b"1\n")
+                assert protocol.read() == b"1\n"
+        finally:
+            protocol.close()
+
+
+def test_lost_link_while_waiting_raises():
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        protocol = EthernetProtocol("127.0.0.1", listener.getsockname()[1])
+        try:
+            listener.accept()[0].close()
+            with pytest.raises(PowerSupplyConnectionError):
+                protocol.read()
+            assert protocol.s is None
+        finally:
+            protocol.close()
+
+
+def test_binary_block_array_against_the_simulator(simulator):
+    _, port = simulator
+    protocol = EthernetProtocol("127.0.0.1", port)
+    try:
+        power_supply = PowerSupply(protocol=protocol)
+        power_supply.make_commands([(Commands.SET_VOLTS, 2.5), (Commands.SET_CURR, 10), (Commands.SET_CHANNEL_STATE, 1)])
+        values = power_supply.query(Commands.GET_VOLTS_ARRAY, 64)
+        assert values.tolist() == [2.5] * 64
+        # The connection is still framed correctly after the block
+        assert power_supply.query(Commands.GET_OUT_MODE) == "CV"
+    finally:
+        protocol.close()
@@ -0,0 +1,77 @@
+import numpy
+import pytest
+
+from fleet_simulator import MODE_CC, MODE_CP, MODE_CV, MODE_OFF, FleetProtocol, PowerSupplyFleet
+from power_supply import Commands, PowerSupply
+
+
+def settle(fleet: PowerSupplyFleet, steps: int = 200) -> None:
+    for _ in range(steps):
+        fleet.step(0.001)
+
+
+def test_units_settle_in_cv_cc_and_cp():
+    fleet = PowerSupplyFleet(4, load_resistance=[2.0, 2.0, 2.0, 2.0])
+    everyone = slice(None)
+    fleet.set_voltage(everyone, [10.0, 40.0, 40.0, 10.0])
+    fleet.set_current(everyone, [100.0, 5.0, 100.0, 100.0])
+    fleet.set_power(everyone, [3000.0, 3000.0, 200.0, 3000.0])
+    fleet.set_output(everyone, [True, True, True, False])
+    settle(fleet)
+    assert fleet.mode.tolist() == [MODE_CV, MODE_CC, MODE_CP, MODE_OFF]
+    assert fleet.voltage == pytest.approx([10.0, 10.0, 20.0, 0.0])
+    assert fleet.current == pytest.approx([5.0, 5.0, 10.0, 0.0])
+
+
+def test_output_slews_toward_its_setpoint():
+    fleet = PowerSupplyFleet(1, slew_rate=100.0)
+    fleet.set_voltage(0, 50.0)
+    fleet.set_current(0, 120.0)
+    fleet.set_output(0, True)
+    fleet.step(0.1)
+    assert fleet.voltage[0] == pytest.approx(10.0)
+
+
+def test_ocp_trips_after_its_delay_in_cc():
+    fleet = PowerSupplyFleet(2, load_resistance=1.0)
+    everyone = slice(None)
+    fleet.set_voltage(everyone, 20.0)
+    fleet.set_current(everyone, 5.0)
+    fleet.set_ocp(everyone, [True, False], delay=0.05)
+    fleet.set_output(everyone, True)
+    settle(fleet, 100)
+    assert fleet.ocp_tripped.tolist() == [True, False]
+    assert fleet.output_on.tolist() == [False, True]
+    fleet.set_output(0, True)
+    assert not fleet.ocp_tripped[0]
+
+
+def test_setters_clip_to_the_limits_and_refuse_negative_loads():
+    fleet = PowerSupplyFleet(2)
+    fleet.set_voltage(slice(None), [100.0, -1.0])
+    assert fleet.voltage_setpoint.tolist() == [80.0, 0.0]
+    with pytest.raises(ValueError):
+        fleet.set_load(0, -1.0)
+
+
+def test_power_supply_drives_a_unit_through_fleet_protocol():
+    fleet = PowerSupplyFleet(3, load_resistance=2.0)
+    power_supply = PowerSupply(protocol=FleetProtocol(fleet, 1))
+    power_supply.make_commands([(Commands.SET_CURR, 5.0), (Commands.SET_VOLTS, 20.0), (Commands.SET_CHANNEL_STATE, 1)])
+    settle(fleet)
+    assert power_supply.query_all([Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]) == [10.0, 5.0, "CC"]
+    assert fleet.output_on.tolist() == [False, True, False]
+
+
+def test_fleet_protocol_queues_errors():
+    protocol = FleetProtocol(PowerSupplyFleet(1), 0)
+    protocol.write(b"BOGUS;VOLT 500;SYST:ERR?;SYST:ERR?;SYST:ERR?\n")
+    assert protocol.read() == b'-113,"Undefined header";-224,"Illegal parameter value";0,"No error"\n'
+    with pytest.raises(IndexError):
+        FleetProtocol(PowerSupplyFleet(1), 1)
+
+
+def test_every_unit_gets_a_protocol():
+    fleet = PowerSupplyFleet(5)
+    assert [protocol.unit for protocol in fleet.protocols()] == list(range(5))
+    assert numpy.all(fleet.power == 0)
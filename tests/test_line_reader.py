@@ -0,0 +1,149 @@
+import pytest
+
+from power_supply import LineReader, UsbProtocol
+
+
+class Packets:
+    """fill() for a LineReader that hands out one scripted packet per call"""
+
+    def __init__(self, *packets) -> None:
+        self.packets = list(packets)
+        self.calls = 0
+
+    def __call__(self, view: memoryview, timeout: float) -> int:
+        self.calls += 1
+        if not self.packets:
+            return 0
+        packet = self.packets.pop(0)
+        if len(packet) > len(view):
+            # Like recv_into, hand out what fits and keep the rest for the next call
+            self.packets.insert(0, packet[len(view):])
+            packet = packet[:len(view)]
+        view[:len(packet)] = packet
+        return len(packet)
+
+
+def test_reply_split_across_packets_is_joined():
+    reader = LineReader(Packets(b"12.", b"5", b"00\n"))
+    assert reader.read_line() == b"12.500\n"
+
+
+def test_replies_that_arrive_together_are_kept_for_later_reads():
+    fill = Packets(b"1\n2\n3")
+    reader = LineReader(fill)
+    assert reader.read_line() == b"1\n"
+    assert reader.read_line() == b"2\n"
+    assert fill.calls == 1
+
+
+def test_timeout_keeps_the_partial_reply():
+    fill = Packets(b"CV")
+    reader = LineReader(fill)
+    with pytest.raises(TimeoutError):
+        reader.read_line(timeout=0.05)
+    fill.packets.append(b"\n")
+    assert reader.read_line() == b"CV\n"
+
+
+def test_buffer_grows_for_long_replies():
+    reader = LineReader(Packets(b"x" * 10, b"y" * 10, b"\n"), buffer_size=8)
+    assert reader.read_line() == b"x" * 10 + b"y" * 10 + b"\n"
+
+
+def test_multi_byte_terminator_split_between_packets():
+    reader = LineReader(Packets(b"OK\r", b"\nNEXT\r\n"), terminator=b"\r\n")
+    assert reader.read_line() == b"OK\r\n"
+    assert reader.read_line() == b"NEXT\r\n"
+
+
+def test_clear_drops_buffered_data():
+    reader = LineReader(Packets(b"old\n", b"new\n"))
+    reader.read_line()
+    reader.clear()
+    assert reader.read_line() == b"new\n"
+
+
+def test_read_block_reads_by_length_across_terminators():
+    fill = Packets(b"#15ab\n", b"de\n1.0\n")
+    reader = LineReader(fill)
+    assert reader.read_block() == b"#15ab\nde"
+    assert reader.read_line() == b"1.0\n"
+
+
+def test_read_block_falls_back_to_lines_for_other_replies():
+    reader = LineReader(Packets(b"#0abc\n", b"5.0\n"))
+    assert reader.read_block() == b"#0abc\n"
+    assert reader.read_block() == b"5.0\n"
+
+
+def test_read_block_times_out_on_a_short_block():
+    reader = LineReader(Packets(b"#210abc"))
+    with pytest.raises(TimeoutError):
+        reader.read_block(timeout=0.05)
+
+
+class FakeSerial:
+    """The part of serial.Serial that UsbProtocol reads with, counting timeout changes"""
+
+    def __init__(self, data: bytes = b"") -> None:
+        self.data = bytearray(data)
+        self.writes = []
+        self.timeout_changes = 0
+        self._timeout = 2.0
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value: float) -> None:
+        self.timeout_changes += 1
+        self._timeout = value
+
+    @property
+    def in_waiting(self) -> int:
+        # Bytes arrive one at a time, so every read waits on the timeout
+        return 0
+
+    def readinto(self, view: memoryview) -> int:
+        count = min(len(view), len(self.data))
+        view[:count] = self.data[:count]
+        del self.data[:count]
+        return count
+
+    def read(self, size: int) -> bytes:
+        data = bytes(self.data[:size])
+        del self.data[:size]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self.data.clear()
+
+    def write(self, msg: bytes) -> None:
+        self.writes.append(bytes(msg))
+
+
+def test_usb_read_sets_the_serial_timeout_only_when_it_changes():
+    protocol = UsbProtocol(port="no-such-port", timeout=2.0)
+    protocol.conn = FakeSerial(b"5.000\n1.000\n")
+    assert protocol.read() == b"5.000\n"
+    assert protocol.read() == b"1.000\n"
+    # The remaining time of each read stays within the tolerance of the current timeout
+    assert protocol.conn.timeout_changes <= 2
+    with pytest.raises(TimeoutError):
+        protocol.read(timeout=0.05)
+    assert protocol.conn.timeout <= 0.05
+
+
+def test_usb_late_reply_is_drained_before_the_next_query():
+    protocol = UsbProtocol(port="no-such-port", timeout=0.05)
+    # Part of the reply arrives before the timeout and the rest after it
+    protocol.conn = FakeSerial(b"5.0")
+    protocol.write(b"MEAS:VOLT?\n")
+    with pytest.raises(TimeoutError):
+        protocol.read()
+    protocol.conn.data += b"00\n"
+    protocol.write(b"MEAS:CURR?\n")
+    protocol.conn.data += b"1.000\n"
+    assert protocol.read() == b"1.000\n"
+    assert protocol.conn.writes == [b"MEAS:VOLT?\n", b"MEAS:CURR?\n"]
@@ -0,0 +1,60 @@
+import pytest
+
+from fakes import FakeProtocol
+from metrics import LatencyHistogram, MetricsRegistry, PrometheusFileExporter, prometheus_text
+from power_supply import Commands, PowerSupply
+
+
+def test_histogram_percentiles_are_within_its_precision():
+    histogram = LatencyHistogram()
+    for micros in range(1, 10001):
+        histogram.record(micros / 1e6)
+    assert histogram.count == 10000
+    assert histogram.min == pytest.approx(1e-6)
+    assert histogram.max == pytest.approx(0.01)
+    assert histogram.percentile(0.5) == pytest.approx(0.005, rel=0.04)
+    assert histogram.percentile(0.99) == pytest.approx(0.0099, rel=0.04)
+    assert histogram.percentile(1.0) == pytest.approx(0.01)
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) == 0.0
+    assert histogram.mean == 0.0
+
+
+def test_power_supply_records_every_exchange():
+    registry = MetricsRegistry()
+    observations = []
+    registry.add_hook(observations.append)
+    power_supply = PowerSupply(protocol=FakeProtocol("5.0\n"), metrics=registry)
+    power_supply.make_command(Commands.GET_VOLTS)
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    power_supply.make_command(Commands.GET_VOLTS)
+    summary = registry.summary()
+    assert summary[("MEAS:VOLT?", "FakeProtocol")]["count"] == 2
+    # The second query got no reply
+    assert summary[("MEAS:VOLT?", "FakeProtocol")]["errors"] == 1
+    assert summary[("MEAS:VOLT?", "FakeProtocol")]["bytes_received"] == 4
+    assert summary[("VOLT", "FakeProtocol")]["bytes_sent"] == len(b"VOLT 5\n")
+    assert [observation.command for observation in observations] == ["MEAS:VOLT?", "VOLT", "MEAS:VOLT?"]
+
+
+def test_transport_errors_are_counted_and_raised():
+    registry = MetricsRegistry()
+    power_supply = PowerSupply(protocol=FakeProtocol(write_error=ConnectionResetError()), metrics=registry)
+    with pytest.raises(ConnectionResetError):
+        power_supply.make_commands([Commands.GET_VOLTS, Commands.GET_CURR])
+    assert registry.summary()[("MEAS:VOLT?;MEAS:CURR?", "FakeProtocol")]["errors"] == 1
+
+
+def test_prometheus_text_and_file_export(tmp_path):
+    registry = MetricsRegistry()
+    registry.observe('MEAS:VOLT?', "Usb\"Protocol", 0.002, 11, 6)
+    text = prometheus_text(registry)
+    assert '# TYPE psu_command_latency_seconds summary' in text
+    assert 'psu_command_latency_seconds_count{command="MEAS:VOLT?",transport="Usb\\"Protocol"} 1' in text
+    assert 'psu_command_bytes_sent_total{command="MEAS:VOLT?",transport="Usb\\"Protocol"} 11' in text
+    path = tmp_path / "psu.prom"
+    PrometheusFileExporter(registry, str(path)).export()
+    assert path.read_text() == text
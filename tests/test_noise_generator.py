@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from noise_generator import DISTRIBUTIONS, NoiseGenerator
+
+
+@pytest.mark.parametrize("distribution", DISTRIBUTIONS)
+def test_same_seed_gives_the_same_stream(distribution):
+    first = NoiseGenerator(distribution, seed=7, channels=2, block_size=64)
+    second = NoiseGenerator(distribution, seed=7, channels=2, block_size=64)
+    assert np.array_equal(first.take(200), second.take(200))
+
+
+@pytest.mark.parametrize("distribution", DISTRIBUTIONS)
+def test_next_and_take_hand_out_the_same_stream(distribution):
+    by_row = NoiseGenerator(distribution, seed=3, channels=2, block_size=16)
+    by_block = NoiseGenerator(distribution, seed=3, channels=2, block_size=16)
+    rows = np.array([by_row.next() for _ in range(40)])
+    assert np.array_equal(rows, by_block.take(40))
+
+
+@pytest.mark.parametrize("distribution", ["uniform", "gaussian", "pink"])
+def test_noise_has_the_scale_of_uniform_noise(distribution):
+    block = NoiseGenerator(distribution, seed=1).take(200000)
+    assert block.shape == (200000, 1)
+    # Pink noise wanders slowly, so only its spread is checked closely
+    assert abs(block.mean()) < 0.1
+    assert block.std() == pytest.approx(1 / np.sqrt(12), rel=0.1)
+
+
+def test_uniform_noise_stays_in_range():
+    block = NoiseGenerator("uniform", seed=1).take(10000)
+    assert block.min() >= -0.5 and block.max() < 0.5
+
+
+def test_drift_continues_across_blocks():
+    generator = NoiseGenerator("drift", seed=2, block_size=8)
+    block = generator.take(32)
+    steps = np.diff(block[:, 0])
+    # A random walk has no jump at the block boundaries
+    assert np.abs(steps).max() < 5 / np.sqrt(12)
+
+
+def test_unknown_distribution_is_refused():
+    with pytest.raises(ValueError):
+        NoiseGenerator("brown")
@@ -0,0 +1,208 @@
+import math
+
+import numpy as np
+import pytest
+
+from fakes import FakeProtocol
+from power_supply import (CommandEncoder, Commands, GetCmd, PowerSupply, QueryCache, block_decoder, decode_bool,
+                          decode_error, decode_number, decode_string, split_reply)
+
+
+def test_make_commands_sends_one_compound_message():
+    protocol = FakeProtocol("5.0;1.5;CV\n")
+    results = PowerSupply(protocol=protocol).make_commands(
+        [Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]
+    )
+    assert protocol.writes == [b"MEAS:VOLT?;:MEAS:CURR?;:OUTP:MODE?\n"]
+    assert results == ["5.0", "1.5", "CV"]
+
+
+def test_make_commands_gives_set_commands_empty_results():
+    protocol = FakeProtocol("12.5\n")
+    results = PowerSupply(protocol=protocol).make_commands(
+        [(Commands.SET_VOLTS, "12.5"), (Commands.SET_CHANNEL_STATE, "1"), Commands.GET_VOLTS]
+    )
+    assert protocol.writes == [b"VOLT 12.5;:OUTP 1;:MEAS:VOLT?\n"]
+    assert results == ["", "", "12.5"]
+
+
+def test_common_commands_are_not_rooted():
+    protocol = FakeProtocol("0\n")
+    PowerSupply(protocol=protocol).make_commands([(Commands.SET_VOLTS, 1), Commands.RESET, Commands.GET_VOLTS])
+    assert protocol.writes == [b"VOLT 1;*RST;:MEAS:VOLT?\n"]
+
+
+def test_make_commands_without_queries_does_not_read():
+    protocol = FakeProtocol("unexpected\n")
+    assert PowerSupply(protocol=protocol).make_commands([(Commands.SET_CURR, "2")]) == [""]
+    assert protocol.replies == ["unexpected\n"]
+
+
+def test_make_commands_with_nothing_to_send_writes_nothing():
+    protocol = FakeProtocol()
+    assert PowerSupply(protocol=protocol).make_commands([]) == []
+    assert protocol.writes == []
+
+
+@pytest.mark.parametrize("args, expected", [
+    (("12.5",), b"VOLT 12.5\n"),
+    ((12.5,), b"VOLT 12.5\n"),
+    ((3,), b"VOLT 3\n"),
+    ((True,), b"VOLT 1\n"),
+    ((b"MAX",), b"VOLT MAX\n"),
+    (("", ""), b"VOLT\n"),
+    ((None,), b"VOLT\n"),
+])
+def test_encoder_formats_arguments(args, expected):
+    assert bytes(CommandEncoder().encode(Commands.SET_VOLTS, *args)) == expected
+
+
+def test_encoder_reuses_its_buffer():
+    encoder = CommandEncoder()
+    first = encoder.encode(Commands.GET_VOLTS)
+    assert encoder.encode(Commands.GET_CURR) is first
+
+
+def test_split_reply_trims_every_field():
+    assert [bytes(field) for field in split_reply(b" 5.0 ;1.5;\tCV\r\n")] == [b"5.0", b"1.5", b"CV"]
+
+
+def test_short_compound_reply_fails_every_query():
+    # The instrument leaves out the reply to a failed query, so "5.0;CV"
+    # cannot be matched to the three queries sent
+    protocol = FakeProtocol("5.0;CV\n")
+    power_supply = PowerSupply(protocol=protocol, cache=QueryCache())
+    assert power_supply.make_commands([Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE]) == ["", "", ""]
+    assert power_supply.cache.stats()["entries"] == 0
+
+
+def test_single_query_keeps_its_whole_reply():
+    assert PowerSupply(protocol=FakeProtocol("1;2\n")).make_commands([(Commands.SET_VOLTS, 1), GetCmd("X?")]) == [
+        "", "1;2"
+    ]
+
+
+def test_query_cache_serves_cached_reply_until_invalidated():
+    cache = QueryCache()
+    cache.put(Commands.GET_OCP_STATE, "1\n")
+    assert cache.get(Commands.GET_OCP_STATE) == "1\n"
+    cache.invalidate_for(Commands.SET_OCP_STATE)
+    assert cache.get(Commands.GET_OCP_STATE) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_query_cache_ignores_measurements():
+    cache = QueryCache()
+    cache.put(Commands.GET_VOLTS, "5.0\n")
+    assert cache.get(Commands.GET_VOLTS) is None
+
+
+def test_query_cache_expires_entries(monkeypatch):
+    cache = QueryCache(ttls={Commands.GET_OUT_MODE: 0.5})
+    now = [100.0]
+    monkeypatch.setattr("power_supply.time.monotonic", lambda: now[0])
+    cache.put(Commands.GET_OUT_MODE, "CV")
+    now[0] += 0.4
+    assert cache.get(Commands.GET_OUT_MODE) == "CV"
+    now[0] += 0.2
+    assert cache.get(Commands.GET_OUT_MODE) is None
+
+
+def test_reset_clears_the_whole_cache():
+    cache = QueryCache()
+    cache.put(Commands.GET_OCP_STATE, "1")
+    cache.put(Commands.GET_OUT_MODE, "CV")
+    cache.invalidate_for(Commands.RESET)
+    assert cache.stats()["entries"] == 0
+
+
+def test_power_supply_answers_repeated_query_from_cache():
+    protocol = FakeProtocol("1\n", "0\n")
+    power_supply = PowerSupply(protocol=protocol, cache=QueryCache())
+    assert power_supply.make_command(Commands.GET_OCP_STATE).strip() == "1"
+    assert power_supply.make_command(Commands.GET_OCP_STATE).strip() == "1"
+    assert protocol.writes == [b"CURR:PROT:STAT?\n"]
+    power_supply.make_command(Commands.SET_OCP_STATE, "0")
+    assert power_supply.make_command(Commands.GET_OCP_STATE).strip() == "0"
+    assert len(protocol.writes) == 3
+
+
+def test_make_commands_only_sends_what_the_cache_cannot_answer():
+    protocol = FakeProtocol("1\n", "5.0\n")
+    power_supply = PowerSupply(protocol=protocol, cache=QueryCache())
+    power_supply.make_command(Commands.GET_OCP_STATE)
+    assert power_supply.make_commands([Commands.GET_OCP_STATE, Commands.GET_VOLTS]) == ["1", "5.0"]
+    assert protocol.writes[-1] == b"MEAS:VOLT?\n"
+
+
+def test_query_cache_skips_empty_and_undecodable_replies():
+    cache = QueryCache()
+    cache.put(Commands.GET_OCP_STATE, "")
+    cache.put(Commands.GET_OUT_MODE, "\n")
+    cache.put(Commands.GET_OCP_STATE, "maybe\n")
+    assert cache.stats()["entries"] == 0
+
+
+def test_query_answered_before_a_set_in_the_same_message_is_not_cached():
+    protocol = FakeProtocol("CV;1\n", "CC\n")
+    power_supply = PowerSupply(protocol=protocol, cache=QueryCache())
+    power_supply.make_commands([Commands.GET_OUT_MODE, (Commands.SET_VOLTS, "5"), Commands.GET_OCP_STATE])
+    assert power_supply.make_command(Commands.GET_OUT_MODE).strip() == "CC"
+    assert power_supply.make_command(Commands.GET_OCP_STATE).strip() == "1"
+    assert protocol.writes[-1] == b"OUTP:MODE?\n"
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ("12.5", 12.5),
+    (b"1.25E+01\n", 12.5),
+    ("12.5 V", 12.5),
+    ("100ms", 0.1),
+    ("250 mA", 0.25),
+    ("1.5kW", 1500.0),
+    ("INF", math.inf),
+])
+def test_decode_number(reply, expected):
+    assert decode_number(reply) == pytest.approx(expected)
+
+
+def test_decode_number_maps_scpi_nan_to_nan():
+    assert math.isnan(decode_number("9.91E37"))
+
+
+@pytest.mark.parametrize("reply", ["", "abc", "12.5 furlongs"])
+def test_decode_number_rejects_garbage(reply):
+    with pytest.raises(ValueError):
+        decode_number(reply)
+
+
+def test_decode_bool_string_and_error():
+    assert decode_bool(" ON\n") is True
+    assert decode_bool("0") is False
+    with pytest.raises(ValueError):
+        decode_bool("maybe")
+    assert decode_string('"say ""hi"""') == 'say "hi"'
+    assert decode_error('-221,"Settings conflict"\n') == (-221, "Settings conflict")
+
+
+def test_block_decoder_reads_big_endian_floats():
+    data = np.array([1.5, -2.0], dtype=">f4").tobytes()
+    values = block_decoder()(b"#18" + data + b"\n")
+    assert values.tolist() == [1.5, -2.0]
+    with pytest.raises(ValueError):
+        block_decoder()(b"#19" + data)
+
+
+def test_query_decodes_the_reply():
+    power_supply = PowerSupply(protocol=FakeProtocol("12.5\n", "cc\n", "nonsense\n"))
+    assert power_supply.query(Commands.GET_VOLTS) == 12.5
+    assert power_supply.query(Commands.GET_OUT_MODE) == "CC"
+    with pytest.raises(ValueError):
+        power_supply.query(Commands.GET_OCP_STATE)
+
+
+def test_query_all_gives_none_for_replies_that_do_not_parse():
+    protocol = FakeProtocol("5.0;READ DEBUG;CV\n")
+    values = PowerSupply(protocol=protocol).query_all([Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE])
+    assert values == [5.0, None, "CV"]
+    assert len(protocol.writes) == 1
@@ -0,0 +1,67 @@
+import time
+
+from fakes import FakeProtocol
+from power_supply import Commands, PowerSupply
+from power_supply_group import PowerSupplyGroup
+
+
+def make_group(*protocols, **kwargs) -> PowerSupplyGroup:
+    return PowerSupplyGroup(
+        {f"psu{index}": PowerSupply(protocol=protocol) for index, protocol in enumerate(protocols)}, **kwargs
+    )
+
+
+def test_measure_all_queries_every_supply_at_once():
+    protocols = [FakeProtocol(f"{index}.0;1.0;CV\n", delay=0.2) for index in range(4)]
+    with make_group(*protocols) as group:
+        start = time.monotonic()
+        results = group.measure_all()
+        elapsed = time.monotonic() - start
+    assert elapsed < 0.6
+    assert [results[name].value for name in group.names] == [[f"{index}.0", "1.0", "CV"] for index in range(4)]
+    assert all(protocol.writes == [b"MEAS:VOLT?;:MEAS:CURR?;:OUTP:MODE?\n"] for protocol in protocols)
+
+
+def test_set_all_sends_the_setpoint_to_every_supply():
+    protocols = [FakeProtocol(), FakeProtocol()]
+    with make_group(*protocols) as group:
+        results = group.set_all(Commands.SET_VOLTS, 12.5)
+    assert all(result.ok for result in results.values())
+    assert [protocol.writes for protocol in protocols] == [[b"VOLT 12.5\n"], [b"VOLT 12.5\n"]]
+
+
+def test_failing_supply_does_not_stop_the_others():
+    with make_group(FakeProtocol("1.0;1.0;CV\n"), FakeProtocol(write_error=ConnectionResetError("unplugged"))) as group:
+        results = group.measure_all()
+    assert results["psu0"].ok
+    assert isinstance(results["psu1"].error, ConnectionResetError)
+
+
+def test_supply_missing_the_timeout_is_reported():
+    with make_group(FakeProtocol("1;1;CV\n"), FakeProtocol("1;1;CV\n", delay=0.5)) as group:
+        results = group.measure_all(timeout=0.1)
+    assert results["psu0"].ok
+    assert isinstance(results["psu1"].error, TimeoutError)
+
+
+def test_supply_still_busy_after_a_timeout_is_not_called_again():
+    slow = FakeProtocol("1;1;CV\n", "2;1;CV\n", delay=0.3)
+    with make_group(FakeProtocol("1;1;CV\n", "1;1;CV\n"), slow) as group:
+        group.measure_all(timeout=0.05)
+        results = group.measure_all(timeout=0.05)
+        assert list(results) == ["psu0", "psu1"]
+        assert results["psu0"].ok
+        assert "busy" in str(results["psu1"].error)
+        assert len(slow.writes) == 1
+        time.sleep(0.35)
+        assert group.measure_all(timeout=1.0)["psu1"].value == ["2", "1", "CV"]
+
+
+def test_close_does_not_wait_for_a_stuck_supply_and_closes_every_connection():
+    protocols = [FakeProtocol("1;1;CV\n"), FakeProtocol("1;1;CV\n", delay=1.0)]
+    group = make_group(*protocols)
+    group.measure_all(timeout=0.05)
+    start = time.monotonic()
+    group.close()
+    assert time.monotonic() - start < 0.5
+    assert all(protocol.closed for protocol in protocols)
@@ -0,0 +1,53 @@
+import pytest
+
+from fakes import FakeProtocol
+from power_supply import PowerSupply
+from profile_player import Profile, ProfilePlayer, load_profile
+
+
+def write_profile(tmp_path, text: str) -> str:
+    path = tmp_path / "profile.csv"
+    path.write_text(text)
+    return str(path)
+
+
+def test_load_profile_sorts_and_shifts_times(tmp_path):
+    profile = load_profile(write_profile(tmp_path, "time,voltage\n2,6\n1,5\n"))
+    assert list(profile.times) == [0.0, 1.0]
+    assert list(profile.voltages) == [5.0, 6.0]
+    assert profile.currents is None
+
+
+def test_power_column_becomes_currents():
+    profile = Profile([0, 1], voltages=[10, 20], powers=[50, 100])
+    assert list(profile.currents) == [5.0, 5.0]
+
+
+@pytest.mark.parametrize("text", ["voltage\n5\n", "time\n0\n", ""])
+def test_load_profile_needs_time_and_a_setpoint_column(tmp_path, text):
+    with pytest.raises(ValueError):
+        load_profile(write_profile(tmp_path, text))
+
+
+@pytest.mark.parametrize("text, message", [
+    ("time,voltage\n0,5\n1,\n", "row 3: the voltage cell is empty"),
+    ("time,voltage\n0,5\n1\n", "row 3: the voltage cell is empty"),
+    ("time,voltage\n0,x\n", "row 2: voltage 'x' is not a number"),
+])
+def test_load_profile_reports_bad_rows(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message):
+        load_profile(write_profile(tmp_path, text))
+
+
+def test_load_profile_rejects_setpoints_beyond_the_limits(tmp_path):
+    with pytest.raises(ValueError):
+        load_profile(write_profile(tmp_path, "time,voltage\n0,500\n"))
+
+
+def test_player_sends_every_step_on_time():
+    protocol = FakeProtocol()
+    profile = Profile([0, 0.05, 0.1], voltages=[1, 2, 3], currents=[1, 1, 1])
+    report = ProfilePlayer(PowerSupply(protocol=protocol), profile).play()
+    assert protocol.writes == [b"VOLT 1;:CURR 1\n", b"VOLT 2;:CURR 1\n", b"VOLT 3;:CURR 1\n"]
+    assert report.played == report.steps == 3
+    assert report.max < 0.05
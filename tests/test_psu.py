@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from fakes import InstrumentProtocol
+from power_supply import Commands, PowerSupply
+from psu import ScriptError, ScriptRunner, parse_line, read_chunks
+from scpi_simulator import SimulatedInstrument
+
+
+def run_script(text: str, **kwargs) -> tuple:
+    protocol = InstrumentProtocol(SimulatedInstrument(load_resistance=2.0))
+    output = io.StringIO()
+    runner = ScriptRunner(PowerSupply(protocol=protocol), output, **kwargs)
+    runner.run(read_chunks(io.BytesIO(text.encode())))
+    return protocol.writes, output.getvalue(), runner
+
+
+def test_parse_named_raw_and_wait_lines():
+    assert parse_line("SET_VOLTS 12.5") == [(Commands.SET_VOLTS, "12.5")]
+    assert parse_line("  # comment") == []
+    assert parse_line("WAIT 0.5") == [("WAIT", 0.5)]
+    entries = parse_line("VOLT 5;:MEAS:VOLT?")
+    assert [entry[0].command for entry in entries] == ["VOLT 5", "MEAS:VOLT?"]
+    assert [entry[0].type for entry in entries] == [Commands.SET_VOLTS.type, Commands.GET_VOLTS.type]
+
+
+@pytest.mark.parametrize("line", ["WAIT soon", "GET_VOLTS 1", "SET_VOLTS 1 2 3", "VOLT 5°"])
+def test_parse_rejects_bad_lines(line):
+    with pytest.raises(ScriptError):
+        parse_line(line)
+
+
+def test_script_is_sent_in_compound_messages_and_replies_keep_their_order():
+    writes, output, runner = run_script(
+        "SET_VOLTS 10\nSET_CURR 10\nSET_CHANNEL_STATE 1\nGET_VOLTS\nGET_CURR\nGET_OUT_MODE\n"
+    )
+    assert writes == [b"VOLT 10;:CURR 10;:OUTP 1;:MEAS:VOLT?;:MEAS:CURR?;:OUTP:MODE?\n"]
+    assert output == "10.0000\n5.0000\nCV\n"
+    assert (runner.commands_sent, runner.messages_sent) == (6, 1)
+
+
+def test_raw_queries_are_sent_on_their_own():
+    writes, output, _ = run_script("SET_VOLTS 10\nOUTP:MODE?\nGET_VOLTS\nVOLT 5;:MEAS:VOLT?\n")
+    assert writes == [b"VOLT 10\n", b"OUTP:MODE?\n", b"MEAS:VOLT?;:VOLT 5\n", b"MEAS:VOLT?\n"]
+    assert output == "OFF\n0.0000\n0.0000\n"
+
+
+def test_batches_are_split_at_the_command_limit_and_isolated_commands():
+    writes, _, _ = run_script("SET_VOLTS 1\nSET_VOLTS 2\nSET_VOLTS 3\n*RST\nSET_VOLTS 4\n", max_commands=2)
+    assert writes == [b"VOLT 1;:VOLT 2\n", b"VOLT 3\n", b"*RST\n", b"VOLT 4\n"]
+
+
+def test_wait_flushes_the_batch():
+    writes, _, _ = run_script("SET_VOLTS 1\nWAIT 0\nSET_VOLTS 2\n")
+    assert writes == [b"VOLT 1\n", b"VOLT 2\n"]
+
+
+def test_echo_prefixes_replies_with_their_query():
+    _, output, _ = run_script("GET_OUT_MODE\n", echo=True)
+    assert output == "OUTP:MODE?\tOFF\n"
+
+
+def test_bad_line_reports_its_number_after_sending_what_came_before():
+    protocol = InstrumentProtocol()
+    runner = ScriptRunner(PowerSupply(protocol=protocol), io.StringIO())
+    with pytest.raises(ScriptError, match="line 2"):
+        runner.run([["SET_VOLTS 1", "WAIT never"]])
+    assert protocol.writes == [b"VOLT 1\n"]
+
+
+def test_read_chunks_keeps_a_last_line_without_newline():
+    assert list(read_chunks(io.BytesIO(b"a\nb\nc"))) == [["a", "b"], ["c"]]
@@ -0,0 +1,93 @@
+import socket
+import threading
+
+import pytest
+
+import psu_daemon
+from fakes import FakeProtocol
+from psu_client import DaemonError, DaemonUnavailable, request, send_command
+from psu_daemon import ConnectionPool, PowerSupplyDaemon
+from scpi_simulator import ScpiSimulator
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "psu.sock")
+    daemon = PowerSupplyDaemon(socket_path)
+    thread = threading.Thread(target=daemon.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield socket_path
+    daemon.shutdown()
+    daemon.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def simulator():
+    simulator = ScpiSimulator()
+    port = simulator.start_in_thread()
+    yield simulator, port
+    simulator.stop_thread()
+
+
+def test_ping(daemon):
+    assert request({"command": "PING"}, socket_path=daemon) == {"ok": True, "reply": "PONG"}
+
+
+def test_commands_reuse_one_connection(daemon, simulator):
+    instrument_simulator, port = simulator
+    connection = f"ethernet:127.0.0.1:{port}"
+    assert send_command("SET_VOLTS", [12.5], connection=connection, socket_path=daemon) == ""
+    assert send_command("GET_ID_STRING", connection=connection, socket_path=daemon)
+    assert instrument_simulator.instrument.voltage == 12.5
+    assert instrument_simulator.connections == 1
+
+
+def test_unknown_command_is_an_error(daemon):
+    with pytest.raises(DaemonError, match="unknown command"):
+        send_command("SELF_DESTRUCT", connection="debug", socket_path=daemon)
+
+
+def test_unreachable_instrument_is_an_error(daemon):
+    with pytest.raises(DaemonError):
+        send_command("SET_VOLTS", [1], connection="ethernet:127.0.0.1:1", socket_path=daemon)
+
+
+def test_usb_port_that_does_not_open_is_an_error(daemon, tmp_path):
+    with pytest.raises(DaemonError, match=r"\*IDN\?"):
+        send_command("SET_VOLTS", [1], connection=f"usb:{tmp_path / 'no-such-port'}", socket_path=daemon)
+
+
+def test_query_without_a_reply_is_an_error(daemon, monkeypatch):
+    monkeypatch.setattr(psu_daemon, "create_protocol", lambda connection: FakeProtocol())
+    assert send_command("SET_VOLTS", [1], connection="fake", socket_path=daemon) == ""
+    with pytest.raises(DaemonError, match="no reply to MEAS:VOLT?"):
+        send_command("GET_VOLTS", connection="fake", socket_path=daemon)
+
+
+def test_no_daemon(tmp_path):
+    with pytest.raises(DaemonUnavailable):
+        send_command("SET_VOLTS", [1], socket_path=str(tmp_path / "missing.sock"))
+
+
+def test_live_daemon_socket_is_not_replaced(daemon):
+    with pytest.raises(RuntimeError, match="already listening"):
+        PowerSupplyDaemon(daemon)
+    assert request({"command": "PING"}, socket_path=daemon)["ok"]
+
+
+def test_stale_socket_file_is_replaced(tmp_path):
+    socket_path = str(tmp_path / "psu.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    PowerSupplyDaemon(socket_path).server_close()
+
+
+def test_discarded_connections_are_closed(simulator):
+    instrument_simulator, port = simulator
+    pool = ConnectionPool()
+    power_supply = pool.get(f"ethernet:127.0.0.1:{port}")
+    assert power_supply.protocol.s is not None
+    pool.discard(f"ethernet:127.0.0.1:{port}")
+    assert power_supply.protocol.s is None
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip("tkinter")
+
+from render_scheduler import RenderScheduler
+
+
+class FakeRoot:
+    """Stands in for Tk's after scheduling; run() fires the pending callbacks"""
+
+    def __init__(self) -> None:
+        self.callbacks = {}
+        self._next_id = 0
+
+    def after(self, delay_ms: int, callback) -> str:
+        self._next_id += 1
+        after_id = f"after#{self._next_id}"
+        self.callbacks[after_id] = callback
+        return after_id
+
+    def after_cancel(self, after_id: str) -> None:
+        del self.callbacks[after_id]
+
+    def run(self) -> None:
+        callbacks, self.callbacks = self.callbacks, {}
+        for callback in callbacks.values():
+            callback()
+
+
+class FakeWidget:
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def configure(self, **options) -> None:
+        self.calls.append(options)
+
+
+def test_updates_between_frames_are_applied_once_with_the_last_value():
+    root = FakeRoot()
+    scheduler = RenderScheduler(root)
+    label = FakeWidget()
+    for volts in range(5):
+        scheduler.set_text(label, f"Voltage: {volts} V")
+    assert len(root.callbacks) == 1
+    assert label.calls == []
+    root.run()
+    assert label.calls == [{"text": "Voltage: 4 V"}]
+    assert scheduler.frames == 1
+
+
+def test_values_already_shown_are_skipped():
+    root = FakeRoot()
+    scheduler = RenderScheduler(root)
+    slider = FakeWidget()
+    scheduler.configure(slider, to=80)
+    root.run()
+    scheduler.configure(slider, to=80)
+    root.run()
+    assert slider.calls == [{"to": 80}]
+    assert scheduler.skipped == 1
+
+
+def test_tasks_run_once_per_frame():
+    root = FakeRoot()
+    scheduler = RenderScheduler(root)
+    calls = []
+    task = lambda: calls.append(None)
+    scheduler.add_task(task)
+    scheduler.add_task(task)
+    root.run()
+    assert len(calls) == 1
+
+
+def test_idle_scheduler_schedules_nothing():
+    root = FakeRoot()
+    RenderScheduler(root)
+    assert root.callbacks == {}
+
+
+def test_flush_applies_now_and_cancel_drops_pending():
+    root = FakeRoot()
+    scheduler = RenderScheduler(root)
+    label = FakeWidget()
+    scheduler.set_text(label, "now")
+    scheduler.flush()
+    assert label.calls == [{"text": "now"}]
+    assert root.callbacks == {}
+    scheduler.set_text(label, "never")
+    scheduler.cancel()
+    root.run()
+    assert label.calls == [{"text": "now"}]
@@ -0,0 +1,122 @@
+import socket
+import time
+
+import pytest
+
+from fakes import InstrumentProtocol
+from power_supply import Commands, PowerSupply
+from scpi_simulator import ScpiSimulator, SimulatedInstrument, split_message
+
+
+def run(instrument: SimulatedInstrument, message: str) -> list:
+    return [instrument.execute(header, args) for header, args in split_message(message)]
+
+
+def test_split_message_handles_compound_and_rooted_commands():
+    assert split_message("VOLT 5;:MEAS:VOLT?;*RST;INST CH CH2") == [
+        ("VOLT", ["5"]), ("MEAS:VOLT?", []), ("*RST", []), ("INST", ["CH", "CH2"]),
+    ]
+
+
+def test_output_is_constant_voltage_below_the_current_limit():
+    instrument = SimulatedInstrument(load_resistance=2.0)
+    run(instrument, "VOLT 10;CURR 20;OUTP ON")
+    assert run(instrument, "MEAS:VOLT?;MEAS:CURR?;OUTP:MODE?") == ["10.0000", "5.0000", "CV"]
+
+
+def test_output_is_constant_current_at_the_current_limit():
+    instrument = SimulatedInstrument(load_resistance=2.0)
+    run(instrument, "VOLT 10;CURR 1;OUTP 1")
+    assert run(instrument, "MEAS:VOLT?;MEAS:CURR?;OUTP:MODE?") == ["2.0000", "1.0000", "CC"]
+
+
+def test_output_off_measures_zero():
+    instrument = SimulatedInstrument()
+    run(instrument, "VOLT 10;CURR 1")
+    assert run(instrument, "MEAS:VOLT?;OUTP:MODE?") == ["0.0000", "OFF"]
+
+
+def test_unit_suffixes_are_accepted():
+    instrument = SimulatedInstrument()
+    run(instrument, "VOLT 500mV;CURR 250mA;CURR:PROT:DEL 100ms")
+    assert run(instrument, "VOLT?;CURR?;CURR:PROT:DEL?") == ["0.5000", "0.2500", "0.1"]
+
+
+def test_errors_are_queued_and_flagged_in_the_event_status():
+    instrument = SimulatedInstrument()
+    run(instrument, "VOLT 500;BOGUS")
+    assert run(instrument, "*ESR?;*ESR?") == [str((1 << 4) | (1 << 5)), "0"]
+    assert run(instrument, "SYST:ERR?;SYST:ERR?;SYST:ERR?") == [
+        '-224,"Illegal parameter value"', '-113,"Undefined header"', '0,"No error"',
+    ]
+
+
+def test_reset_restores_the_defaults():
+    instrument = SimulatedInstrument()
+    run(instrument, "VOLT 10;OUTP 1;CURR:PROT:STAT ON;*RST")
+    assert run(instrument, "VOLT?;OUTP?;CURR:PROT:STAT?") == ["0.0000", "0", "0"]
+
+
+def test_power_supply_commands_are_understood():
+    power_supply = PowerSupply(protocol=InstrumentProtocol(SimulatedInstrument(load_resistance=4.0)))
+    assert power_supply.make_commands([
+        (Commands.SET_VOLTS, 8), (Commands.SET_CURR, 10), (Commands.SET_CHANNEL_STATE, "ON"),
+        Commands.GET_VOLTS, Commands.GET_CURR, Commands.GET_OUT_MODE,
+    ]) == ["", "", "", "8.0000", "2.0000", "CV"]
+
+
+@pytest.fixture
+def simulator():
+    simulator = ScpiSimulator(command_latency={"*TST?": 0.2})
+    port = simulator.start_in_thread()
+    yield simulator, port
+    simulator.stop_thread()
+
+
+def test_stop_thread_ends_the_thread_and_is_safe_to_repeat():
+    simulator = ScpiSimulator()
+    simulator.stop_thread()
+    simulator.start_in_thread()
+    thread = simulator._thread
+    simulator.stop_thread()
+    simulator.stop_thread()
+    assert not thread.is_alive()
+
+
+def exchange(port: int, message: bytes) -> bytes:
+    with socket.create_connection(("127.0.0.1", port), timeout=2.0) as client:
+        client.sendall(message)
+        return client.makefile("rb").readline()
+
+
+def test_simulator_answers_a_compound_message_on_one_line(simulator):
+    _, port = simulator
+    assert exchange(port, b"VOLT 5;:CURR 1;:OUTP ON;:MEAS:VOLT?;:OUTP:MODE?\n") == b"1.0000;CC\n"
+
+
+def test_connections_share_one_instrument(simulator):
+    instrument_simulator, port = simulator
+    exchange(port, b"VOLT 12;*OPC?\n")
+    assert exchange(port, b"VOLT?\n") == b"12.0000\n"
+    assert instrument_simulator.instrument.voltage == 12.0
+
+
+def test_command_latency_delays_only_its_header(simulator):
+    _, port = simulator
+    start = time.monotonic()
+    exchange(port, b"*IDN?\n")
+    fast = time.monotonic() - start
+    start = time.monotonic()
+    exchange(port, b"*TST?\n")
+    assert fast < 0.1 <= time.monotonic() - start
+
+
+def test_arguments_take_units_and_named_booleans():
+    instrument = SimulatedInstrument()
+    for header, arg in (("VOLT", "2.5V"), ("CURR:PROT:DEL", "100ms"), ("OUTP", "ON"), ("*ESE", "+3.2E+01")):
+        assert instrument.execute(header, [arg]) is None
+    assert (instrument.voltage, instrument.ocp_delay, instrument.output_on) == (2.5, pytest.approx(0.1), True)
+    assert instrument.execute("*ESE?", []) == "32"
+    for header, arg in (("OUTP", "maybe"), ("VOLT", "NAN"), ("*ESE", "INF")):
+        instrument.execute(header, [arg])
+    assert len(instrument.errors) == 3
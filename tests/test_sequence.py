@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from fakes import InstrumentProtocol
+from power_supply import Commands, PowerSupply
+from profile_player import Profile
+from scpi_simulator import SimulatedInstrument
+from sequence import ListSequence, SequenceController
+
+
+def make_controller() -> tuple:
+    instrument = SimulatedInstrument(load_resistance=2.0)
+    protocol = InstrumentProtocol(instrument)
+    return instrument, protocol, SequenceController(PowerSupply(protocol=protocol))
+
+
+def test_from_profile_merges_repeated_and_replaced_steps():
+    profile = Profile([0, 1, 1, 2, 3], voltages=[5, 9, 6, 6, 7])
+    sequence = ListSequence.from_profile(profile, hold=0.5)
+    assert sequence.voltages == [5.0, 6.0, 7.0]
+    assert sequence.dwells == [1.0, 2.0, 0.5]
+    assert sequence.currents is None
+    assert sequence.duration == 3.5
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"dwells": [1], "voltages": [100]},
+    {"dwells": [0], "voltages": [5]},
+    {"dwells": [1, 1], "voltages": [5, 6, 7]},
+    {"dwells": [1]},
+    {"dwells": [1], "voltages": [5], "count": 0},
+])
+def test_invalid_sequences_are_refused(kwargs):
+    with pytest.raises(ValueError):
+        ListSequence(**kwargs)
+
+
+def test_upload_packs_the_lists_into_few_messages():
+    sequence = ListSequence([0.5], voltages=[float(volts) for volts in range(40)], currents=[2.0] * 40)
+    instrument, protocol, controller = make_controller()
+    messages = controller.upload(sequence, max_bytes=120)
+    assert messages == len(protocol.writes) > 1
+    assert all(len(write) <= 120 or write.count(b";") == 0 for write in protocol.writes)
+    assert instrument.list_voltages == [float(volts) for volts in range(40)]
+    # Equal values are sent once and apply to every point
+    assert instrument.list_currents == [2.0]
+    assert instrument.voltage_mode == "LIST"
+
+
+def test_sequence_runs_on_the_instrument_and_holds_its_last_point():
+    instrument, _, controller = make_controller()
+    power_supply = controller.power_supply
+    power_supply.make_commands([(Commands.SET_CURR, 10), (Commands.SET_CHANNEL_STATE, 1)])
+    controller.play(ListSequence([0.02], voltages=[4.0, 6.0, 8.0]))
+    assert controller.running
+    assert controller.wait(timeout=2.0)
+    assert not controller.running
+    assert power_supply.make_command(Commands.GET_VOLTS).strip() == "8.0000"
+
+
+def test_bus_trigger_waits_for_trigger():
+    instrument, _, controller = make_controller()
+    controller.upload(ListSequence([0.01], voltages=[4.0, 6.0]))
+    controller.start(trigger=True)
+    time.sleep(0.05)
+    assert controller.running
+    assert instrument.list_start is None
+    controller.trigger()
+    assert controller.wait(timeout=2.0)
+    controller.stop()
+    assert instrument.voltage_mode == "FIX"
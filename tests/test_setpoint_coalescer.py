@@ -0,0 +1,78 @@
+from fakes import FakeProtocol
+from power_supply import Commands, PowerSupply
+from setpoint_coalescer import CoalescingPowerSupply
+
+
+def make_coalescer(max_write_rate: float = 20.0) -> tuple:
+    protocol = FakeProtocol()
+    return protocol, CoalescingPowerSupply(PowerSupply(protocol=protocol), max_write_rate=max_write_rate)
+
+
+def test_burst_of_setpoints_is_coalesced_to_the_latest():
+    protocol, power_supply = make_coalescer(max_write_rate=1.0)
+    for volts in ("1", "2", "3"):
+        power_supply.make_command(Commands.SET_VOLTS, volts)
+    assert protocol.writes == [b"VOLT 1\n"]
+    assert power_supply.flush() is not None
+    power_supply.flush(force=True)
+    assert protocol.writes == [b"VOLT 1\n", b"VOLT 3\n"]
+    assert power_supply.coalesced == 1
+    assert power_supply.flush() is None
+
+
+def test_value_already_written_is_suppressed():
+    protocol, power_supply = make_coalescer()
+    power_supply.make_command(Commands.SET_CURR, "2")
+    power_supply.make_command(Commands.SET_CURR, "2")
+    assert protocol.writes == [b"CURR 2\n"]
+    assert power_supply.suppressed == 1
+
+
+def test_returning_to_the_written_value_drops_the_pending_one():
+    protocol, power_supply = make_coalescer(max_write_rate=1.0)
+    power_supply.make_command(Commands.SET_VOLTS, "1")
+    power_supply.make_command(Commands.SET_VOLTS, "2")
+    power_supply.make_command(Commands.SET_VOLTS, "1")
+    power_supply.flush(force=True)
+    assert protocol.writes == [b"VOLT 1\n"]
+
+
+def test_other_set_commands_flush_pending_setpoints_first():
+    protocol, power_supply = make_coalescer(max_write_rate=1.0)
+    power_supply.make_command(Commands.SET_VOLTS, "1")
+    power_supply.make_command(Commands.SET_VOLTS, "2")
+    power_supply.make_command(Commands.SET_CHANNEL_STATE, "1")
+    assert protocol.writes == [b"VOLT 1\n", b"VOLT 2\n", b"OUTP 1\n"]
+
+
+def test_setpoints_are_remembered_per_channel():
+    protocol, power_supply = make_coalescer(max_write_rate=0)
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    power_supply.make_command(Commands.SET_OUT_CHANNEL, "CH2")
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    assert protocol.writes == [b"VOLT 5\n", b"INST CH CH2\n", b"VOLT 5\n"]
+
+
+def test_reset_forgets_written_values():
+    protocol, power_supply = make_coalescer()
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    power_supply.make_command(Commands.RESET)
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    power_supply.flush(force=True)
+    assert protocol.writes == [b"VOLT 5\n", b"*RST\n", b"VOLT 5\n"]
+
+
+def test_setpoints_in_a_compound_message_are_remembered():
+    protocol, power_supply = make_coalescer()
+    power_supply.make_commands([(Commands.SET_VOLTS, "5"), (Commands.SET_CURR, "1")])
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    assert protocol.writes == [b"VOLT 5;:CURR 1\n"]
+
+
+def test_query_all_passes_through_without_flushing():
+    protocol, power_supply = make_coalescer(max_write_rate=1.0)
+    power_supply.make_command(Commands.SET_VOLTS, "1")
+    power_supply.make_command(Commands.SET_VOLTS, "2")
+    protocol.replies.append("1.0;0.5\n")
+    assert power_supply.query_all([Commands.GET_VOLTS, Commands.GET_CURR]) == [1.0, 0.5]
+    assert protocol.writes == [b"VOLT 1\n", b"MEAS:VOLT?;:MEAS:CURR?\n"]
@@ -0,0 +1,80 @@
+import math
+
+import numpy
+import pytest
+
+pytest.importorskip("tkinter")
+
+from strip_chart import HistoryDecimator, _format_duration, _nice_ceiling, _nice_range
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.7, 1.0), (1.0, 1.0), (1.2, 2.0), (3.0, 5.0), (7.5, 10.0), (42.0, 50.0), (0.0, 0.0), (-1.0, 0.0),
+    (math.nan, 0.0), (math.inf, 0.0),
+])
+def test_nice_ceiling(value, expected):
+    assert _nice_ceiling(value) == pytest.approx(expected)
+
+
+def test_nice_range_covers_the_values():
+    assert _nice_range(numpy.array([-3.0, 1.0]), numpy.array([2.0, 42.0])) == (-5.0, 50.0)
+
+
+def test_nice_range_of_nothing_is_the_unit_range():
+    assert _nice_range(numpy.array([]), numpy.array([])) == (0.0, 1.0)
+
+
+def test_nice_range_ignores_non_finite_values():
+    mins = numpy.array([numpy.nan, 0.5, -numpy.inf])
+    maxs = numpy.array([numpy.inf, 7.0, numpy.nan])
+    assert _nice_range(mins, maxs) == (0.0, 10.0)
+    assert _nice_range(numpy.array([numpy.nan]), numpy.array([numpy.nan])) == (0.0, 1.0)
+
+
+def test_decimator_skips_non_finite_samples():
+    history = HistoryDecimator(channels=1, buckets=4)
+    for timestamp, value in enumerate([1.0, math.nan, 3.0, math.inf]):
+        history.append(timestamp, (value,))
+    mins, maxs = history.columns(4)
+    assert history.count == 2
+    assert history.skipped == 2
+    assert numpy.isfinite(mins).all() and numpy.isfinite(maxs).all()
+
+
+def test_decimator_merges_buckets_keeping_the_envelope():
+    history = HistoryDecimator(channels=1, buckets=4)
+    for timestamp in range(10):
+        history.append(timestamp, (float(timestamp),))
+    mins, maxs = history.columns(4)
+    assert history.span == 4
+    assert history.generation == 2
+    assert mins[:, 0].tolist() == [0.0, 4.0, 8.0]
+    assert maxs[:, 0].tolist() == [3.0, 7.0, 9.0]
+    assert history.duration == 9
+
+
+def test_columns_group_buckets_per_pixel():
+    history = HistoryDecimator(channels=2, buckets=8)
+    for timestamp in range(5):
+        history.append(timestamp, (float(timestamp), -float(timestamp)))
+    mins, maxs = history.columns(4)
+    assert mins.shape == (3, 2)
+    assert maxs[:, 0].tolist() == [1.0, 3.0, 4.0]
+    assert mins[:, 1].tolist() == [-1.0, -3.0, -4.0]
+
+
+def test_clear_starts_over():
+    history = HistoryDecimator(channels=1, buckets=4)
+    history.append(0.0, (1.0,))
+    history.clear()
+    assert history.count == 0
+    assert history.columns(4)[0].shape == (0, 1)
+
+
+def test_format_duration():
+    assert [_format_duration(seconds) for seconds in (5, 600, 36000)] == ["5 s", "10 min", "10.0 h"]
+
+
+def test_odd_bucket_counts_are_refused():
+    with pytest.raises(ValueError):
+        HistoryDecimator(buckets=3)
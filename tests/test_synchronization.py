@@ -0,0 +1,69 @@
+import pytest
+
+from fakes import FakeProtocol, InstrumentProtocol
+from power_supply import ESR_EXECUTION_ERROR, ESR_OPERATION_COMPLETE, Commands, PowerSupply
+from scpi_simulator import SimulatedInstrument
+from synchronization import StatusSynchronizer, parse_register
+
+
+def make_synchronizer(*replies) -> tuple:
+    protocol = FakeProtocol(*replies) if replies else InstrumentProtocol(SimulatedInstrument(load_resistance=2.0))
+    return protocol, StatusSynchronizer(PowerSupply(protocol=protocol), poll_interval=0.01)
+
+
+@pytest.mark.parametrize("reply, expected", [
+    (b"1\n", 1), ("+32\n", 32), ("+1.6E+01\n", 16), ("", 0), ("READ DEBUG\n", 0), ("9.91E37\n", 0),
+])
+def test_parse_register(reply, expected):
+    assert parse_register(reply) == expected
+
+
+def test_apply_appends_opc_query_to_the_message():
+    protocol, synchronizer = make_synchronizer()
+    assert synchronizer.apply([(Commands.SET_VOLTS, 10)]) == [""]
+    assert protocol.writes == [b"VOLT 10;*OPC?\n"]
+
+
+def test_apply_raises_when_opc_does_not_answer():
+    _, synchronizer = make_synchronizer("")
+    with pytest.raises(TimeoutError):
+        synchronizer.apply([(Commands.SET_VOLTS, 10)], timeout=0.01)
+
+
+def test_apply_and_measure_holds_the_queries_with_wai():
+    protocol, synchronizer = make_synchronizer()
+    results = synchronizer.apply_and_measure(
+        [(Commands.SET_VOLTS, 10), (Commands.SET_CURR, 10), (Commands.SET_CHANNEL_STATE, 1)],
+        [Commands.GET_VOLTS, Commands.GET_CURR],
+    )
+    assert protocol.writes == [b"VOLT 10;:CURR 10;:OUTP 1;*WAI;:MEAS:VOLT?;:MEAS:CURR?\n"]
+    assert results == ["10.0000", "5.0000"]
+
+
+def test_wait_complete_polled_waits_for_the_opc_event():
+    protocol, synchronizer = make_synchronizer()
+    assert synchronizer.wait_complete_polled(timeout=1.0) & ESR_OPERATION_COMPLETE
+    assert b"*ESE 1\n" in protocol.writes
+
+
+def test_event_enable_is_only_sent_when_it_changes():
+    protocol, synchronizer = make_synchronizer()
+    synchronizer.enable_events(ESR_EXECUTION_ERROR)
+    synchronizer.enable_events(ESR_EXECUTION_ERROR)
+    assert protocol.writes == [b"*ESE 16\n"]
+
+
+def test_wait_for_event_times_out():
+    _, synchronizer = make_synchronizer()
+    with pytest.raises(TimeoutError):
+        synchronizer.wait_for_event(ESR_EXECUTION_ERROR, timeout=0.05)
+
+
+def test_wait_for_value_polls_until_settled():
+    _, synchronizer = make_synchronizer("0.0\n", "4.2\n", "9.99\n")
+    assert synchronizer.wait_for_value(Commands.GET_VOLTS, 10.0, 0.05, timeout=1.0) == 9.99
+
+
+def test_wait_for_value_reads_replies_with_units():
+    _, synchronizer = make_synchronizer("4.2 V\n", "10.01 V\n")
+    assert synchronizer.wait_for_value(Commands.GET_VOLTS, 10.0, 0.05, timeout=1.0) == 10.01
@@ -0,0 +1,82 @@
+import csv
+
+import pytest
+
+from acquisition import Sample
+from telemetry_recorder import (HEADER_SIZE, RECORD_SIZE, TelemetryRecorder, export_csv, iter_records,
+                                open_recording)
+
+SAMPLES = [
+    Sample(1.0, 10.0, 2.0, 20.0, "CV"),
+    Sample(2.0, 9.5, 3.0, 28.5, "CC\n"),
+    Sample(3.0, 0.0, 0.0, 0.0, "???"),
+]
+
+
+def record(path, samples, chunk_size: int = 2) -> None:
+    with TelemetryRecorder(str(path), chunk_size=chunk_size) as recorder:
+        for sample in samples:
+            recorder.append(sample)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "run.psurec"
+    record(path, SAMPLES)
+    assert list(iter_records(str(path), chunk_records=2)) == [
+        (1.0, 10.0, 2.0, 20.0, "CV"),
+        (2.0, 9.5, 3.0, 28.5, "CC"),
+        (3.0, 0.0, 0.0, 0.0, "Unknown"),
+    ]
+
+
+def test_open_recording_maps_the_records(tmp_path):
+    path = tmp_path / "run.psurec"
+    record(path, SAMPLES)
+    view = open_recording(str(path))
+    assert view.shape == (3, 5)
+    assert view[1, 1] == 9.5
+    view.release()
+
+
+def test_reopening_appends(tmp_path):
+    path = tmp_path / "run.psurec"
+    record(path, SAMPLES[:1])
+    record(path, SAMPLES[1:])
+    assert [row[0] for row in iter_records(str(path))] == [1.0, 2.0, 3.0]
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a recording")
+    with pytest.raises(ValueError):
+        TelemetryRecorder(str(path))
+
+
+def test_file_of_the_right_size_with_another_header_is_refused(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(bytes(HEADER_SIZE + RECORD_SIZE))
+    with pytest.raises(ValueError):
+        TelemetryRecorder(str(path))
+
+
+def test_partial_chunk_is_written_after_the_flush_interval(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("telemetry_recorder.time.monotonic", lambda: now[0])
+    path = tmp_path / "run.psurec"
+    recorder = TelemetryRecorder(str(path), chunk_size=100, flush_interval=1.0)
+    recorder.append(SAMPLES[0])
+    assert path.stat().st_size <= HEADER_SIZE
+    now[0] += 1.5
+    recorder.append(SAMPLES[1])
+    assert path.stat().st_size == HEADER_SIZE + 2 * RECORD_SIZE
+    recorder.close()
+
+
+def test_export_csv(tmp_path):
+    path = tmp_path / "run.psurec"
+    record(path, SAMPLES)
+    assert export_csv(str(path), str(tmp_path / "run.csv")) == 3
+    with open(tmp_path / "run.csv", newline="") as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == ["timestamp", "voltage", "current", "power", "mode"]
+    assert rows[2] == ["2.0", "9.5", "3.0", "28.5", "CC"]
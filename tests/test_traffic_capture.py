@@ -0,0 +1,66 @@
+import pytest
+
+from fakes import FakeProtocol
+from power_supply import Commands, PowerSupply, PowerSupplyConnectionError
+from traffic_capture import READ, WRITE, CaptureProtocol, ReplayMismatchError, ReplayProtocol, iter_events
+
+
+def test_capture_replays_the_same_session(tmp_path):
+    path = str(tmp_path / "session.psucap")
+    with CaptureProtocol(FakeProtocol(b"5.0\n", b"1.5\n"), path) as capture:
+        power_supply = PowerSupply(protocol=capture)
+        power_supply.make_command(Commands.SET_VOLTS, "5")
+        assert power_supply.query(Commands.GET_VOLTS) == 5.0
+        assert power_supply.query(Commands.GET_CURR) == 1.5
+
+    with open(path, "rb") as file:
+        kinds = [event[0] for event in iter_events(file.read())]
+    assert kinds == [WRITE, WRITE, READ, WRITE, READ]
+
+    replay = ReplayProtocol(path, realtime=False)
+    power_supply = PowerSupply(protocol=replay)
+    power_supply.make_command(Commands.SET_VOLTS, "5")
+    assert power_supply.query(Commands.GET_VOLTS) == 5.0
+    assert power_supply.query(Commands.GET_CURR) == 1.5
+    assert replay.finished
+
+
+def test_capture_appends_to_an_existing_file(tmp_path):
+    path = str(tmp_path / "session.psucap")
+    for _ in range(2):
+        with CaptureProtocol(FakeProtocol(), path) as capture:
+            PowerSupply(protocol=capture).make_command(Commands.SET_VOLTS, "5")
+    with open(path, "rb") as file:
+        assert len(list(iter_events(file.read()))) == 2
+    (tmp_path / "other.bin").write_bytes(b"short")
+    with pytest.raises(ValueError):
+        CaptureProtocol(FakeProtocol(), str(tmp_path / "other.bin"))
+
+
+def test_replay_rejects_a_different_write(tmp_path):
+    path = str(tmp_path / "session.psucap")
+    with CaptureProtocol(FakeProtocol(), path) as capture:
+        PowerSupply(protocol=capture).make_command(Commands.SET_VOLTS, "5")
+    with pytest.raises(ReplayMismatchError):
+        PowerSupply(protocol=ReplayProtocol(path, realtime=False)).make_command(Commands.SET_VOLTS, "6")
+    replay = ReplayProtocol(path, realtime=False, strict=False)
+    replay.write(b"anything\n")
+    assert replay.read() == b""
+
+
+def test_replay_raises_recorded_errors(tmp_path):
+    path = str(tmp_path / "session.psucap")
+    failing = FakeProtocol(read_error=PowerSupplyConnectionError("lost connection"))
+    with CaptureProtocol(failing, path) as capture:
+        with pytest.raises(PowerSupplyConnectionError):
+            PowerSupply(protocol=capture).make_command(Commands.GET_VOLTS)
+    with pytest.raises(PowerSupplyConnectionError, match="lost connection"):
+        PowerSupply(protocol=ReplayProtocol(path, realtime=False)).make_command(Commands.GET_VOLTS)
+
+
+def test_truncated_capture_replays_its_complete_records(tmp_path):
+    path = tmp_path / "session.psucap"
+    with CaptureProtocol(FakeProtocol(b"5.0\n"), str(path)) as capture:
+        PowerSupply(protocol=capture).make_command(Commands.GET_VOLTS)
+    path.write_bytes(path.read_bytes()[:-2])
+    assert [event[0] for event in iter_events(path.read_bytes())] == [WRITE]
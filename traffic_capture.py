@@ -0,0 +1,228 @@
+"""Records the traffic of a Protocol to a binary log and replays it.
+
+A capture is a 16 byte header followed by one record per call: a 17 byte
+little-endian event header (kind, monotonic start time in ns, duration in
+µs, payload length) and the bytes written or read. Kinds are W (write),
+R (read), B (read_block) and E (the call raised; the payload is the
+error message). Records are only ever appended, so a capture that was cut
+off still replays up to its last complete record.
+
+CaptureProtocol wraps any Protocol and records what passes through it.
+ReplayProtocol serves a capture back to a PowerSupply. It checks that the
+same messages are written, and returns the recorded replies either after
+the time the reads originally blocked for or immediately. Captured
+sessions then become deterministic regression tests, and host-side code
+can be profiled without the instrument's latency mixed in.
+
+Run `python3 traffic_capture.py dump session.psucap` to list a capture.
+"""
+import argparse
+import struct
+import threading
+import time
+
+from power_supply import Protocol, PowerSupplyConnectionError
+
+MAGIC = b"PSUCAP01"
+HEADER = struct.Struct("<8sII")
+HEADER_SIZE = HEADER.size
+EVENT = struct.Struct("<cQII")
+VERSION = 1
+
+WRITE = b"W"
+READ = b"R"
+READ_BLOCK = b"B"
+ERROR = b"E"
+
+_MAX_DURATION_US = 0xFFFFFFFF
+
+
+class ReplayMismatchError(AssertionError):
+    """Raised when the code under replay does not send what was captured"""
+
+
+class CaptureProtocol(Protocol):
+    """Passes every call through to protocol and appends it to the capture at path.
+
+    Attributes other than write, read and read_block are looked up on the
+    wrapped protocol.
+    """
+
+    def __init__(self, protocol: Protocol, path: str) -> None:
+        self.protocol = protocol
+        self.path = path
+        self.events = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab", buffering=65536)
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, 0))
+        elif self._file.tell() < HEADER_SIZE:
+            self._file.close()
+            raise ValueError(f"{path} is not a traffic capture")
+
+    def write(self, msg: bytes = b"") -> None:
+        start = time.monotonic_ns()
+        try:
+            self.protocol.write(msg)
+        except Exception as error:
+            self._append(ERROR, start, str(error).encode(errors="replace"))
+            raise
+        self._append(WRITE, start, msg)
+
+    def read(self, timeout: float = None) -> bytes:
+        return self._record_read(READ, self.protocol.read, timeout)
+
+    def read_block(self, timeout: float = None) -> bytes:
+        return self._record_read(READ_BLOCK, self.protocol.read_block, timeout)
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+        close = getattr(self.protocol, "close", None)
+        if close is not None:
+            close()
+
+    def __getattr__(self, name: str):
+        if name == "protocol":
+            raise AttributeError(name)
+        return getattr(self.protocol, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _record_read(self, kind: bytes, read, timeout: float) -> bytes:
+        start = time.monotonic_ns()
+        try:
+            reply = read(timeout)
+        except Exception as error:
+            self._append(ERROR, start, str(error).encode(errors="replace"))
+            raise
+        self._append(kind, start, reply)
+        return reply
+
+    def _append(self, kind: bytes, start: int, payload) -> None:
+        duration = min((time.monotonic_ns() - start) // 1000, _MAX_DURATION_US)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(EVENT.pack(kind, start, duration, len(payload)))
+            self._file.write(payload)
+            self.events += 1
+
+
+def iter_events(data):
+    """Yields (kind, start_ns, duration_s, payload) for every complete record of a capture's bytes"""
+    view = memoryview(data)
+    if len(view) < HEADER_SIZE:
+        return
+    magic, version, _ = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a traffic capture")
+    offset = HEADER_SIZE
+    while offset + EVENT.size <= len(view):
+        kind, start, duration, length = EVENT.unpack_from(view, offset)
+        offset += EVENT.size
+        if offset + length > len(view):
+            return
+        yield kind, start, duration / 1e6, bytes(view[offset:offset + length])
+        offset += length
+
+
+class ReplayProtocol(Protocol):
+    """Serves a capture back in order instead of talking to an instrument.
+
+    With realtime set, each call returns after the time it took when
+    captured, so the instrument's latency is reproduced while the host's
+    own time between calls is not. Otherwise replies come back
+    immediately. With strict set, writing anything other than the next
+    captured write, or calling past the end of the capture, raises
+    ReplayMismatchError.
+    """
+
+    events: list
+
+    def __init__(self, path: str, realtime: bool = True, strict: bool = True) -> None:
+        with open(path, "rb") as file:
+            self.events = list(iter_events(file.read()))
+        self.path = path
+        self.realtime = realtime
+        self.strict = strict
+        self.position = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.events)
+
+    def rewind(self) -> None:
+        self.position = 0
+
+    def write(self, msg: bytes = b"") -> None:
+        payload = self._next(WRITE)
+        if self.strict and payload != bytes(msg):
+            raise ReplayMismatchError(
+                f"event {self.position - 1}: wrote {bytes(msg)!r}, captured {payload!r}"
+            )
+
+    def read(self, timeout: float = None) -> bytes:
+        return self._next(READ)
+
+    def read_block(self, timeout: float = None) -> bytes:
+        return self._next(READ_BLOCK)
+
+    def _next(self, kind: bytes) -> bytes:
+        if self.finished:
+            if self.strict:
+                raise ReplayMismatchError(f"{kind.decode()} after the end of the capture")
+            return b""
+        recorded_kind, _, duration, payload = self.events[self.position]
+        self.position += 1
+        if self.realtime and duration > 0:
+            time.sleep(duration)
+        if recorded_kind == ERROR:
+            raise PowerSupplyConnectionError(payload.decode(errors="replace"))
+        if recorded_kind != kind and self.strict:
+            raise ReplayMismatchError(
+                f"event {self.position - 1}: called {kind.decode()}, captured {recorded_kind.decode()}"
+            )
+        return payload
+
+
+def example_capture_and_replay(path: str = "example.psucap"):
+    """Captures a query against the debug protocol and replays it as fast as possible"""
+    from power_supply import Commands, DebugProtocol, PowerSupply
+
+    with CaptureProtocol(DebugProtocol(), path) as capture:
+        PowerSupply(protocol=capture).make_command(Commands.GET_VOLTS)
+    replay = ReplayProtocol(path, realtime=False)
+    print(PowerSupply(protocol=replay).make_command(Commands.GET_VOLTS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traffic capture tools")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    dump_parser = subparsers.add_parser("dump", help="list the events of a capture")
+    dump_parser.add_argument("capture")
+    args = parser.parse_args()
+
+    if args.action == "dump":
+        with open(args.capture, "rb") as file:
+            events = list(iter_events(file.read()))
+        first = events[0][1] if events else 0
+        blocked = 0.0
+        for kind, start, duration, payload in events:
+            if kind in (READ, READ_BLOCK):
+                blocked += duration
+            print(f"{(start - first) / 1e6:12.3f} ms {kind.decode()} {duration * 1e3:9.3f} ms {payload!r}")
+        print(f"{len(events)} events, {blocked:.3f} s blocked in reads")
+
+
+if __name__ == "__main__":
+    main()